@@ -4,6 +4,8 @@ updating its knowledge graph and reasoning over it to complete a transaction.
 This version is corrected for logical errors and architectural soundness.
 """
 import os
+import asyncio
+import atexit
 import json
 import uuid
 import requests
@@ -22,7 +24,7 @@ import numpy as np
 
 # --- Placeholder Imports for Custom Modules ---
 from payment_gateway import pay_inr
-from payment_sender import send_native
+from payment_sender import CHAIN_CONFIG, TRANSFER_GAS_LIMIT, send_native
 
 # --- uAgents Imports ---
 from uagents import Agent, Context, Protocol, Bureau
@@ -39,16 +41,67 @@ from uagents_core.contrib.protocols.chat import (
 
 # --- Knowledge Graph & RAG Imports ---
 from hyperon import MeTTa
-from knowledge import initialize_financial_knowledge_graph
+from arbitrage import ArbitrageDetector
+from chain_costs import ChainCostModel
+from knowledge import FIAT_CURRENCIES, apply_hot_corridors, apply_liquidity_curves, initialize_financial_knowledge_graph
 from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from kg_executor import KnowledgeGraphExecutor
+from rate_feed import MOCK_RATES, RateFeedIngestor, build_feed
+from transfer_plan import TransferExecutor, TransferPools, parse_transfer_request
 
 # --- Initialization ---
 import dotenv
 dotenv.load_dotenv()
 
-metta = MeTTa()
-initialize_financial_knowledge_graph(metta)
-financial_rag = FinancialRAG(metta)
+# KG_BACKEND=native keeps rates and paths in plain dicts instead of a MeTTa space
+KG_BACKEND = os.getenv("KG_BACKEND", "metta")
+metta = MeTTa() if KG_BACKEND == "metta" else None
+# Rate facts expire after RATE_TTL_SECONDS; compaction caps the graph at KG_MAX_RATES rate facts
+RATE_TTL_SECONDS = float(os.getenv("RATE_TTL_SECONDS", "300"))
+KG_MAX_RATES = int(os.getenv("KG_MAX_RATES", "10000"))
+KG_COMPACTION_INTERVAL = float(os.getenv("KG_COMPACTION_INTERVAL", "30"))
+financial_rag = FinancialRAG(metta, rate_ttl=RATE_TTL_SECONDS, max_rates=KG_MAX_RATES,
+                             backend=NativeBackend() if KG_BACKEND == "native" else None,
+                             fiat_currencies=FIAT_CURRENCIES)
+# Warm start from the last on-disk snapshot; only build the graph from scratch without one
+KG_SNAPSHOT_PATH = os.getenv("KG_SNAPSHOT_PATH", "kg_snapshot.bin")
+KG_SNAPSHOT_INTERVAL = float(os.getenv("KG_SNAPSHOT_INTERVAL", "60"))
+if not financial_rag.load_snapshot(KG_SNAPSHOT_PATH):
+    initialize_financial_knowledge_graph(financial_rag)
+apply_liquidity_curves(financial_rag)
+apply_hot_corridors(financial_rag)
+atexit.register(financial_rag.save_snapshot, KG_SNAPSHOT_PATH)
+# Async handlers reach the knowledge graph through one dedicated worker thread
+kg_executor = KnowledgeGraphExecutor(financial_rag)
+# Tools that mostly work on the knowledge graph; the rest (payments, agent
+# discovery) block on network I/O and run on the default thread pool instead.
+KG_TOOLS = {"fetch_and_update_realtime_rates", "find_best_conversion_path"}
+# Rates stream in continuously from RATE_FEED (static, http, websocket or replay;
+# RATE_FEED_URL is the endpoint or recording). Comma-separated lists name several
+# feeds, which are queried concurrently and aggregated while the agent runs.
+RATE_FEED = os.getenv("RATE_FEED", "static")
+RATE_FEED_URL = os.getenv("RATE_FEED_URL")
+RATE_FEED_INTERVAL = float(os.getenv("RATE_FEED_INTERVAL", "5"))
+RATE_FEED_TIMEOUT = float(os.getenv("RATE_FEED_TIMEOUT", "2"))
+# Quotes use rates up to RATE_MAX_AGE seconds old, serve them for RATE_STALE_GRACE
+# more while one shared refresh runs, and wait for it beyond that
+RATE_MAX_AGE = float(os.getenv("RATE_MAX_AGE", "10"))
+RATE_STALE_GRACE = float(os.getenv("RATE_STALE_GRACE", "30"))
+rate_feed = RateFeedIngestor(financial_rag, [build_feed(RATE_FEED, RATE_FEED_URL, RATE_FEED_INTERVAL, RATE_FEED_TIMEOUT)],
+                             apply=kg_executor.run, max_age=RATE_MAX_AGE, stale_grace=RATE_STALE_GRACE)
+# Rate batches are checked for arbitrage cycles in the background; a cycle gaining more
+# than ARBITRAGE_TOLERANCE_BPS per hop gets its suspect edge quarantined from routing
+ARBITRAGE_TOLERANCE_BPS = float(os.getenv("ARBITRAGE_TOLERANCE_BPS", "1"))
+arbitrage_detector = ArbitrageDetector(financial_rag, tolerance_bps=ARBITRAGE_TOLERANCE_BPS)
+# Path costs follow each chain's gas price (polled once a block) and settlement time:
+# cost = gas fee / PATH_COST_REFERENCE_AMOUNT (in the source currency) + SETTLEMENT_TIME_VALUE
+# (cost of waiting, as a fraction of the amount per hour) * hours to settle
+PATH_COST_REFERENCE_AMOUNT = float(os.getenv("PATH_COST_REFERENCE_AMOUNT", "10000"))
+SETTLEMENT_TIME_VALUE = float(os.getenv("SETTLEMENT_TIME_VALUE", "0.001"))
+chain_costs = ChainCostModel(financial_rag, CHAIN_CONFIG, gas_per_transfer=TRANSFER_GAS_LIMIT,
+                             time_value_per_hour=SETTLEMENT_TIME_VALUE, reference_amount=PATH_COST_REFERENCE_AMOUNT,
+                             apply=kg_executor.run)
 
 # --- API and Pool Configuration ---
 API_KEY = os.getenv("ASI_ONE_API_KEY")
@@ -74,29 +127,18 @@ def multiply(a: float, b: float) -> float:
 
 def fetch_and_update_realtime_rates() -> str:
     """
-    Fetches the latest currency conversion rates from a simulated external API
-    and updates the agent's knowledge graph with this new information.
+    Returns the latest currency conversion rates. The background rate feed
+    keeps the agent's knowledge graph current, so this only reads it.
     """
-    print("\n[TOOL LOG] Fetching real-time rates from external API...")
-    eth_inr=0.001
-    eth_usd=0.2
-    inr_matic=0.0000001
-    usd_matic=90
-    
-    mock_api_response = {
-        "INR-ETH": 1 / eth_inr, 
-        "ETH-INR":eth_inr,
-        "ETH-USD": 0.1/eth_usd,
-        "USD-ETH": eth_usd,
-        "INR-MATIC": inr_matic, 
-        "MATIC-INR": 1/inr_matic,
-        "USD-MATIC": usd_matic,
-        "MATIC-USD": 0.1/usd_matic,
-    }
-    for pair, rate in mock_api_response.items():
-        from_curr, to_curr = pair.split('-')
-        financial_rag.update_rate(from_curr, to_curr, rate)
-    return json.dumps({"status": "success", "message": "Knowledge graph updated with latest market rates."})
+    print("\n[TOOL LOG] Reading latest rates from the rate feed...")
+    # The interactive console runs no event loop, so no feed; use the simulated market there
+    if not rate_feed.running:
+        financial_rag.update_rates(MOCK_RATES)
+    # Pin the latest rates so every leg of this session is quoted on them
+    snapshot = financial_rag.pin()
+    rate_age_ms = round((time.time() - snapshot.created_at) * 1000, 1)
+    return json.dumps({"status": "success", "message": "Knowledge graph holds the latest market rates.",
+                       "rate_version": snapshot.version, "rate_age_ms": rate_age_ms})
 
 
 def discover_expert_agent(task_description: str) -> str:
@@ -269,8 +311,12 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
     """
     print(f"\n[TOOL LOG] Executing step: {amount:.4f} {from_currency} from '{from_address}' to '{to_address}'...")
     
-    rate = financial_rag.get_exchange_rate(from_currency.upper(), to_currency.upper())
+    snapshot = financial_rag.snapshot()
+    quote = snapshot.lookup(from_currency.upper(), to_currency.upper())
+    rate = quote.get("rate") if quote["status"] == "fresh" else None
     if rate is None and from_currency.upper() != to_currency.upper():
+         if quote["status"] == "stale":
+             return json.dumps({"status": "error", "message": f"The rate for {from_currency}->{to_currency} is stale. Call fetch_and_update_realtime_rates to refresh it."})
          return json.dumps({"status": "error", "message": f"No rate found for {from_currency}->{to_currency} in knowledge graph."})
     
     output_amount = amount * rate if rate else amount
@@ -287,19 +333,29 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
             if payment_status.get("status") == "success":
                 return json.dumps({
                     "status": "success", "message": "User INR payment successful.",
-                    "amount_in": amount, "amount_out": output_amount, "details": payment_status
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version, "details": payment_status
                 })
         
         # Case 2: System moves crypto from Indian pool to US pool
         elif from_currency.upper() == to_currency.upper() and from_address == INDIAN_CRYPTO_POOL:
             print("send native callled")
 
-            tx_hash = send_native(from_currency, to_address, amount)
+            try:
+                tx_hash = send_native(from_currency, to_address, amount,
+                                      gas_price_gwei=chain_costs.gas_price(from_currency.upper()))
+            except Exception as e:
+                # The chain is unusable: hand back the precomputed routes around it instead of replanning
+                print(f"[TOOL LOG] Transfer on {from_currency} failed: {e}")
+                return json.dumps({
+                    "status": "error", "message": f"Transfer on {from_currency} failed: {e}",
+                    "failover": financial_rag.failover_avoiding(from_currency.upper())
+                })
+            chain_costs.track(from_currency.upper(), tx_hash)
             print(f"[ACTION] Simulating transfer of {amount:.6f} {from_currency} from {INDIAN_CRYPTO_POOL} to {USA_CRYPTO_POOL}. TxHash: {tx_hash}")
             if tx_hash:
                  return json.dumps({
                     "status": "success", "message": f"Cross-border transfer successful. Hash: {tx_hash}",
-                    "amount_in": amount, "amount_out": output_amount
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version
                 })
         
         # Case 3: System "sells" crypto from US pool and pays out USD to merchant
@@ -315,11 +371,11 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
             if payment_status.get("status") == "success":
                 return json.dumps({
                     "status": "success", "message": "User USD payout successful.",
-                    "amount_in": amount, "amount_out": output_amount, "details": payment_status
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version, "details": payment_status
                 })
             return json.dumps({
                 "status": "success", "message": "Final USD payout to merchant successful.",
-                "amount_in": amount, "amount_out": output_amount
+                "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version
             })
             
 
@@ -338,6 +394,60 @@ tools_schema = [
     {"type": "function", "function": {"name": "discover_expert_agent", "description": "Finds and queries an expert agent for complex, non-financial tasks like market analysis or predictions.", "parameters": {"type": "object", "properties": {"task_description": {"type": "string", "description": "A clear and concise description of the task for the expert agent."}}, "required": ["task_description"]}}},
 ]
 
+async def run_tool(name: str, tool, **args) -> str:
+    # Keep tool work off the event loop so other agents stay responsive
+    if name in KG_TOOLS:
+        return await kg_executor.run(tool, **args)
+    return await asyncio.to_thread(tool, **args)
+
+# Well-formed transfer requests run the fixed plan directly instead of through the model
+transfer_executor = TransferExecutor(
+    financial_rag,
+    {"fetch_and_update_realtime_rates": fetch_and_update_realtime_rates,
+     "find_best_conversion_path": find_best_conversion_path, "convert_and_transfer": convert_and_transfer},
+    TransferPools(INDIAN_BANK_POOL, INDIAN_CRYPTO_POOL, USA_CRYPTO_POOL, USA_BANK_POOL),
+    run=run_tool,
+)
+
+# Tools offered to the model by the chat protocol handler
+chat_tools = {
+    "fetch_and_update_realtime_rates": fetch_and_update_realtime_rates,
+    "find_best_conversion_path": find_best_conversion_path,
+    "convert_and_transfer": convert_and_transfer,
+    "multiply": multiply,
+    "discover_expert_agent": discover_expert_agent,
+}
+
+async def process_request(messages: list[dict], session_id: str) -> list[dict] | None:
+    """
+    Runs one turn of the agentic loop for the chat handler, with the model
+    call and every tool off the event loop. Returns the extended messages,
+    or None if the turn failed.
+    """
+    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json", "X-Session-Id": session_id}
+    try:
+        payload = {"model": MODEL, "messages": messages, "tools": tools_schema}
+        response = await asyncio.to_thread(requests.post, f"{BASE_URL}/chat/completions", headers=headers,
+                                           json=payload, timeout=90)
+        response.raise_for_status()
+        response_message = response.json()["choices"][0]["message"]
+        messages.append(response_message)
+        tool_outputs = []
+        for call in response_message.get("tool_calls") or []:
+            func_name = call["function"]["name"]
+            args = json.loads(call["function"].get("arguments", "{}"))
+            tool = chat_tools.get(func_name)
+            if tool is None:
+                result = json.dumps({"status": "error", "message": f"Unknown tool: {func_name}"})
+            else:
+                result = await run_tool(func_name, tool, **args)
+            tool_outputs.append({"tool_call_id": call["id"], "role": "tool", "name": func_name, "content": str(result)})
+        messages.extend(tool_outputs)
+        return messages
+    except Exception as e:
+        print(f"[ERROR] An error occurred: {e}")
+        return None
+
 # --- Stateful Conversation Class ---
 class StatefulAgentConversation:
     """Manages the state and interaction loop for an agent conversation."""
@@ -395,6 +505,17 @@ class StatefulAgentConversation:
         """Sends a user prompt to the agent and processes the conversation."""
         print(f"\nUser: {user_prompt}")
         self.messages.append({"role": "user", "content": user_prompt})
+        # Each request starts unpinned; fetch_and_update_realtime_rates pins the rate version it quotes on
+        financial_rag.unpin()
+
+        # A plain transfer needs no model round trips; the model only gets what the parser can't place
+        if (transfer := parse_transfer_request(user_prompt)) is not None:
+            result = asyncio.run(transfer_executor.execute(transfer))
+            if result is not None:
+                self.messages.append({"role": "assistant", "content": result["summary"]})
+                print("\n--- Final Response ---")
+                print(f"Assistant: {result['summary']}")
+                return
         
         max_turns = 10
         for turn in range(max_turns):
@@ -420,6 +541,17 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     ctx.logger.info(f"Received transaction request from {sender}: '{user_query}'")
 
     session_id = str(uuid.uuid4())
+    financial_rag.unpin()
+    # Settle rate freshness (one shared refresh) before any tool reads the rates
+    await rate_feed.ensure_fresh()
+
+    # A plain transfer needs no model round trips; the model only gets what the parser can't place
+    if (transfer := parse_transfer_request(user_query)) is not None:
+        result = await transfer_executor.execute(transfer)
+        if result is not None:
+            ctx.logger.info(f"--- Compiled transfer ---\n{result['summary']}")
+            await ctx.send(sender, ChatMessage(timestamp=datetime.utcnow(), msg_id=uuid.uuid4(), content=[TextContent(text=result["summary"]), EndSessionContent()]))
+            return
     messages = [
         {"role": "system", "content": f"You are an intelligent financial agent and don't ask confirmations. Your goal is to execute a currency conversion from INR to USD. You MUST follow this plan: 1. `fetch_and_update_realtime_rates`. 2. `find_best_conversion_path`. 3. Reason about the required amounts and create a 3-step execution plan using `convert_and_transfer` for each leg: a) User INR payment to the Indian pool address '{INDIAN_BANK_POOL}'. b) A crypto transfer from the Indian pool '{INDIAN_CRYPTO_POOL}' to the US pool '{USA_CRYPTO_POOL}' by calling the tool convert_and_transfer. c) A final USD payout from the US pool '{USA_CRYPTO_POOL}' to the merchant. Execute this plan until the final payment is made, then give a summary. And also if there is any error after transaction from User, just return his money back by transfering equivalent money to User account from {INDIAN_BANK_POOL}"},
         {"role": "user", "content": user_query}
@@ -428,7 +560,7 @@ async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     max_turns = 6 # Increased max turns for multi-step execution
     for turn in range(max_turns):
         ctx.logger.info(f"--- Agent Turn {turn + 1} ---")
-        messages = process_request(messages, session_id)
+        messages = await process_request(messages, session_id)
 
         # Add a check to ensure messages is not None before proceeding
         if messages is None:
@@ -453,6 +585,30 @@ async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
     
 agent.include(chat_proto, publish_manifest=True)
 
+@agent.on_event("startup")
+async def start_rate_feed(ctx: Context):
+    """Starts streaming rates into the knowledge graph."""
+    arbitrage_detector.start()
+    rate_feed.start()
+    chain_costs.start()
+
+@agent.on_event("shutdown")
+async def stop_rate_feed(ctx: Context):
+    await rate_feed.stop()
+    await chain_costs.stop()
+    arbitrage_detector.stop()
+    kg_executor.shutdown()
+
+@agent.on_interval(period=KG_SNAPSHOT_INTERVAL)
+async def persist_knowledge_graph(ctx: Context):
+    """Periodically snapshots the knowledge graph so a restart can warm-start from it."""
+    await kg_executor.run(financial_rag.save_snapshot, KG_SNAPSHOT_PATH)
+
+@agent.on_interval(period=KG_COMPACTION_INTERVAL)
+async def compact_knowledge_graph(ctx: Context):
+    """Evicts expired and over-capacity rate facts from the knowledge graph."""
+    await kg_executor.run(financial_rag.compact)
+
 if __name__ == "__main__":
     # run_standalone_conversation()
     print("--- Starting Interactive Agent Conversation ---")
@@ -0,0 +1,225 @@
+"""
+Arbitrage detection over the rate graph.
+
+A cycle of conversions that returns more than it started with is a negative
+cycle under -log(rate) weights. In a live feed that is almost always a bad
+quote rather than free money, and a router that trusts it will happily send
+payments round it, so ArbitrageDetector finds such cycles after every rate
+batch, reports them with their profit margin and quarantines the edge most
+likely to be wrong (the one that moved last) from routing until a fresh
+quote for it no longer closes a cycle.
+
+Detection is Bellman-Ford from a virtual source joined to every currency,
+vectorized over the edge arrays. The potentials it converges to are kept
+between batches: they stay a valid starting point whatever changed, and
+when only a few edges moved the next run settles in a handful of rounds.
+Batches in which no rate rose cannot create a cycle and are skipped.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from rate_events import RateChange
+
+
+def _pred_cycle(pred: np.ndarray, src: np.ndarray, weights: np.ndarray, starts) -> list[int] | None:
+    """A negative cycle among the predecessor edges reachable back from `starts`, if there is one."""
+    done: set[int] = set()
+    for node in starts:
+        path: dict[int, int] = {}
+        while node not in done and node not in path and pred[node] >= 0:
+            path[node] = int(pred[node])
+            node = int(src[pred[node]])
+        done.update(path)
+        if node not in path:
+            continue
+        cycle, current = [], node
+        while True:
+            cycle.append(path[current])
+            current = int(src[path[current]])
+            if current == node:
+                break
+        if weights[cycle].sum() < 0:
+            return cycle[::-1]
+    return None
+
+
+def negative_cycle(potential: np.ndarray, src: np.ndarray, dst: np.ndarray, weights: np.ndarray) -> list[int] | None:
+    """
+    Relaxes `potential` (one entry per node, updated in place) over the
+    edges src[k] -> dst[k] until it settles. Returns the edge indices of a
+    negative cycle, in order, or None if there is none.
+    """
+    n = len(potential)
+    pred = np.full(n, -1, dtype=np.int64)
+    for rounds in range(1, 4 * n + 2):
+        candidates = potential[src] + weights
+        relaxed = potential.copy()
+        np.minimum.at(relaxed, dst, candidates)
+        improved = relaxed < potential - 1e-12
+        if not improved.any():
+            return None
+        tight = improved[dst] & (candidates <= relaxed[dst])
+        pred[dst[tight]] = np.nonzero(tight)[0]
+        potential[:] = relaxed
+        # Still improving after n rounds means a cycle; it shows up in the predecessor edges
+        if rounds > n:
+            cycle = _pred_cycle(pred, src, weights, np.nonzero(improved)[0].tolist())
+            if cycle is not None:
+                return cycle
+    return None
+
+
+class ArbitrageDetector:
+    """
+    Watches a FinancialRAG's rates from a background thread, so the rate
+    writer only hands over each batch and quotes are never held up. A cycle
+    is reported when it gains more than `tolerance_bps` per hop, which keeps
+    rounding in consistent cross rates quiet. At most `max_cycles` cycles are
+    broken per batch.
+    """
+    def __init__(self, rag, tolerance_bps: float = 1.0, max_cycles: int = 16, history: int = 100):
+        self.rag = rag
+        self.tolerance_bps = tolerance_bps
+        self.max_cycles = max_cycles
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._changed: dict[tuple[str, str], RateChange] = {}
+        self._full_scan = True
+        self._running = False
+        self._thread: threading.Thread | None = None
+        self._subscription = None
+        self._index: dict[str, int] = {}
+        self._potential = np.zeros(0)
+        self.quarantined: dict[tuple[str, str], dict] = {}
+        self.cycles: deque[dict] = deque(maxlen=history)
+        self.scans = 0
+        self.scans_skipped = 0
+        self.last_scan_ms: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._full_scan = True
+        self._subscription = self.rag.subscribe_rates(self._on_changes)
+        self._thread = threading.Thread(target=self._run, name="arbitrage-detector", daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._subscription.unsubscribe()
+        self._wake.set()
+        self._thread.join()
+
+    def _on_changes(self, changes: list[RateChange]):
+        """RateEventBus callback: runs on the rate writer, so it only queues the batch."""
+        with self._lock:
+            for change in changes:
+                self._changed[change.pair] = change
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._running:
+                return
+            with self._lock:
+                changed, self._changed = self._changed, {}
+                full, self._full_scan = self._full_scan, False
+            try:
+                self.scan(changed, full)
+            except Exception as e:
+                print(f"[KG LOG] Arbitrage scan failed: {e}")
+
+    def scan(self, changed: dict[tuple[str, str], RateChange], full: bool = False) -> list[dict]:
+        """
+        Checks the latest rates for cycles after `changed` moved, quarantining
+        a suspect edge per cycle found. Returns the cycles found.
+        """
+        for pair, change in changed.items():
+            if change.new_rate is None and self.quarantined.pop(pair, None) is not None:
+                self.rag.router.release(pair)
+        retest = {pair for pair in changed if pair in self.quarantined}
+        if not full and not retest and not any(
+                change.new_rate is not None and (change.old_rate is None or change.new_rate > change.old_rate)
+                for change in changed.values()):
+            self.scans_skipped += 1
+            return []
+        started = time.perf_counter()
+        snapshot = self.rag.latest_snapshot()
+        pairs = [pair for pair, rate in snapshot.rates.items()
+                 if rate > 0 and pair[0] != pair[1] and (pair not in self.quarantined or pair in retest)]
+        for currency in {c for pair in pairs for c in pair} - self._index.keys():
+            self._index[currency] = len(self._index)
+        if len(self._potential) < len(self._index):
+            self._potential = np.concatenate([self._potential, np.zeros(len(self._index) - len(self._potential))])
+        src = np.fromiter((self._index[a] for a, _ in pairs), dtype=np.int64, count=len(pairs))
+        dst = np.fromiter((self._index[b] for _, b in pairs), dtype=np.int64, count=len(pairs))
+        costs = -np.log(np.fromiter((snapshot.rates[pair] for pair in pairs), dtype=np.float64, count=len(pairs)))
+        weights = costs + math.log1p(self.tolerance_bps * 1e-4)
+        active = np.ones(len(pairs), dtype=bool)
+        found = []
+        for _ in range(self.max_cycles):
+            edges = np.nonzero(active)[0]
+            potential = self._potential.copy()
+            cycle = negative_cycle(potential, src[edges], dst[edges], weights[edges])
+            if cycle is None:
+                self._potential = potential
+                break
+            cycle = edges[cycle].tolist()
+            # The edge that moved in this batch, and furthest, is the likeliest bad quote
+            suspect = max(cycle, key=lambda k: self._suspicion(changed.get(pairs[k])))
+            active[suspect] = False
+            record = {
+                "cycle": [pairs[k][0] for k in cycle] + [pairs[cycle[0]][0]],
+                "profit_bps": round(math.expm1(-float(costs[cycle].sum())) * 1e4, 2),
+                "suspect": f"{pairs[suspect][0]}-{pairs[suspect][1]}",
+                "rate_version": snapshot.version,
+                "detected_at": time.time(),
+            }
+            found.append(record)
+            self.cycles.append(record)
+            self.quarantined[pairs[suspect]] = record
+            self.rag.router.quarantine(pairs[suspect])
+            print(f"[KG LOG] Arbitrage cycle {' -> '.join(record['cycle'])} gains {record['profit_bps']} bps; "
+                  f"quarantined {record['suspect']}")
+        else:
+            print(f"[KG LOG] More than {self.max_cycles} arbitrage cycles in version {snapshot.version}; "
+                  f"the rest are left for the next batch")
+        position = {pair: k for k, pair in enumerate(pairs)} if retest else {}
+        for pair in retest:
+            if active[position[pair]]:
+                del self.quarantined[pair]
+                self.rag.router.release(pair)
+                print(f"[KG LOG] Released {pair[0]}-{pair[1]} from quarantine")
+        self.scans += 1
+        self.last_scan_ms = round((time.perf_counter() - started) * 1000, 3)
+        return found
+
+    @staticmethod
+    def _suspicion(change: RateChange | None) -> tuple[int, float]:
+        if change is None:
+            return 0, 0.0
+        return 1, math.inf if change.change_bps is None else abs(change.change_bps)
+
+    def status(self) -> dict:
+        return {
+            "running": self._running,
+            "scans": self.scans,
+            "scans_skipped": self.scans_skipped,
+            "last_scan_ms": self.last_scan_ms,
+            "quarantined": {f"{a}-{b}": record for (a, b), record in dict(self.quarantined).items()},
+            "recent_cycles": list(self.cycles),
+        }
@@ -0,0 +1,200 @@
+"""
+Offline routing backtests over recorded rates.
+
+A RateTape is a compact rate history on disk, a directory holding
+rates.npy (ticks x pairs, float32, each row the whole market after one
+tick, NaN before a pair's first quote), timestamps.npy and pairs.json. The
+arrays are opened with np.load(mmap_mode="r"), so a tape of millions of
+ticks is paged in as it is scanned instead of being loaded.
+RateTape.from_replay() converts the JSON-lines recordings ReplayFeedSource
+plays back.
+
+backtest() sends a transfer of each given size at every tick: a policy
+picks one of the candidate routes from the rates it can see, the transfer
+settles `settle_seconds` later at the rates of that moment, and the result
+is compared with an oracle that picks the best route knowing those
+settlement rates. Everything is NumPy over chunks of ticks.
+
+Run with: python backtest.py TAPE_DIR FROM TO [--amounts 10000,1000000] [--settle-seconds 30]
+"""
+import argparse
+import json
+import os
+from typing import Callable
+
+import numpy as np
+
+from financerag import FinancialRAG
+from rate_feed import parse_quotes
+
+# A policy gets the output every candidate route would give at decision time
+# (routes x ticks) and returns the index of the route to take at each tick.
+Policy = Callable[[np.ndarray], np.ndarray]
+
+
+class RateTape:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "pairs.json")) as f:
+            self.pairs = [tuple(pair) for pair in json.load(f)]
+        self.column = {pair: k for k, pair in enumerate(self.pairs)}
+        self.timestamps = np.load(os.path.join(path, "timestamps.npy"), mmap_mode="r")
+        self.rates = np.load(os.path.join(path, "rates.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def write(cls, path: str, timestamps, pairs, rates) -> "RateTape":
+        """Stores a (ticks x pairs) rate history as a tape."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "timestamps.npy"), np.asarray(timestamps, dtype=np.float64))
+        np.save(os.path.join(path, "rates.npy"), np.asarray(rates, dtype=np.float32))
+        with open(os.path.join(path, "pairs.json"), "w") as f:
+            json.dump([list(pair) for pair in pairs], f)
+        return cls(path)
+
+    @classmethod
+    def from_replay(cls, recording: str, path: str) -> "RateTape":
+        """
+        Converts a ReplayFeedSource recording into a tape, carrying every
+        pair's last quote forward. Two streaming passes, so the recording
+        never has to fit in memory.
+        """
+        pairs, ticks = {}, 0
+        with open(recording) as f:
+            for line in f:
+                if line.strip():
+                    for pair in parse_quotes(json.loads(line)):
+                        pairs.setdefault(pair, len(pairs))
+                    ticks += 1
+        os.makedirs(path, exist_ok=True)
+        rates = np.lib.format.open_memmap(os.path.join(path, "rates.npy"), mode="w+",
+                                          dtype=np.float32, shape=(ticks, len(pairs)))
+        timestamps = np.lib.format.open_memmap(os.path.join(path, "timestamps.npy"), mode="w+",
+                                               dtype=np.float64, shape=(ticks,))
+        state = np.full(len(pairs), np.nan, dtype=np.float32)
+        tick = 0
+        with open(recording) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                for pair, rate in parse_quotes(record).items():
+                    state[pairs[pair]] = rate
+                rates[tick] = state
+                timestamps[tick] = record.get("ts", tick)
+                tick += 1
+        rates.flush()
+        timestamps.flush()
+        with open(os.path.join(path, "pairs.json"), "w") as f:
+            json.dump([list(pair) for pair in pairs], f)
+        return cls(path)
+
+
+def spot_policy(outputs: np.ndarray) -> np.ndarray:
+    """The route paying the most at decision time: what quote_route and RoutingEngine pick."""
+    return np.nanargmax(np.where(np.isnan(outputs), -np.inf, outputs), axis=0)
+
+
+def declared_path_policy(rag: FinancialRAG, routes: list[tuple[str, ...]]) -> Policy:
+    """Always the route through find_best_path()'s chain, which ranks by path cost alone."""
+    via = rag.find_best_path(routes[0][0], routes[0][-1])
+    choice = next((k for k, hops in enumerate(routes) if hops[1:-1] == (via,)), 0)
+    return lambda outputs: np.full(outputs.shape[1], choice, dtype=np.int64)
+
+
+def _route_outputs(rag: FinancialRAG, tape: RateTape, routes, rows: slice, amount: float) -> np.ndarray:
+    """What each route returns for `amount` at every tick in `rows`: (routes x ticks), with fees and slippage."""
+    outputs = []
+    for hops in routes:
+        pairs = list(zip(hops, hops[1:]))
+        rates = [tape.rates[rows, tape.column[pair]].astype(np.float64) * (1 - rag.router.fee(pair))
+                 for pair in pairs]
+        outputs.append(rag.splitter.route_output(hops, rates, np.full(len(rates[0]), amount)))
+    return np.stack(outputs)
+
+
+def backtest(rag: FinancialRAG, tape: RateTape, from_currency: str, to_currency: str, amounts,
+             policies: dict[str, Policy] | None = None, routes: list[tuple[str, ...]] | None = None,
+             settle_seconds: float = 30.0, chunk: int = 1_000_000) -> dict:
+    """
+    Simulates one transfer per amount at every tick of `tape` and reports,
+    per policy and amount, how much each policy gave up against the oracle.
+    `routes` defaults to the declared corridors for the pair; `policies`
+    to the spot-rate router and the declared-path lookup. Fees and
+    liquidity curves come from `rag`.
+    """
+    if routes is None:
+        routes = [(from_currency, via, to_currency) for via, _ in rag.backend.paths(from_currency, to_currency)]
+    missing = [hops for hops in routes if any(pair not in tape.column for pair in zip(hops, hops[1:]))]
+    routes = [hops for hops in routes if hops not in missing]
+    if not routes:
+        raise ValueError(f"The tape has no complete route from {from_currency} to {to_currency}.")
+    if policies is None:
+        policies = {"spot": spot_policy, "declared_path": declared_path_policy(rag, routes)}
+    timestamps = np.asarray(tape.timestamps)
+    # Each decision settles at the first tick at least settle_seconds later; the last ones never settle
+    settles_at = np.searchsorted(timestamps, timestamps + settle_seconds)
+    decisions = int(np.searchsorted(settles_at, len(tape)))
+    report = {"ticks": len(tape), "transfers_per_amount": decisions, "settle_seconds": settle_seconds,
+              "routes": ["-".join(hops) for hops in routes], "skipped_routes": ["-".join(hops) for hops in missing],
+              "results": {}}
+    for amount in amounts:
+        totals = {name: {"output": 0.0, "regret": 0.0, "costs": [], "oracle_picks": 0} for name in policies}
+        oracle_output = 0.0
+        for start in range(0, decisions, chunk):
+            stop = min(start + chunk, decisions)
+            settle_rows = settles_at[start:stop]
+            now = _route_outputs(rag, tape, routes, slice(start, stop), amount)
+            first, last = int(settle_rows[0]), int(settle_rows[-1]) + 1
+            later = _route_outputs(rag, tape, routes, slice(first, last), amount)[:, settle_rows - first]
+            later = np.where(np.isnan(later), -np.inf, later)
+            best_route = later.argmax(axis=0)
+            best = later.max(axis=0)
+            valid = np.isfinite(best) & (best > 0)
+            oracle_output += float(best[valid].sum())
+            for name, policy in policies.items():
+                choice = policy(now)
+                realized = later[choice, np.arange(len(choice))]
+                realized = np.where(np.isfinite(realized), realized, 0.0)
+                totals[name]["output"] += float(realized[valid].sum())
+                totals[name]["regret"] += float((best - realized)[valid].sum())
+                totals[name]["costs"].append(((best - realized) / best * 1e4)[valid])
+                totals[name]["oracle_picks"] += int((choice == best_route)[valid].sum())
+        results = {"oracle_output": oracle_output}
+        for name, total in totals.items():
+            costs = np.concatenate(total["costs"]) if total["costs"] else np.zeros(0)
+            results[name] = {
+                "output": total["output"],
+                "regret": total["regret"],
+                "mean_cost_bps": round(float(costs.mean()), 3) if len(costs) else None,
+                "p95_cost_bps": round(float(np.percentile(costs, 95)), 3) if len(costs) else None,
+                "oracle_agreement": round(total["oracle_picks"] / len(costs), 4) if len(costs) else None,
+            }
+        report["results"][str(amount)] = results
+    return report
+
+
+if __name__ == "__main__":
+    from hyperon import MeTTa
+    from knowledge import FIAT_CURRENCIES, apply_liquidity_curves, initialize_financial_knowledge_graph
+
+    parser = argparse.ArgumentParser(description="Backtest routing over a recorded rate tape.")
+    parser.add_argument("tape", help="tape directory (see RateTape), or a .jsonl recording to convert first")
+    parser.add_argument("from_currency")
+    parser.add_argument("to_currency")
+    parser.add_argument("--amounts", default="10000,1000000")
+    parser.add_argument("--settle-seconds", type=float, default=30.0)
+    args = parser.parse_args()
+
+    tape_path = args.tape
+    if tape_path.endswith(".jsonl"):
+        tape_path = tape_path[:-len(".jsonl")] + ".tape"
+        RateTape.from_replay(args.tape, tape_path)
+    rag = FinancialRAG(MeTTa(), fiat_currencies=FIAT_CURRENCIES)
+    initialize_financial_knowledge_graph(rag)
+    apply_liquidity_curves(rag)
+    result = backtest(rag, RateTape(tape_path), args.from_currency.upper(), args.to_currency.upper(),
+                      [float(amount) for amount in args.amounts.split(",")], settle_seconds=args.settle_seconds)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,267 @@
+"""
+Micro-benchmarks for the knowledge-graph lookups used on the transaction path.
+Run with: python benchmarks.py
+"""
+import contextlib
+import io
+import time
+
+from hyperon import MeTTa
+from arbitrage import ArbitrageDetector
+from knowledge import FIAT_CURRENCIES, apply_liquidity_curves, initialize_financial_knowledge_graph
+from financerag import FinancialRAG
+from kg_backends import MeTTaBackend, NativeBackend
+from rate_events import RateChange
+from rate_feed import MOCK_RATES
+from routing import RoutingEngine
+
+import numpy as np
+
+
+def _time_per_call(func, iterations: int) -> float:
+    """Returns the mean wall time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _legacy_find_best_path(metta: MeTTa, from_currency: str, to_currency: str) -> str | None:
+    """The original f-string + metta.run lookup, kept here as the baseline."""
+    results = metta.run(f'!(match &self (path {from_currency} {to_currency} $via $cost) ($via $cost))')
+    if not results or not results[0]:
+        return None
+    best_item = min(results[0], key=lambda item: float(str(item.get_children()[1])))
+    return str(best_item.get_children()[0])
+
+
+def _legacy_get_exchange_rate(metta: MeTTa, from_currency: str, to_currency: str) -> float | None:
+    result = metta.run(f'!(match &self (rate {from_currency} {to_currency} $rate) $rate)')
+    if result and result[0]:
+        return float(str(result[0][0]))
+    return None
+
+
+def bench_prepared_queries(iterations: int = 2000):
+    """Compares metta.run program strings against prepared pattern queries."""
+    metta = MeTTa()
+    initialize_financial_knowledge_graph(metta)
+    # The legacy rate lookup reads rate atoms, so mirror them into this (small) space
+    rag = FinancialRAG(backend=MeTTaBackend(metta, rate_atoms=True), query_cache_size=0)
+    rag.update_rate("INR", "ETH", 1000.0)
+
+    rows = [
+        ("find_best_path", lambda: _legacy_find_best_path(metta, "INR", "USD"),
+         lambda: rag.find_best_path("INR", "USD")),
+        ("get_exchange_rate", lambda: _legacy_get_exchange_rate(metta, "INR", "ETH"),
+         lambda: rag.get_exchange_rate("INR", "ETH")),
+    ]
+    print(f"\n--- Prepared queries ({iterations} lookups each) ---")
+    for name, legacy, prepared in rows:
+        assert legacy() == prepared()
+        legacy_us = _time_per_call(legacy, iterations)
+        prepared_us = _time_per_call(prepared, iterations)
+        print(f"{name:<20} metta.run: {legacy_us:9.2f} us  prepared: {prepared_us:9.2f} us  "
+              f"speedup: {legacy_us / prepared_us:7.1f}x")
+
+
+def bench_bulk_updates(pairs: int = 500, ticks: int = 20):
+    """Compares per-pair update_rate calls with one update_rates batch per tick."""
+    currencies = [f"C{i}" for i in range(pairs)]
+    batches = [{("INR", c): 1.0 + tick + i * 1e-6 for i, c in enumerate(currencies)} for tick in range(ticks)]
+
+    def per_pair(rag: FinancialRAG):
+        for batch in batches:
+            for (from_curr, to_curr), rate in batch.items():
+                rag.update_rate(from_curr, to_curr, rate)
+
+    def batched(rag: FinancialRAG):
+        for batch in batches:
+            rag.update_rates(batch)
+
+    print(f"\n--- Bulk updates ({pairs} pairs x {ticks} ticks) ---")
+    for name, run in (("update_rate loop", per_pair), ("update_rates", batched)):
+        rag = FinancialRAG(MeTTa())
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(rag)
+            elapsed = time.perf_counter() - start
+        print(f"{name:<20} {elapsed / ticks * 1e3:9.2f} ms/tick")
+
+
+def bench_query_cache(iterations: int = 2000, plans: int = 200):
+    """Repeated find_best_path calls with and without the query cache, and its hit rate across rate ticks."""
+    print(f"\n--- Query cache ({iterations} lookups each) ---")
+    timings = {}
+    for name, size in (("uncached", 0), ("cached", 1024)):
+        rag = FinancialRAG(MeTTa(), query_cache_size=size)
+        initialize_financial_knowledge_graph(rag)
+        timings[name] = _time_per_call(lambda: rag.find_best_path("INR", "USD"), iterations)
+    print(f"{'find_best_path':<20} uncached: {timings['uncached']:9.2f} us  cached: {timings['cached']:9.2f} us  "
+          f"speedup: {timings['uncached'] / timings['cached']:7.1f}x")
+
+    rag = FinancialRAG(MeTTa())
+    initialize_financial_knowledge_graph(rag)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for plan in range(plans):
+            rag.update_rate("INR", "ETH", 1000.0 + plan)
+            for _ in range(4):
+                rag.find_best_path("INR", "USD")
+    cache = rag.stats()["query_cache"]
+    print(f"{'4 queries per tick':<20} hits: {cache['hits']}  misses: {cache['misses']}")
+
+
+
+def bench_route_cache(iterations: int = 2000):
+    """quote_route on the INR -> USD corridor with and without the route cache, by amount."""
+    print(f"\n--- Route cache ({iterations} quotes each) ---")
+    for amount in (None, 10_000, 2_000_000):
+        timings = {}
+        for name, size in (("uncached", 0), ("cached", 4096)):
+            rag = FinancialRAG(backend=NativeBackend(), fiat_currencies=FIAT_CURRENCIES, route_cache_size=size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                initialize_financial_knowledge_graph(rag)
+                apply_liquidity_curves(rag)
+                rag.update_rates(MOCK_RATES)
+            timings[name] = _time_per_call(lambda: rag.quote_route("INR", "USD", amount), iterations)
+        print(f"{'amount ' + str(amount):<20} uncached: {timings['uncached']:9.2f} us  cached: {timings['cached']:9.2f} us  "
+              f"speedup: {timings['uncached'] / timings['cached']:7.1f}x")
+
+
+def _backend_factories():
+    return {"metta": lambda: MeTTaBackend(MeTTa()), "native": NativeBackend}
+
+
+# MeTTaBackend keeps rates out of the space, but this benchmark also adds one
+# path atom per pair and hyperon 0.2.10 panics inside its atom index once a
+# space holds that many paths, so the MeTTa backend is measured up to here.
+METTA_MAX_PAIRS = 1000
+
+
+def bench_backends(sizes=(10, 100, 1000, 10000), lookups: int = 2000):
+    """Update, rate lookup and path query throughput per backend for growing numbers of pairs."""
+    print("\n--- Backends (ops/s) ---")
+    print(f"{'backend':<8}{'pairs':>8}{'update':>14}{'lookup':>14}{'path query':>14}")
+    for name, make_backend in _backend_factories().items():
+        for size in sizes:
+            if name == "metta" and size > METTA_MAX_PAIRS:
+                print(f"{name:<8}{size:>8}  skipped (hyperon panics on this many path atoms)")
+                continue
+            rag = FinancialRAG(backend=make_backend(), history_size=2, query_cache_size=0)
+            currencies = [f"C{i}" for i in range(size)]
+            for i, currency in enumerate(currencies):
+                rag.add_path("INR", "USD", currency, 0.001 + i * 1e-6)
+            with contextlib.redirect_stdout(io.StringIO()):
+                rag.update_rates({("INR", c): 1.0 for c in currencies})
+                start = time.perf_counter()
+                rag.update_rates({("INR", c): 2.0 for c in currencies})
+                update_s = time.perf_counter() - start
+            lookup_us = _time_per_call(lambda: rag.get_exchange_rate("INR", currencies[-1]), lookups)
+            path_us = _time_per_call(lambda: rag.find_best_path("INR", "USD"), max(1, lookups // size))
+            print(f"{name:<8}{size:>8}{size / update_s:>14,.0f}{1e6 / lookup_us:>14,.0f}{1e6 / path_us:>14,.0f}")
+
+
+def _random_market(currencies: int, density: float, seed: int = 0) -> dict[tuple[str, str], float]:
+    """Quotes between `density` of all ordered pairs, each a little worse than fair value (no arbitrage)."""
+    rng = np.random.default_rng(seed)
+    value = np.exp(rng.normal(0, 1, currencies))
+    rates = {}
+    for i in range(currencies):
+        for j in range(currencies):
+            if i != j and rng.random() < density:
+                rates[(f"C{i}", f"C{j}")] = value[j] / value[i] * np.exp(-abs(rng.normal(0, 0.01)))
+    return rates
+
+
+def bench_routing(sizes=(50, 100, 200), density: float = 0.3, updates: int = 200):
+    """All-pairs routing: full rebuild versus incremental single-rate updates, and route queries."""
+    print(f"\n--- Routing engine ({density:.0%} of pairs quoted) ---")
+    print(f"{'currencies':>10}{'edges':>8}{'rebuild ms':>12}{'update ms':>12}{'query us':>10}")
+    for size in sizes:
+        rates = _random_market(size, density)
+        engine = RoutingEngine()
+        engine.load(rates)
+        start = time.perf_counter()
+        engine.route("C0", "C1")
+        rebuild_ms = (time.perf_counter() - start) * 1e3
+        rng = np.random.default_rng(1)
+        pairs = list(rates)
+        start = time.perf_counter()
+        for _ in range(updates):
+            pair = pairs[rng.integers(len(pairs))]
+            engine.update(pair, rates[pair] * float(np.exp(rng.normal(0, 0.005))))
+            engine.route("C0", "C1")
+        update_ms = (time.perf_counter() - start) / updates * 1e3
+        query_us = _time_per_call(lambda: engine.route("C0", f"C{size - 1}"), 2000)
+        print(f"{size:>10}{len(rates):>8}{rebuild_ms:>12.2f}{update_ms:>12.3f}{query_us:>10.2f}")
+
+
+def bench_quote_batch(size: int = 200, density: float = 0.3, batches=(100, 1000, 10000)):
+    """
+    quote_batch (tuples in) and quote_arrays (currency indices in, no route
+    tuples built) throughput against one route() call per quote, on random corridors.
+    """
+    print(f"\n--- Batch quotes ({size} currencies) ---")
+    print(f"{'quotes':>8}{'batch ms':>10}{'quotes/ms':>11}{'arrays ms':>11}{'quotes/ms':>11}{'one-by-one ms':>15}")
+    engine = RoutingEngine()
+    engine.load(_random_market(size, density))
+    engine.quote_batch([("C0", "C1", 1.0)])
+    rng = np.random.default_rng(2)
+    for count in batches:
+        requests = [(f"C{a}", f"C{b}", float(amount)) for (a, b), amount
+                    in zip(rng.integers(0, size, (count, 2)).tolist(), rng.uniform(1, 1000, count).tolist())]
+        currencies = engine.currencies
+        sources, targets = (np.searchsorted(currencies, [request[k] for request in requests]) for k in (0, 1))
+        amounts = np.array([request[2] for request in requests])
+        batch_ms = min(_time_per_call(lambda: engine.quote_batch(requests), 1) for _ in range(3)) / 1e3
+        arrays_ms = min(_time_per_call(lambda: engine.quote_arrays(sources, targets, amounts, currencies), 1)
+                        for _ in range(3)) / 1e3
+        start = time.perf_counter()
+        for from_currency, to_currency, _ in requests:
+            engine.route(from_currency, to_currency)
+        single_ms = (time.perf_counter() - start) * 1e3
+        print(f"{count:>8}{batch_ms:>10.2f}{count / batch_ms:>11.0f}{arrays_ms:>11.2f}{count / arrays_ms:>11.0f}"
+              f"{single_ms:>15.2f}")
+
+
+def bench_arbitrage(sizes=(50, 100, 200), density: float = 0.3, batch: int = 1000, ticks: int = 10):
+    """Arbitrage scans: a full scan, then ticks of `batch` moved rates with one bad quote each."""
+    print(f"\n--- Arbitrage detection ({batch} moved rates per tick) ---")
+    print(f"{'currencies':>10}{'edges':>8}{'full ms':>10}{'tick ms':>10}{'caught':>8}")
+    for size in sizes:
+        rates = _random_market(size, density)
+        rag = FinancialRAG(backend=NativeBackend())
+        detector = ArbitrageDetector(rag)
+        rng = np.random.default_rng(1)
+        pairs = list(rates)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rag.update_rates(rates)
+            start = time.perf_counter()
+            detector.scan({}, full=True)
+            full_ms = (time.perf_counter() - start) * 1e3
+            elapsed, caught = 0.0, 0
+            for tick in range(ticks):
+                current = rag.latest_snapshot().rates
+                moved = {pairs[k]: current[pairs[k]] * float(np.exp(rng.normal(0, 1e-4)))
+                         for k in rng.choice(len(pairs), min(batch, len(pairs)), replace=False)}
+                bad = next(iter(moved))
+                moved[bad] = current[bad] * 1.1
+                rag.update_rates(moved)
+                changes = {pair: RateChange(pair, current[pair], rate, (rate / current[pair] - 1) * 1e4, tick)
+                           for pair, rate in moved.items()}
+                start = time.perf_counter()
+                found = detector.scan(changes)
+                elapsed += time.perf_counter() - start
+                caught += any(cycle["suspect"] == f"{bad[0]}-{bad[1]}" for cycle in found)
+        print(f"{size:>10}{len(rates):>8}{full_ms:>10.2f}{elapsed / ticks * 1e3:>10.2f}{f'{caught}/{ticks}':>8}")
+
+
+if __name__ == "__main__":
+    bench_prepared_queries()
+    bench_bulk_updates()
+    bench_query_cache()
+    bench_route_cache()
+    bench_backends()
+    bench_routing()
+    bench_quote_batch()
+    bench_arbitrage()
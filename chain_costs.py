@@ -0,0 +1,207 @@
+"""
+Per-chain transfer costs for routing.
+
+A conversion via a chain pays gas on the pool-to-pool transfer and waits for
+it to confirm. ChainCostModel keeps, per chain, a cached gas price (polled
+once a block), the gas a PaymentSender.send transfer actually uses and how
+long transfers take to confirm (both learned from receipts), and turns them
+into the proportional cost the knowledge graph ranks paths by:
+
+    cost = gas fee / reference amount + time_value_per_hour * hours to settle
+
+The gas fee is converted into the path's source currency at the current
+rate, and `reference_amount` is a typical transfer in that currency. Costs
+are written to the path facts only when they move by `min_change`, so quotes
+keep being served from the route cache in between.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Mapping
+
+from financerag import FinancialRAG
+
+
+@dataclass
+class ChainCosts:
+    gas_price_gwei: float
+    gas_per_transfer: float
+    confirmation_seconds: float
+    # Receipts the gas and confirmation estimates have learned from
+    receipts: int = 0
+    # When gas_price_gwei was last polled from the chain (None: still the configured estimate)
+    gas_price_at: float | None = None
+
+    @property
+    def transfer_fee(self) -> float:
+        """Gas for one transfer, in the chain's native coin."""
+        return self.gas_price_gwei * 1e-9 * self.gas_per_transfer
+
+
+class ChainCostModel:
+    """
+    `chains` is a CHAIN_CONFIG-style mapping (rpc, gas_price_gwei,
+    block_time_seconds per chain); its gas prices are the starting estimates
+    and `gas_per_transfer` (the transfer gas limit) the starting gas use. A
+    transfer counts as settled after `confirmations` blocks. `apply`, if
+    given, is an async runner such as KnowledgeGraphExecutor.run that cost
+    updates go through, as for RateFeedIngestor.
+    """
+    def __init__(self, rag: FinancialRAG, chains: Mapping[str, dict], gas_per_transfer: float = 200_000,
+                 confirmations: int = 3, time_value_per_hour: float = 0.001, reference_amount: float = 10_000.0,
+                 smoothing: float = 0.2, min_change: float = 0.01, apply=None, receipt_timeout: float = 300.0):
+        self.rag = rag
+        self.config = dict(chains)
+        self.confirmations = confirmations
+        self.time_value_per_hour = time_value_per_hour
+        self.reference_amount = reference_amount
+        self.smoothing = smoothing
+        self.min_change = min_change
+        self.receipt_timeout = receipt_timeout
+        self.chains = {
+            name: ChainCosts(float(config["gas_price_gwei"]), float(gas_per_transfer),
+                             self._block_time(name) * confirmations)
+            for name, config in self.config.items()
+        }
+        self._apply = apply
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._receipts = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tx-receipts")
+        self._tasks: list[asyncio.Task] = []
+        self.gas_refreshes = 0
+        self.gas_errors: dict[str, int] = {name: 0 for name in self.chains}
+        self.cost_updates = 0
+
+    def _block_time(self, chain: str) -> float:
+        return float(self.config[chain].get("block_time_seconds", 12))
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    # --- Cost model -----------------------------------------------------------
+    def path_cost(self, via: str, rate: float) -> float | None:
+        """
+        The cost of a path through chain `via`, where `rate` is how many
+        units of `via` one unit of the source currency buys. None for
+        chains the model does not know.
+        """
+        costs = self.chains.get(via)
+        if costs is None or not rate or rate <= 0:
+            return None
+        gas_fee = costs.transfer_fee / rate
+        return gas_fee / self.reference_amount + self.time_value_per_hour * costs.confirmation_seconds / 3600
+
+    def update_costs(self) -> int:
+        """Rewrites the cost of every path fact whose chain cost moved by `min_change`; returns how many changed."""
+        # snapshot() so a reader worker prices gas on the writer's latest rates
+        snapshot = self.rag.snapshot()
+        updated = 0
+        for from_currency, to_currency, via, cost in self.rag.backend.path_facts():
+            new_cost = self.path_cost(via, snapshot.get(from_currency, via))
+            if new_cost is None or abs(new_cost - cost) <= self.min_change * cost:
+                continue
+            self.rag.add_path(from_currency, to_currency, via, new_cost)
+            updated += 1
+        if updated:
+            self.cost_updates += updated
+            print(f"[KG LOG] Updated {updated} path costs from chain gas and settlement times")
+        return updated
+
+    # --- Gas prices -------------------------------------------------------------
+    def _client(self, chain: str):
+        client = self._clients.get(chain)
+        if client is None:
+            from web3 import Web3
+            client = self._clients[chain] = Web3(Web3.HTTPProvider(self.config[chain]["rpc"]))
+        return client
+
+    def refresh_gas_price(self, chain: str) -> float:
+        """Fetches the chain's current gas price (blocking) into the cache and returns it in gwei."""
+        price = self._client(chain).eth.gas_price / 1e9
+        self.chains[chain].gas_price_gwei = price
+        self.chains[chain].gas_price_at = time.time()
+        self.gas_refreshes += 1
+        return price
+
+    def gas_price(self, chain: str, max_blocks: float = 3) -> float | None:
+        """
+        The cached gas price in gwei if it was polled within the last
+        `max_blocks` blocks; None otherwise (the caller then asks the chain).
+        """
+        costs = self.chains.get(chain)
+        if costs is None or costs.gas_price_at is None:
+            return None
+        if time.time() - costs.gas_price_at > max_blocks * self._block_time(chain):
+            return None
+        return costs.gas_price_gwei
+
+    async def _poll(self, chain: str):
+        """Refreshes one chain's gas price once a block and pushes any cost change to the graph."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh_gas_price, chain)
+            except Exception as e:
+                # Keep pricing on the last known gas price
+                self.gas_errors[chain] += 1
+                print(f"[TOOL LOG] Gas price refresh for {chain} failed: {e}")
+            try:
+                if self._apply is None:
+                    self.update_costs()
+                else:
+                    await self._apply(self.update_costs)
+            except Exception as e:
+                print(f"[ERROR in RAG] Could not update path costs: {e}")
+            await asyncio.sleep(self._block_time(chain))
+
+    def start(self):
+        if self.running:
+            return
+        self._tasks = [asyncio.create_task(self._poll(chain), name=f"gas-{chain}") for chain in self.chains]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- Receipts -------------------------------------------------------------
+    def track(self, chain: str, tx_hash: str, sent_at: float | None = None):
+        """Learns gas use and confirmation time from a sent transfer's receipt, in the background."""
+        if chain in self.chains:
+            self._receipts.submit(self._await_receipt, chain, tx_hash, sent_at or time.time())
+
+    def _await_receipt(self, chain: str, tx_hash: str, sent_at: float):
+        try:
+            receipt = self._client(chain).eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+        except Exception as e:
+            print(f"[TOOL LOG] No receipt for {tx_hash} on {chain}: {e}")
+            return
+        # Included now; settled once the remaining confirmations are mined on top
+        settle = time.time() - sent_at + self._block_time(chain) * (self.confirmations - 1)
+        with self._lock:
+            costs = self.chains[chain]
+            weight = 1.0 if costs.receipts == 0 else self.smoothing
+            costs.gas_per_transfer += weight * (float(receipt["gasUsed"]) - costs.gas_per_transfer)
+            costs.confirmation_seconds += weight * (settle - costs.confirmation_seconds)
+            costs.receipts += 1
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "gas_refreshes": self.gas_refreshes,
+            "gas_errors": dict(self.gas_errors),
+            "cost_updates": self.cost_updates,
+            "chains": {
+                name: {
+                    "gas_price_gwei": round(costs.gas_price_gwei, 4),
+                    "gas_per_transfer": round(costs.gas_per_transfer),
+                    "transfer_fee": costs.transfer_fee,
+                    "confirmation_seconds": round(costs.confirmation_seconds, 1),
+                    "receipts": costs.receipts,
+                }
+                for name, costs in self.chains.items()
+            },
+        }
@@ -1,46 +1,736 @@
-from hyperon import MeTTa, S, E, ValueAtom
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from hyperon import MeTTa
+
+from kg_backends import KnowledgeBackend, MeTTaBackend
+from kg_snapshot import read_snapshot, write_snapshot
+from rate_events import RateChange, RateEventBus, Subscription
+from rate_history import RateHistory
+from routing import BatchQuote, Route, RoutingEngine
+from split_routing import RouteQuote, SplitRouter
+from shared_rates import SharedRateTable
+from triangulation import cross_rate_table, inconsistent_quotes
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    """An immutable, versioned view of every known rate at one point in time."""
+    version: int
+    rates: Mapping[tuple[str, str], float]
+    expires_at: Mapping[tuple[str, str], float]
+    created_at: float
+    # 0..1 agreement between feeds for rates that were aggregated from several sources
+    confidence: Mapping[tuple[str, str], float] = field(default_factory=lambda: MappingProxyType({}))
+
+    def lookup(self, from_currency: str, to_currency: str, now: float | None = None) -> dict:
+        """Returns the rate with a 'fresh', 'stale' or 'missing' status."""
+        key = (from_currency, to_currency)
+        rate = self.rates.get(key)
+        quote = _rate_status(self.version, rate, self.expires_at.get(key, math.inf), now)
+        if rate is not None and key in self.confidence:
+            quote["confidence"] = self.confidence[key]
+        return quote
+
+    def get(self, from_currency: str, to_currency: str) -> float | None:
+        """Returns the rate only while it is fresh; stale and unknown pairs give None."""
+        key = (from_currency, to_currency)
+        rate = self.rates.get(key)
+        if rate is None or time.time() >= self.expires_at[key]:
+            return None
+        return rate
+
+def _rate_status(version: int, rate: float | None, expires_at: float, now: float | None = None) -> dict:
+    if rate is None:
+        return {"status": "missing", "rate_version": version}
+    status = "fresh" if (now or time.time()) < expires_at else "stale"
+    return {"status": status, "rate": rate, "rate_version": version, "expires_at": expires_at}
+
+_MISSING = object()
+
+class VersionedLRU:
+    """
+    A bounded, LRU-ordered cache of computed results. An entry only counts
+    while its version matches the caller's current one, so bumping the
+    version invalidates every entry without a sweep.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: OrderedDict[object, tuple[object, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, version, default=_MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
 
 class FinancialRAG:
     """
     Provides an interface to query and UPDATE our MeTTa knowledge graph
     for financial information like optimal paths and exchange rates.
+    Facts live in a pluggable backend; by default the given MeTTa space.
     """
-    def __init__(self, metta_instance: MeTTa):
+    def __init__(self, metta_instance: MeTTa | None = None, shared_table: SharedRateTable | None = None,
+                 rate_ttl: float | None = None, max_rates: int | None = None, history_size: int = 1024,
+                 backend: KnowledgeBackend | None = None, query_cache_size: int = 1024, fiat_currencies=(),
+                 route_cache_size: int = 4096, amount_bucket: float = 0.05, failover_routes: int = 3):
+        if backend is None:
+            if metta_instance is None:
+                raise ValueError("FinancialRAG needs either a MeTTa instance or a backend.")
+            backend = MeTTaBackend(metta_instance)
         self.metta = metta_instance
+        self.backend = backend
+        # Default lifetime of a rate fact in seconds (None = never expires), and
+        # how many rate facts compact() keeps at most.
+        self.rate_ttl = rate_ttl
+        self.max_rates = max_rates
+        self._evicted_expired = 0
+        self._evicted_capacity = 0
+        # Last `history_size` observations per pair, for volatility-aware decisions
+        self.history = RateHistory(history_size)
+        # Subscribers notified when rates move past their thresholds
+        self.events = RateEventBus()
+        # Optional cross-process table: the writer process mirrors every
+        # published snapshot into it and reader processes sync from it,
+        # tracking the table's (epoch, version) they last adopted.
+        self._shared = shared_table
+        self._shared_state: tuple[int, int] | None = None
+        # Writers serialize on this lock and publish a new snapshot by swapping
+        # a single reference; readers never take it.
+        self._write_lock = threading.RLock()
+        # (from, to) -> (rate, expires_at, confidence or None) awaiting publication
+        self._staged: dict[tuple[str, str], tuple[float, float, float | None]] | None = None
+        self._pinned: ContextVar[RateSnapshot | None] = ContextVar(f"pinned_rates_{id(self)}", default=None)
+        self._snapshot = RateSnapshot(0, MappingProxyType({}), MappingProxyType({}), time.time())
+        # Memoized query results, (query, args) -> result, valid for one
+        # (path generation, rate version): any path or rate change invalidates them.
+        self._query_cache = VersionedLRU(query_cache_size)
+        self._path_generation = 0
+        # Route plans per (from, to, amount bucket), valid for one (path generation,
+        # routing generation, rate version). Amounts within `amount_bucket` (relative)
+        # of each other share a plan; hot corridors are planned ahead of queries.
+        self._route_cache = VersionedLRU(route_cache_size)
+        self.amount_bucket = amount_bucket
+        self.hot_corridors: dict[tuple[str, str], tuple[float | None, ...]] = {}
+        # How many disjoint routes to keep per corridor for failing over without replanning
+        self.failover_depth = failover_routes
+        # Multi-hop routes over the rate graph, kept current from rate events
+        self.router = RoutingEngine(fiat_currencies)
+        self.events.subscribe(self.router.on_rate_changes)
+        # Per-edge liquidity curves for splitting large amounts across routes
+        self.splitter = SplitRouter()
+        self._index_existing_rates()
+        self._sync_route_fees()
+
+    def _index_existing_rates(self):
+        """Adopts rates already held by the backend."""
+        expires_at = self._expiry(None)
+        rates = {key: (rate, expires_at, None) for key, rate in self.backend.existing_rates().items()}
+        if rates:
+            self._publish(rates)
+
+    def _expiry(self, ttl: float | None) -> float:
+        ttl = self.rate_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl is not None else math.inf
+
+    def _publish(self, changes: dict[tuple[str, str], tuple[float, float, float | None]], version: int | None = None,
+                 removed=()):
+        """Copies the current snapshot with `changes` and `removed` applied and swaps it in."""
+        rates = dict(self._snapshot.rates)
+        expires_at = dict(self._snapshot.expires_at)
+        confidence = dict(self._snapshot.confidence)
+        for key, (rate, expiry, score) in changes.items():
+            rates[key] = rate
+            expires_at[key] = expiry
+            if score is None:
+                confidence.pop(key, None)
+            else:
+                confidence[key] = score
+        for key in removed:
+            rates.pop(key, None)
+            expires_at.pop(key, None)
+            confidence.pop(key, None)
+        if version is None:
+            version = self._snapshot.version + 1
+        now = time.time()
+        for key, (rate, _, _) in changes.items():
+            self.history.record(key, rate, now)
+        self._snapshot = RateSnapshot(version, MappingProxyType(rates), MappingProxyType(expires_at), now,
+                                      MappingProxyType(confidence))
+        published = {key: rate for key, (rate, _, _) in changes.items()}
+        if self._shared is not None and self._shared.is_writer:
+            self._shared.publish(version, published, removed,
+                                 {key: expiry for key, (_, expiry, _) in changes.items()})
+        self.events.publish(version, published, removed)
+
+    def _adopt(self, rates: dict[tuple[str, str], float], version: int, replace: bool = False,
+               expires_at: Mapping[tuple[str, str], float] | None = None, mirror: bool = True, removed=()):
+        """
+        Applies rates produced elsewhere (a snapshot file, the writer process)
+        under their version and with the expiry they were given there (this
+        graph's TTL from now for any `expires_at` lacks). With replace=True,
+        pairs absent from `rates` are dropped, otherwise only the `removed`
+        ones. With mirror=False only the
+        snapshot changes and the backend is left alone, so it is safe from
+        any thread.
+        """
+        with self._write_lock:
+            default_expiry = self._expiry(None)
+            expires_at = expires_at or {}
+            if mirror:
+                self._staged = {}
+                try:
+                    for key, rate in rates.items():
+                        self._apply_rate(*key, rate, expires_at.get(key, default_expiry))
+                finally:
+                    staged, self._staged = self._staged, None
+            else:
+                staged = {key: (rate, expires_at.get(key, default_expiry), None) for key, rate in rates.items()}
+            if replace:
+                removed = [key for key in self._snapshot.rates if key not in rates]
+            else:
+                removed = [key for key in removed if key in self._snapshot.rates]
+            if mirror:
+                for key in removed:
+                    self.backend.remove_rate(key)
+            self._publish(staged, version, removed)
+
+    @property
+    def is_rate_writer(self) -> bool:
+        """False in worker processes that only read rates from the shared table."""
+        return self._shared is None or self._shared.is_writer
+
+    def take_over_rate_writer(self) -> bool:
+        """
+        In a reader process, becomes the rate writer if the writer process has
+        exited, after adopting the last rates it published. Returns whether
+        this process is now the writer (so it should start ingesting rates).
+        """
+        if self.is_rate_writer or not self._shared.try_become_writer():
+            return False
+        # Published versions continue from the table's; as a reader the
+        # backend held no rates, so they are written into it now
+        self._sync_from_shared()
+        with self._write_lock:
+            rates = self._snapshot.rates
+            for key in self.backend.existing_rates().keys() - rates.keys():
+                self.backend.remove_rate(key)
+            for key, rate in rates.items():
+                self.backend.set_rate(key, rate)
+        print("[KG LOG] Rate writer exited; this process takes over rate ingestion")
+        return True
+
+    @contextmanager
+    def rate_refresh(self):
+        """Groups several update_rate calls so they are published as one snapshot version."""
+        with self._write_lock:
+            outermost = self._staged is None
+            if outermost:
+                self._staged = {}
+            try:
+                yield
+            finally:
+                if outermost:
+                    staged, self._staged = self._staged, None
+                    if staged:
+                        self._publish(staged)
+
+    def _apply_rate(self, from_currency: str, to_currency: str, rate: float, expires_at: float,
+                    confidence: float | None = None) -> bool:
+        """
+        Upserts one rate atom and stages it; the caller must hold an open rate_refresh().
+        Returns whether the value changed (an unchanged value still has its expiry renewed).
+        """
+        key = (from_currency, to_currency)
+        staged = self._staged.get(key)
+        current = staged[0] if staged else self._snapshot.rates.get(key)
+        self._staged[key] = (rate, expires_at, confidence)
+        if current == rate:
+            return False
+        self.backend.set_rate(key, rate)
+        return True
+
+    def update_rate(self, from_currency: str, to_currency: str, rate: float, ttl: float | None = None):
+        """Adds or updates a rate atom in the knowledge graph, valid for `ttl` seconds."""
+        with self.rate_refresh():
+            changed = self._apply_rate(from_currency, to_currency, rate, self._expiry(ttl))
+        if changed:
+            print(f"[KG LOG] Updated rate for {from_currency}->{to_currency} to {rate}")
+
+    def update_rates(self, rates: Mapping[tuple[str, str], float], ttl: float | None = None,
+                     confidence: Mapping[tuple[str, str], float] | None = None) -> int:
+        """
+        Applies a whole batch of {(from, to): rate} updates in one pass and
+        publishes them as a single snapshot version. `confidence` optionally
+        scores each rate (0..1, e.g. agreement between aggregated feeds).
+        Returns how many changed.
+        """
+        expires_at = self._expiry(ttl)
+        confidence = confidence or {}
+        with self.rate_refresh():
+            changed = sum(self._apply_rate(from_curr, to_curr, rate, expires_at, confidence.get((from_curr, to_curr)))
+                          for (from_curr, to_curr), rate in rates.items())
+        print(f"[KG LOG] Updated {changed} of {len(rates)} rates")
+        return changed
+
+    def update_base_rates(self, base: str, base_quotes: Mapping[str, float], ttl: float | None = None) -> int:
+        """
+        Publishes every cross rate and inverse implied by `base_quotes` (how
+        much of each currency one unit of `base` buys) as one snapshot version.
+        """
+        return self.update_rates(cross_rate_table(base, base_quotes), ttl)
+
+    def compact(self, now: float | None = None) -> int:
+        """
+        Evicts expired rate facts, then the soonest-to-expire ones beyond
+        max_rates. Returns how many were evicted. Reader processes leave this
+        to the writer and pick up its evictions from the shared table.
+        """
+        if not self.is_rate_writer:
+            return 0
+        with self._write_lock:
+            now = now or time.time()
+            expires_at = self._snapshot.expires_at
+            expired = [key for key, expiry in expires_at.items() if expiry <= now]
+            overflow = []
+            if self.max_rates is not None and len(expires_at) - len(expired) > self.max_rates:
+                live = sorted((expiry, key) for key, expiry in expires_at.items() if expiry > now)
+                overflow = [key for _, key in live[:len(live) - self.max_rates]]
+            evicted = expired + overflow
+            if not evicted:
+                return 0
+            for key in evicted:
+                self.backend.remove_rate(key)
+            self._publish({}, removed=evicted)
+            self._evicted_expired += len(expired)
+            self._evicted_capacity += len(overflow)
+        print(f"[KG LOG] Compaction evicted {len(expired)} expired and {len(overflow)} over-capacity rates")
+        return len(evicted)
+
+    def stats(self) -> dict:
+        """Space size and eviction counters for monitoring."""
+        snapshot = self._snapshot
+        return {
+            "backend": self.backend.name,
+            "space_atoms": self.backend.atom_count(),
+            "rates": len(snapshot.rates),
+            "rate_version": snapshot.version,
+            "evicted_expired": self._evicted_expired,
+            "evicted_capacity": self._evicted_capacity,
+            "rate_subscribers": len(self.events),
+            "rate_events_delivered": self.events.events_delivered,
+            "routing": self.router.stats(),
+            "query_cache": self._query_cache.stats(),
+            "route_cache": self._route_cache.stats(),
+        }
+
+    def _memoized(self, query: str, args: tuple, compute):
+        """Returns compute(*args), reusing the last result while no path, rate or quarantine has changed since."""
+        key = (query, args)
+        version = (self._path_generation, self.router.generation, self._snapshot.version)
+        result = self._query_cache.get(key, version)
+        if result is _MISSING:
+            result = compute(*args)
+            self._query_cache.put(key, version, result)
+        return result
+
+    def subscribe_rates(self, callback: Callable[[list[RateChange]], None], pairs=None,
+                        threshold_bps: float = 0.0) -> Subscription:
+        """
+        Calls `callback` with a batch of RateChange events whenever any of
+        `pairs` (all pairs if None) moves at least `threshold_bps` from the
+        rate last reported to it. Moves are measured from the current rates.
+        """
+        return self.events.subscribe(callback, pairs, threshold_bps, current=dict(self._snapshot.rates))
+
+    def snapshot(self) -> RateSnapshot:
+        """Returns the snapshot pinned in the current context, or the latest one."""
+        pinned = self._pinned.get()
+        if pinned is not None:
+            return pinned
+        if not self.is_rate_writer:
+            self._sync_from_shared()
+        return self._snapshot
+
+    def _sync_from_shared(self):
+        """
+        Adopts the pairs the shared table changed since the (epoch, version)
+        adopted last, or all of it when a new writer started another epoch.
+        Any thread may call this (through snapshot()), so it only swaps in a
+        new snapshot; a reader's backend holds paths and other facts, no rates.
+        """
+        try:
+            state = self._shared.state()
+            if state is None or state == self._shared_state:
+                return
+            with self._write_lock:
+                changes = self._shared.read_since(self._shared_state)
+                if changes is None:
+                    return
+                state, rates, expires_at, removed = changes
+                if self._shared_state is not None and state[0] != self._shared_state[0]:
+                    # The new writer's versions may repeat ones cached here
+                    self._path_generation += 1
+                self._adopt(rates, state[1], replace=removed is None, expires_at=expires_at, mirror=False,
+                            removed=removed or ())
+                self._shared_state = state
+        except TimeoutError as e:
+            # Keep serving the rates adopted last until a writer takes over
+            print(f"[ERROR in RAG] {e}")
+
+    def _read_in_place(self, from_currency: str, to_currency: str) -> tuple[int, float | None, float] | None:
+        """
+        In a reader outside a pinned session, one pair straight from the
+        shared table's mapping: (version, rate, expires_at). None where the
+        snapshot answers instead.
+        """
+        if self.is_rate_writer or self._pinned.get() is not None:
+            return None
+        try:
+            return self._shared.lookup(from_currency, to_currency)
+        except TimeoutError as e:
+            print(f"[ERROR in RAG] {e}")
+            return None
+
+    def latest_snapshot(self) -> RateSnapshot:
+        """The newest published snapshot, ignoring pins and without syncing from the shared table."""
+        return self._snapshot
+
+    def pinned_snapshot(self) -> RateSnapshot | None:
+        """The snapshot pinned in the current context, if any."""
+        return self._pinned.get()
+
+    def pin(self) -> RateSnapshot:
+        """
+        Pins the latest snapshot to the current context (one agent session), so
+        every later lookup in that session is quoted on the same rate version.
+        """
+        self._pinned.set(None)
+        snapshot = self.snapshot()
+        self._pinned.set(snapshot)
+        return snapshot
+
+    def unpin(self):
+        """Releases the current context's pinned snapshot."""
+        self._pinned.set(None)
+
+    def save_snapshot(self, path: str):
+        """Persists the latest fresh rates and the rest of the space to `path`."""
+        snapshot = self._snapshot
+        now = time.time()
+        rates = {key: rate for key, rate in snapshot.rates.items() if snapshot.expires_at[key] > now}
+        write_snapshot(path, snapshot.version, rates, dict(snapshot.expires_at), self.backend.dump_facts())
+        print(f"[KG LOG] Saved knowledge graph snapshot v{snapshot.version} to {path}")
+
+    def load_snapshot(self, path: str) -> bool:
+        """
+        Restores a snapshot written by save_snapshot into this (fresh) graph.
+        Returns False when there is no snapshot, so the caller can build the graph instead.
+        """
+        saved = read_snapshot(path)
+        if saved is None:
+            return False
+        version, rates, expires_at, atoms_text = saved
+        if expires_at is None:
+            # Older files carry no expiry: count the rates as quoted when the file was written
+            saved_at = os.path.getmtime(path)
+            expires_at = {key: saved_at + self.rate_ttl if self.rate_ttl is not None else math.inf for key in rates}
+        self.backend.load_facts(atoms_text)
+        self._path_generation += 1
+        self._sync_route_fees()
+        # Keep rate versions monotonic across restarts for auditing; rates keep their original expiry
+        self._adopt(rates, max(version, self._snapshot.version + 1), expires_at=expires_at)
+        print(f"[KG LOG] Loaded knowledge graph snapshot v{version} from {path}")
+        return True
+
+    def add_path(self, from_currency: str, to_currency: str, via: str, cost: float):
+        """Records that `from` converts to `to` via the `via` chain at the given cost."""
+        self.backend.add_path(from_currency, to_currency, via, cost)
+        self._path_generation += 1
+        self.router.set_fee((from_currency, via), cost)
+
+    def _sync_route_fees(self):
+        """A path fact's cost is charged as a fee on its first hop, into the `via` chain."""
+        for from_currency, _, via, cost in self.backend.path_facts():
+            self.router.set_fee((from_currency, via), cost)
+
+    def set_liquidity(self, from_currency: str, to_currency: str, depth: float, fixed_fee: float = 0.0):
+        """
+        Describes a conversion's market depth (in `from` units; slippage grows
+        as an amount approaches it) and its fixed fee (in `from` units).
+        """
+        self.splitter.set_liquidity((from_currency, to_currency), depth, fixed_fee)
+        self._path_generation += 1
+
+    def _candidate_routes(self, from_currency: str, to_currency: str) -> list[tuple[str, ...]]:
+        """
+        The best multi-hop route plus every declared single-chain corridor,
+        cheapest first, leaving out corridors through a quarantined edge.
+        """
+        candidates = [(via_cost, (from_currency, via, to_currency))
+                      for via, via_cost in self.backend.paths(from_currency, to_currency)
+                      if not self._quarantined_hop((from_currency, via, to_currency))]
+        candidates.sort()
+        routes = [hops for _, hops in candidates]
+        best = self.router.route(from_currency, to_currency)
+        if best is not None and best.hops not in routes:
+            routes.insert(0, best.hops)
+        return routes
+
+    def _quarantined_hop(self, hops: tuple[str, ...]) -> bool:
+        return any(self.router.is_quarantined(pair) for pair in zip(hops, hops[1:]))
+
+    def _split_routes(self, from_currency: str, to_currency: str,
+                      snapshot: RateSnapshot) -> list[tuple[tuple[str, ...], list[float]]]:
+        """The candidate routes with fresh rates in `snapshot`, each with its fee-adjusted per-hop rates."""
+        routes = []
+        for hops in self._candidate_routes(from_currency, to_currency):
+            rates = [snapshot.get(*pair) for pair in zip(hops, hops[1:])]
+            if None not in rates:
+                fees = [self.router.fee(pair) for pair in zip(hops, hops[1:])]
+                routes.append((hops, [rate * (1 - fee) for rate, fee in zip(rates, fees)]))
+        return routes
+
+    @staticmethod
+    def _split_quote(amount: float, quotes: list[RouteQuote], version: int) -> dict:
+        expected = sum(quote.expected_output for quote in quotes)
+        return {
+            "amount_in": amount,
+            "expected_output": expected,
+            "effective_rate": expected / amount if amount else None,
+            "rate_version": version,
+            "splits": [{"hops": list(quote.hops), "via": list(quote.via), "share": round(quote.amount_in / amount, 4),
+                        "amount_in": quote.amount_in, "expected_output": quote.expected_output} for quote in quotes],
+        }
+
+    def quote_split(self, from_currency: str, to_currency: str, amount: float) -> dict | None:
+        """
+        Splits `amount` across the candidate routes to maximize the expected
+        output given each edge's liquidity curve and fees, using the pinned (or
+        latest) fresh rates. Returns None when no route has fresh rates.
+        """
+        snapshot = self.snapshot()
+        routes = self._split_routes(from_currency, to_currency, snapshot)
+        if not routes:
+            return None
+        return self._split_quote(amount, self.splitter.split(amount, routes), snapshot.version)
+
+    def _bucket(self, amount: float | None) -> int | None:
+        """Amounts within `amount_bucket` of each other (relative) share a bucket."""
+        if not amount or amount <= 0:
+            return None
+        return round(math.log(amount) / math.log1p(self.amount_bucket))
+
+    def _plan_route(self, from_currency: str, to_currency: str, bucket: int | None, snapshot: RateSnapshot):
+        """
+        What quote_route() answers with for a whole amount bucket: a split as
+        (hops, per-hop rates, fraction of the amount) per route, the cheapest
+        multi-hop route, or the cheapest declared path.
+        """
+        if bucket is not None:
+            routes = self._split_routes(from_currency, to_currency, snapshot)
+            if routes:
+                amount = (1 + self.amount_bucket) ** bucket
+                quotes = self.splitter.split(amount, routes)
+                if quotes and quotes[0].via:
+                    rates = dict(routes)
+                    return "split", [(quote.hops, rates[quote.hops], quote.amount_in / amount) for quote in quotes]
+        route = self.router.route(from_currency, to_currency)
+        if route and route.via:
+            return "route", {"best_path_via": route.via[0], "route": route.as_dict()}
+        via = self._best_path(from_currency, to_currency)
+        if via:
+            return "path", {"best_path_via": via}
+        return None
+
+    def quote_route(self, from_currency: str, to_currency: str, amount: float | None = None) -> dict | None:
+        """
+        How to convert `amount` (or any amount, if None): {"best_path_via": ...}
+        plus the split across routes for an amount that benefits from one, or
+        else the cheapest multi-hop route. Plans are cached per amount bucket
+        until a rate, fee or path changes; a cached split is rescaled to the
+        exact amount. Returns None when the currencies are not connected.
+        """
+        corridor = (from_currency.strip().upper(), to_currency.strip().upper())
+        bucket = self._bucket(amount)
+        snapshot = self.snapshot()
+        # Splits are planned on `snapshot`, multi-hop routes on the router's own (latest) rates
+        version = (self._path_generation, self.router.state(), snapshot.version)
+        plan = self._route_cache.get((corridor, bucket), version)
+        if plan is _MISSING:
+            plan = self._plan_route(*corridor, bucket, snapshot)
+            self._cache_route((corridor, bucket), version, plan)
+        if plan is None:
+            return None
+        kind, detail = plan
+        if kind != "split":
+            return detail
+        quotes = [RouteQuote(hops, amount * fraction, self.splitter.output(hops, rates, amount * fraction))
+                  for hops, rates, fraction in detail]
+        return {"best_path_via": quotes[0].via[0], "split": self._split_quote(amount, quotes, snapshot.version)}
+
+    def failover_routes(self, from_currency: str, to_currency: str) -> list[Route]:
+        """
+        Up to `failover_depth` routes sharing no intermediate currency, best
+        first (RoutingEngine.disjoint_routes), cached until a rate, fee or
+        path changes. Hot corridors have them ready after every refresh.
+        """
+        corridor = (from_currency.strip().upper(), to_currency.strip().upper())
+        version = (self._path_generation, self.router.state())
+        routes = self._route_cache.get((corridor, "failover"), version)
+        if routes is _MISSING:
+            routes = self.router.disjoint_routes(*corridor, self.failover_depth)
+            self._cache_route((corridor, "failover"), version, routes)
+        return routes
+
+    def _cache_route(self, key, version: tuple, plan):
+        """Caches a plan unless paths or the router's rates moved while it was computed (it would not match `version`)."""
+        if version[:2] == (self._path_generation, self.router.state()):
+            self._route_cache.put(key, version, plan)
+
+    def next_route(self, from_currency: str, to_currency: str, avoid=()) -> Route | None:
+        """The best failover route that passes through none of the currencies in `avoid` (e.g. a chain that is down)."""
+        avoid = set(avoid)
+        return next((route for route in self.failover_routes(from_currency, to_currency)
+                     if avoid.isdisjoint(route.via)), None)
+
+    def failover_avoiding(self, currency: str) -> dict[str, dict]:
+        """For every hot corridor, the best failover route that does not go through `currency`."""
+        failover = {}
+        for from_currency, to_currency in self.hot_corridors:
+            route = self.next_route(from_currency, to_currency, avoid={currency})
+            if route is not None:
+                failover[f"{from_currency}-{to_currency}"] = route.as_dict()
+        return failover
 
-    def update_rate(self, from_currency: str, to_currency: str, rate: float):
-        """Adds or updates a rate atom in the knowledge graph."""
-        self.metta.space().add_atom(E(S("rate"), S(from_currency), S(to_currency), ValueAtom(rate)))
-        print(f"[KG LOG] Updated rate for {from_currency}->{to_currency} to {rate}")
+    def add_hot_corridor(self, from_currency: str, to_currency: str, amounts=(None,)):
+        """Plans `from` -> `to` for `amounts` after every rate refresh (see warm_routes)."""
+        self.hot_corridors[(from_currency, to_currency)] = tuple(amounts)
+
+    def warm_routes(self) -> int:
+        """
+        Plans every hot corridor against the latest rates, failover routes
+        included, so their next quote or failover is a cache hit.
+        """
+        warmed = 0
+        for (from_currency, to_currency), amounts in self.hot_corridors.items():
+            try:
+                for amount in amounts:
+                    self.quote_route(from_currency, to_currency, amount)
+                    warmed += 1
+                self.failover_routes(from_currency, to_currency)
+            except Exception as e:
+                print(f"[ERROR in RAG] Could not plan {from_currency}->{to_currency}: {e}")
+        return warmed
+
+    def find_route(self, from_currency: str, to_currency: str) -> Route | None:
+        """
+        The cheapest multi-hop route over the latest rates (path costs count
+        as fees), or None when the currencies are not connected. A reader
+        process first picks up the shared table's latest rates.
+        """
+        if not self.is_rate_writer:
+            self._sync_from_shared()
+        return self.router.route(from_currency, to_currency)
+
+    def quote_batch(self, requests) -> BatchQuote:
+        """
+        Quotes many (from, to, amount) conversions in one pass over the
+        routing tables, on the latest rates (synced from the shared table in
+        a reader process); see RoutingEngine.quote_batch. The result's
+        rate_version is the version of the rates the router priced with.
+        """
+        if not self.is_rate_writer:
+            self._sync_from_shared()
+        return self.router.quote_batch(requests)
 
     def find_best_path(self, from_currency: str, to_currency: str) -> str | None:
         """
         Queries the knowledge graph to find the most cost-effective intermediate
-        currency ('via') for a conversion.
+        currency ('via') for a conversion, skipping paths through a quarantined
+        edge. Repeated queries are answered from the query cache until a path,
+        rate or quarantine changes.
         """
         try:
-            query_str = f'!(match &self (path {from_currency} {to_currency} $via $cost) ($via $cost))'
-            results = self.metta.run(query_str)
-
-            if not results or not results[0]:
-                return None
-            
-            best_item = min(results[0], key=lambda item: float(str(item.get_children()[1])))
-            best_path_via = str(best_item.get_children()[0])
-            return best_path_via
+            corridor = (from_currency.strip().upper(), to_currency.strip().upper())
+            return self._memoized("find_best_path", corridor, self._best_path)
         except Exception as e:
             print(f"[ERROR in RAG] Could not find best path: {e}")
             return None
 
-    def get_exchange_rate(self, from_currency: str, to_currency: str) -> float | None:
-        """Queries the knowledge graph for a specific exchange rate."""
-        try:
-            query_str = f'!(match &self (rate {from_currency} {to_currency} $rate) $rate)'
-            result = self.metta.run(query_str)
-            if result and result[0]:
-                return float(str(result[0][0]))
-            return None
-        except Exception as e:
-            print(f"[ERROR in RAG] Could not query exchange rate: {e}")
+    def _best_path(self, from_currency: str, to_currency: str) -> str | None:
+        paths = [(via, cost) for via, cost in self.backend.paths(from_currency, to_currency)
+                 if not self._quarantined_hop((from_currency, via, to_currency))]
+        best = min(paths, key=lambda path: path[1], default=None)
+        if best is None:
             return None
+        return best[0]
+
+    def get_exchange_rate(self, from_currency: str, to_currency: str) -> float | None:
+        """
+        Returns the fresh rate for a pair from the pinned (or latest)
+        snapshot; reader processes read unpinned pairs in place from the
+        shared table.
+        """
+        entry = self._read_in_place(from_currency, to_currency)
+        if entry is None:
+            return self.snapshot().get(from_currency, to_currency)
+        _, rate, expires_at = entry
+        return rate if rate is not None and time.time() < expires_at else None
+
+    def lookup_rate(self, from_currency: str, to_currency: str) -> dict:
+        """Like get_exchange_rate, but says whether the rate is fresh, stale or missing."""
+        entry = self._read_in_place(from_currency, to_currency)
+        if entry is None:
+            return self.snapshot().lookup(from_currency, to_currency)
+        return _rate_status(*entry)
+
+    def rate_stats(self, from_currency: str, to_currency: str, window: float | None = None) -> dict | None:
+        """Mean, min/max and volatility of a pair over the last `window` seconds (all history if None)."""
+        since = time.time() - window if window is not None else None
+        return self.history.stats((from_currency, to_currency), since)
+
+    def rate_at(self, from_currency: str, to_currency: str, timestamp: float) -> float | None:
+        """The rate that was in force for a pair at `timestamp`."""
+        return self.history.rate_at((from_currency, to_currency), timestamp)
+
+    def inconsistent_rates(self, base: str = "USD", tolerance: float = 0.01) -> list[dict]:
+        """Fresh rates that disagree with the cross rates triangulated from all the others."""
+        snapshot = self.snapshot()
+        now = time.time()
+        fresh = {key: rate for key, rate in snapshot.rates.items() if snapshot.expires_at[key] > now}
+        return inconsistent_quotes(fresh, base, tolerance)
 
+    def get_rates(self, pairs) -> dict[tuple[str, str], float | None]:
+        """Answers a batch of (from, to) lookups from one consistent snapshot."""
+        snapshot = self.snapshot()
+        return {pair: snapshot.get(*pair) for pair in pairs}
@@ -0,0 +1,200 @@
+"""
+Storage backends behind FinancialRAG.
+
+FinancialRAG keeps rates in versioned snapshots and only asks its backend to
+hold the facts themselves: one rate per pair and the (from, to, via, cost)
+conversion paths. MeTTaBackend stores paths and other facts as atoms in a
+hyperon space so the MeTTa reasoning features keep working; NativeBackend
+keeps them in plain dicts for deployments that only need rate and path lookups.
+
+Rates churn on every feed tick, and hyperon 0.2.10 aborts the process (a
+non-unwinding panic in its atom index) once replace_atom/remove_atom run
+against a space of a few thousand atoms. So MeTTaBackend keeps rates in a
+dict too unless asked to mirror them into the space (rate_atoms=True), which
+is only safe for small graphs.
+"""
+import re
+
+from hyperon import MeTTa, S, E, V, ValueAtom
+
+RATE_PATTERN = E(S("rate"), V("from"), V("to"), V("rate"))
+_PATH_FACT = re.compile(r"^\(path (\S+) (\S+) (\S+) (\S+)\)$")
+
+
+def atom_value(atom) -> float:
+    """Reads the number held by a grounded atom without going through str()."""
+    return float(atom.get_object().value)
+
+
+class KnowledgeBackend:
+    """The operations FinancialRAG needs from a fact store."""
+    name = "base"
+
+    def existing_rates(self) -> dict[tuple[str, str], float]:
+        """Rates already present when FinancialRAG attaches (one per pair)."""
+        raise NotImplementedError
+
+    def set_rate(self, key: tuple[str, str], rate: float):
+        raise NotImplementedError
+
+    def remove_rate(self, key: tuple[str, str]):
+        raise NotImplementedError
+
+    def add_path(self, from_currency: str, to_currency: str, via: str, cost: float):
+        """Records a path fact; an existing one for the same (from, to, via) gets the new cost."""
+        raise NotImplementedError
+
+    def paths(self, from_currency: str, to_currency: str) -> list[tuple[str, float]]:
+        """All (via, cost) routes known for a corridor."""
+        raise NotImplementedError
+
+    def path_facts(self) -> list[tuple[str, str, str, float]]:
+        """Every (from, to, via, cost) path fact."""
+        raise NotImplementedError
+
+    def atom_count(self) -> int:
+        raise NotImplementedError
+
+    def dump_facts(self) -> str:
+        """Every non-rate fact as MeTTa source text, for snapshots."""
+        raise NotImplementedError
+
+    def load_facts(self, text: str):
+        raise NotImplementedError
+
+
+class MeTTaBackend(KnowledgeBackend):
+    name = "metta"
+
+    def __init__(self, metta: MeTTa, rate_atoms: bool = False):
+        self.metta = metta
+        self.rate_atoms = rate_atoms
+        self._rates: dict[tuple[str, str], float] = {}
+        self._rates_read = False
+        # Keyed (from, to) -> atom index. With rate_atoms the space holds
+        # exactly one rate atom per pair; this index tracks it so updates can replace it.
+        self._rate_atoms: dict[tuple[str, str], object] = {}
+        # Prepared (path FROM TO $via $cost) patterns, built once per corridor
+        # and queried against the space directly instead of via metta.run.
+        self._path_patterns: dict[tuple[str, str], object] = {}
+
+    def existing_rates(self) -> dict[tuple[str, str], float]:
+        """
+        Rates held by the backend, starting with the rate atoms already in the
+        space (the last one per pair), which are read once. With rate_atoms they
+        are indexed, duplicates removed, so updates replace them; otherwise
+        they are left alone and the rates live in the dict from then on.
+        """
+        if self._rates_read:
+            return dict(self._rates)
+        self._rates_read = True
+        space = self.metta.space()
+        for bindings in space.query(RATE_PATTERN):
+            key = (bindings["from"].get_name(), bindings["to"].get_name())
+            if self.rate_atoms:
+                atom = E(S("rate"), S(key[0]), S(key[1]), bindings["rate"])
+                if key in self._rate_atoms:
+                    space.remove_atom(self._rate_atoms[key])
+                self._rate_atoms[key] = atom
+            self._rates[key] = atom_value(bindings["rate"])
+        return dict(self._rates)
+
+    def set_rate(self, key: tuple[str, str], rate: float):
+        self._rates[key] = rate
+        if not self.rate_atoms:
+            return
+        atom = E(S("rate"), S(key[0]), S(key[1]), ValueAtom(rate))
+        previous = self._rate_atoms.get(key)
+        if previous is None:
+            self.metta.space().add_atom(atom)
+        else:
+            self.metta.space().replace_atom(previous, atom)
+        self._rate_atoms[key] = atom
+
+    def remove_rate(self, key: tuple[str, str]):
+        self._rates.pop(key, None)
+        atom = self._rate_atoms.pop(key, None)
+        if atom is not None:
+            self.metta.space().remove_atom(atom)
+
+    def add_path(self, from_currency: str, to_currency: str, via: str, cost: float):
+        space = self.metta.space()
+        atom = E(S("path"), S(from_currency), S(to_currency), S(via), ValueAtom(cost))
+        for bindings in space.query(E(S("path"), S(from_currency), S(to_currency), S(via), V("cost"))):
+            space.replace_atom(E(S("path"), S(from_currency), S(to_currency), S(via), bindings["cost"]), atom)
+            return
+        space.add_atom(atom)
+
+    def _path_pattern(self, from_currency: str, to_currency: str):
+        key = (from_currency, to_currency)
+        pattern = self._path_patterns.get(key)
+        if pattern is None:
+            pattern = E(S("path"), S(from_currency), S(to_currency), V("via"), V("cost"))
+            self._path_patterns[key] = pattern
+        return pattern
+
+    def paths(self, from_currency: str, to_currency: str) -> list[tuple[str, float]]:
+        results = self.metta.space().query(self._path_pattern(from_currency, to_currency))
+        return [(bindings["via"].get_name(), atom_value(bindings["cost"])) for bindings in results]
+
+    def path_facts(self) -> list[tuple[str, str, str, float]]:
+        pattern = E(S("path"), V("from"), V("to"), V("via"), V("cost"))
+        return [(bindings["from"].get_name(), bindings["to"].get_name(), bindings["via"].get_name(),
+                 atom_value(bindings["cost"])) for bindings in self.metta.space().query(pattern)]
+
+    def atom_count(self) -> int:
+        # Rates kept out of the space still count as facts
+        return self.metta.space().atom_count() + (0 if self.rate_atoms else len(self._rates))
+
+    def dump_facts(self) -> str:
+        rate_symbol = S("rate")
+        return "\n".join(str(atom) for atom in self.metta.space().get_atoms()
+                         if not (atom.get_children() and atom.get_children()[0] == rate_symbol))
+
+    def load_facts(self, text: str):
+        space = self.metta.space()
+        for atom in self.metta.parse_all(text):
+            space.add_atom(atom)
+
+
+class NativeBackend(KnowledgeBackend):
+    """Dict-based store; MeTTa facts other than paths are ignored when loading."""
+    name = "native"
+
+    def __init__(self):
+        self._rates: dict[tuple[str, str], float] = {}
+        self._paths: dict[tuple[str, str], dict[str, float]] = {}
+
+    def existing_rates(self) -> dict[tuple[str, str], float]:
+        return dict(self._rates)
+
+    def set_rate(self, key: tuple[str, str], rate: float):
+        self._rates[key] = rate
+
+    def remove_rate(self, key: tuple[str, str]):
+        self._rates.pop(key, None)
+
+    def add_path(self, from_currency: str, to_currency: str, via: str, cost: float):
+        self._paths.setdefault((from_currency, to_currency), {})[via] = cost
+
+    def paths(self, from_currency: str, to_currency: str) -> list[tuple[str, float]]:
+        return list(self._paths.get((from_currency, to_currency), {}).items())
+
+    def path_facts(self) -> list[tuple[str, str, str, float]]:
+        return [(from_currency, to_currency, via, cost)
+                for (from_currency, to_currency), vias in self._paths.items() for via, cost in vias.items()]
+
+    def atom_count(self) -> int:
+        return len(self._rates) + sum(len(vias) for vias in self._paths.values())
+
+    def dump_facts(self) -> str:
+        return "\n".join(f"(path {from_currency} {to_currency} {via} {cost!r})"
+                         for (from_currency, to_currency), vias in self._paths.items()
+                         for via, cost in vias.items())
+
+    def load_facts(self, text: str):
+        for line in text.splitlines():
+            match = _PATH_FACT.match(line.strip())
+            if match:
+                from_currency, to_currency, via, cost = match.groups()
+                self.add_path(from_currency, to_currency, via, float(cost))
@@ -0,0 +1,125 @@
+"""
+Async access to the knowledge graph from a dedicated worker thread.
+
+The uAgents handlers and the FastAPI app share one asyncio event loop, so any
+MeTTa query run inline stalls every other message and request. All KG work
+goes through a single "kg-worker" thread instead, and calls issued in the
+same loop iteration are batched into one job on it; concurrent quote batches
+are priced together in one pass over the routing tables.
+
+The agents send every backend write (rate ingestion, path costs, compaction,
+snapshots) and every backend query through it. Work elsewhere, such as the
+payment tools in the default thread pool or the arbitrage detector's thread,
+only reads immutable rate snapshots and the routing engine, which has its
+own lock; a reader process syncing from the shared rate table swaps in a new
+snapshot without writing the backend.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from financerag import FinancialRAG
+from routing import BatchQuote
+
+_UNSET = object()
+
+
+class KnowledgeGraphExecutor:
+    def __init__(self, rag: FinancialRAG):
+        self.rag = rag
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kg-worker")
+        # Work submitted since the last flush: (context, call, future) and (requests, future)
+        self._calls: list[tuple[contextvars.Context, functools.partial, asyncio.Future]] = []
+        self._quotes: list[tuple[list, asyncio.Future]] = []
+        self._flush_scheduled = False
+        self.jobs = 0
+        self.calls = 0
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a synchronous KG function (or tool) on the worker thread. It sees the
+        caller's context variables, and any it sets (e.g. a pinned rate snapshot)
+        are copied back, so it behaves as if it had been called inline.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.create_future()
+        self._calls.append((context, functools.partial(func, *args, **kwargs), future))
+        self._schedule_flush(loop)
+        result = await future
+        for var, value in context.items():
+            if var.get(_UNSET) is not value:
+                var.set(value)
+        return result
+
+    async def quote_batch(self, requests) -> BatchQuote:
+        """FinancialRAG.quote_batch; batches submitted together are quoted in one call."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._quotes.append((list(requests), future))
+        self._schedule_flush(loop)
+        return await future
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush, loop)
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        self._flush_scheduled = False
+        calls, self._calls = self._calls, []
+        quotes, self._quotes = self._quotes, []
+        self.jobs += 1
+        self.calls += len(calls) + len(quotes)
+        try:
+            job = loop.run_in_executor(self._pool, self._run_batch, calls, [requests for requests, _ in quotes])
+        except RuntimeError as e:  # shut down
+            job = loop.create_future()
+            job.set_exception(e)
+        job.add_done_callback(functools.partial(self._resolve, calls, quotes))
+
+    def _run_batch(self, calls, quote_requests):
+        outcomes = [_outcome(context.run, call) for context, call, _ in calls]
+        if quote_requests:
+            outcomes.append(_outcome(self._quote_together, quote_requests))
+        return outcomes
+
+    def _quote_together(self, batches: list[list]) -> list[BatchQuote]:
+        combined = self.rag.quote_batch([request for requests in batches for request in requests])
+        quotes, start = [], 0
+        for requests in batches:
+            quotes.append(combined[start:start + len(requests)])
+            start += len(requests)
+        return quotes
+
+    @staticmethod
+    def _resolve(calls, quotes, job: asyncio.Future):
+        error = asyncio.CancelledError() if job.cancelled() else job.exception()
+        outcomes = job.result() if error is None else [(None, error)] * (len(calls) + bool(quotes))
+        for (_, _, future), outcome in zip(calls, outcomes):
+            _settle(future, *outcome)
+        if quotes:
+            batches, failure = outcomes[-1]
+            for k, (_, future) in enumerate(quotes):
+                _settle(future, batches[k] if failure is None else None, failure)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+def _outcome(func, *args) -> tuple[object, Exception | None]:
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, e
+
+
+def _settle(future: asyncio.Future, result, error: BaseException | None):
+    # The caller may have stopped waiting (cancelled) in the meantime
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,62 @@
+"""
+Compact on-disk snapshots of the financial knowledge graph.
+
+Layout (little-endian):
+    header   : magic, rate version, rate count, text length
+    rates    : fixed-width (from, to, rate, expires_at) records, readable straight from an mmap
+    atoms    : every other atom in the space as MeTTa source text
+
+Version 1 files (magic KGSNAP01) have (from, to, rate) records without expiry.
+"""
+import mmap
+import os
+import struct
+
+MAGIC = b"KGSNAP02"
+_MAGIC_V1 = b"KGSNAP01"
+_HEADER = struct.Struct("<8sQII")
+_RATE = struct.Struct("<16s16sdd")
+_RATE_V1 = struct.Struct("<16s16sd")
+
+
+def write_snapshot(path: str, version: int, rates: dict[tuple[str, str], float],
+                   expires_at: dict[tuple[str, str], float], atoms_text: str):
+    """Writes a snapshot atomically (temp file + rename) so readers never see a partial file."""
+    text = atoms_text.encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, version, len(rates), len(text)))
+        for (from_currency, to_currency), rate in rates.items():
+            if len(from_currency) > 16 or len(to_currency) > 16:
+                raise ValueError(f"Currency codes longer than 16 characters cannot be snapshotted: {from_currency}->{to_currency}")
+            f.write(_RATE.pack(from_currency.encode("ascii"), to_currency.encode("ascii"), rate,
+                               expires_at[(from_currency, to_currency)]))
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> tuple[int, dict[tuple[str, str], float], dict[tuple[str, str], float] | None, str] | None:
+    """
+    Memory-maps a snapshot and returns (version, rates, expires_at, atoms_text),
+    or None if there is none. `expires_at` is None for a version 1 file.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, rate_count, text_length = _HEADER.unpack_from(mm, 0)
+        if magic not in (MAGIC, _MAGIC_V1):
+            raise ValueError(f"{path} is not a knowledge-graph snapshot")
+        record = _RATE if magic == MAGIC else _RATE_V1
+        offset = _HEADER.size
+        rates, expires_at = {}, {}
+        for _ in range(rate_count):
+            from_currency, to_currency, rate, *expiry = record.unpack_from(mm, offset)
+            key = (from_currency.rstrip(b"\0").decode("ascii"), to_currency.rstrip(b"\0").decode("ascii"))
+            rates[key] = rate
+            if expiry:
+                expires_at[key] = expiry[0]
+            offset += record.size
+        atoms_text = mm[offset:offset + text_length].decode("utf-8")
+    return version, rates, expires_at if magic == MAGIC else None, atoms_text
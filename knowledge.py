@@ -1,12 +1,48 @@
 from hyperon import MeTTa, E, S, ValueAtom # This is in python3.12
 
-def initialize_financial_knowledge_graph(metta: MeTTa):
+# (from, to, via, cost) conversion corridors.
+# For Adding more cryptos , we just add them in this relationship graph
+# The costs are starting values; ChainCostModel replaces them from live gas and settlement times
+CONVERSION_PATHS = [
+    ("INR", "USD", "ETH", 0.001),
+    ("INR", "USD", "MATIC", 0.0008),
+]
+
+# Fiat currencies only settle over a chain, never directly with each other
+FIAT_CURRENCIES = {"INR", "USD"}
+
+# (from, to, depth, fixed fee) liquidity of the on-ramps, both in `from` units.
+# Amounts approaching the depth take noticeable slippage.
+LIQUIDITY_CURVES = [
+    ("INR", "ETH", 5_000_000, 20.0),
+    ("INR", "MATIC", 1_000_000, 5.0),
+]
+
+# (from, to, amounts) corridors planned after every rate refresh; None plans the route
+# for any amount, numbers the split for transfers of about that size (in `from` units)
+HOT_CORRIDORS = [
+    ("INR", "USD", (None, 10_000, 100_000, 1_000_000)),
+]
+
+def initialize_financial_knowledge_graph(graph):
     """
-    Populates the MeTTa space with the structural knowledge of valid
-    conversion paths and their associated costs.
+    Populates the knowledge graph with the structural knowledge of valid
+    conversion paths and their associated costs. `graph` is either a MeTTa
+    instance or a FinancialRAG (whatever its backend).
     Rates are no longer stored here; they will be added dynamically.
     """
-    metta.space().add_atom(E(S("path"), S("INR"), S("USD"), S("ETH"), ValueAtom(0.001)))
-    metta.space().add_atom(E(S("path"), S("INR"), S("USD"), S("MATIC"), ValueAtom(0.0008)))
-    
-    # For Adding more cryptos , we just add them in this relationship graph
\ No newline at end of file
+    for from_currency, to_currency, via, cost in CONVERSION_PATHS:
+        if isinstance(graph, MeTTa):
+            graph.space().add_atom(E(S("path"), S(from_currency), S(to_currency), S(via), ValueAtom(cost)))
+        else:
+            graph.add_path(from_currency, to_currency, via, cost)
+
+def apply_liquidity_curves(rag):
+    """Loads LIQUIDITY_CURVES into a FinancialRAG for amount-aware split routing."""
+    for from_currency, to_currency, depth, fixed_fee in LIQUIDITY_CURVES:
+        rag.set_liquidity(from_currency, to_currency, depth, fixed_fee)
+
+def apply_hot_corridors(rag):
+    """Registers HOT_CORRIDORS with a FinancialRAG so their routes are planned ahead of quotes."""
+    for from_currency, to_currency, amounts in HOT_CORRIDORS:
+        rag.add_hot_corridor(from_currency, to_currency, amounts)
@@ -7,22 +7,28 @@ CHAIN_CONFIG = {
         "rpc": "https://sepolia.infura.io/v3/490a392c2a854d1387b486166f7d1dfa",
         "contract": "0x7B2f8442e4e4bf1F84FFb38C2709C742e9bb3150",
         "symbol": "ETH",
-        "gas_price_gwei": 10
+        "gas_price_gwei": 10,
+        "block_time_seconds": 12
     },
     "MATIC": {
         "rpc": "https://polygon-amoy.infura.io/v3/490a392c2a854d1387b486166f7d1dfa",
         "contract": "0xEdfeB26543baD79CD58aff55eD4484D515a769e7",
         "symbol": "MATIC",
-        "gas_price_gwei": 50
+        "gas_price_gwei": 50,
+        "block_time_seconds": 2
     },
     "RSK": {
         "rpc": "https://public-node.testnet.rsk.co",
         "contract": "0xRSKContractAddress",
         "symbol": "RBTC",
-        "gas_price_gwei": 20
+        "gas_price_gwei": 20,
+        "block_time_seconds": 30
     }
 }
 
+# Gas limit of one PaymentSender.send transfer
+TRANSFER_GAS_LIMIT = 200000
+
 
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 if not PRIVATE_KEY:
@@ -37,8 +43,11 @@ except FileNotFoundError:
 
 ABI = CONTRACT_ARTIFACT['abi']
 
-def send_native(chain: str, recipient: str, amount: float):
-    """Send native coin (ETH, POL, etc.) through the smart contract on any supported chain"""
+def send_native(chain: str, recipient: str, amount: float, gas_price_gwei: float | None = None):
+    """
+    Send native coin (ETH, POL, etc.) through the smart contract on any supported chain.
+    Pays `gas_price_gwei` (e.g. ChainCostModel's cached price) or, without one, the chain's current gas price.
+    """
     if not PRIVATE_KEY or "YOUR_PRIVATE_KEY_HERE" in PRIVATE_KEY:
         raise ValueError("Please replace 'YOUR_PRIVATE_KEY_HERE' with your actual private key.")
         
@@ -64,8 +73,8 @@ def send_native(chain: str, recipient: str, amount: float):
         "from": account.address,
         "value": amount_wei,
         "nonce": w3.eth.get_transaction_count(account.address),
-        "gas": 200000,
-        "gasPrice": w3.to_wei(config["gas_price_gwei"], "gwei")
+        "gas": TRANSFER_GAS_LIMIT,
+        "gasPrice": w3.to_wei(gas_price_gwei, "gwei") if gas_price_gwei else w3.eth.gas_price
     })
 
     signed_txn = w3.eth.account.sign_transaction(txn, PRIVATE_KEY)
@@ -0,0 +1,76 @@
+"""
+Consolidates quotes for the same pairs from several independent feeds.
+
+Every source's batch becomes a row of a (sources x pairs) matrix, with NaN
+where a source did not quote a pair, so the per-pair median, the outlier test
+and the final estimate are single vectorized passes over all pairs at once.
+"""
+import warnings
+
+import numpy as np
+
+
+def aggregate_quotes(batches: list[dict[tuple[str, str], float] | None], max_deviation: float = 0.02,
+                     method: str = "median", min_sources: int = 1, weights: list[float] | None = None,
+                     conflicts: dict | None = None) -> dict[tuple[str, str], tuple[float, float]]:
+    """
+    Combines one batch per source (None for a source that failed) into
+    {(from, to): (rate, confidence)}.
+
+    Quotes further than `max_deviation` (relative) from the pair's median are
+    dropped as outliers; the rate is then the median ("median") or the mean
+    ("trimmed_mean") of the remaining quotes. Confidence is the share of all
+    sources that contributed an inlier, scaled down as the inliers' relative
+    spread approaches `max_deviation`. Pairs with fewer than `min_sources`
+    inliers are left out.
+
+    When every quote for a pair is an outlier (e.g. two sources far apart),
+    the pair keeps the quote of the most trusted source that quoted it, by
+    `weights` (one per batch; the earlier source on ties), with confidence 0.
+    Such pairs are also added to `conflicts`, if given, as {pair: [quotes]}.
+    """
+    if method not in ("median", "trimmed_mean"):
+        raise ValueError(f"Unknown aggregation method {method!r}.")
+    if weights is None:
+        weights = [1.0] * len(batches)
+    elif len(weights) != len(batches):
+        raise ValueError(f"Got {len(weights)} source weights for {len(batches)} batches.")
+    trust = np.array([weight for batch, weight in zip(batches, weights) if batch], dtype=float)
+    healthy = [batch for batch in batches if batch]
+    if not healthy:
+        return {}
+    columns: dict[tuple[str, str], int] = {}
+    for batch in healthy:
+        for pair in batch:
+            columns.setdefault(pair, len(columns))
+    quotes = np.full((len(healthy), len(columns)), np.nan)
+    for row, batch in enumerate(healthy):
+        quotes[row, [columns[pair] for pair in batch]] = list(batch.values())
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        # Pairs whose quotes all disagree leave all-NaN columns; they are dropped below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(quotes, axis=0)
+        inliers = np.abs(quotes - median) <= max_deviation * np.abs(median)
+        kept = np.where(inliers, quotes, np.nan)
+        rates = np.nanmedian(kept, axis=0) if method == "median" else np.nanmean(kept, axis=0)
+        spread = np.nanstd(kept, axis=0) / np.abs(rates)
+    counts = inliers.sum(axis=0)
+    agreement = np.clip(1 - spread / max_deviation, 0, 1) if max_deviation > 0 else (spread == 0).astype(float)
+    confidence = counts / len(batches) * agreement
+
+    # Pairs whose quotes all disagree fall back to their most trusted source
+    quoted = ~np.isnan(quotes)
+    conflicted = np.nonzero((counts == 0) & quoted.any(axis=0))[0]
+    if len(conflicted):
+        preferred = np.argmax(np.where(quoted[:, conflicted], trust[:, np.newaxis], -np.inf), axis=0)
+        rates[conflicted] = quotes[preferred, conflicted]
+        confidence[conflicted] = 0.0
+        counts[conflicted] = 1
+        if conflicts is not None:
+            pairs = list(columns)
+            for column in conflicted.tolist():
+                conflicts[pairs[column]] = quotes[quoted[:, column], column].tolist()
+
+    return {pair: (float(rates[column]), round(float(confidence[column]), 4))
+            for pair, column in columns.items() if counts[column] >= max(min_sources, 1)}
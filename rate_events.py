@@ -0,0 +1,130 @@
+"""
+In-process notifications for rate moves.
+
+FinancialRAG publishes every new snapshot to a RateEventBus. Subscribers
+watch some pairs (or all of them) with a threshold in basis points and get
+one batched callback per snapshot listing the pairs that moved at least that
+far since they were last told about them, so small ticks accumulate until
+they matter instead of being dropped.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class RateChange:
+    """A pair that moved; new_rate is None when the pair was removed, old_rate when it is new."""
+    pair: tuple[str, str]
+    old_rate: float | None
+    new_rate: float | None
+    change_bps: float | None
+    version: int
+
+
+class Subscription:
+    def __init__(self, bus: "RateEventBus", callback: Callable[[list[RateChange]], None],
+                 pairs: set[tuple[str, str]] | None, threshold_bps: float):
+        self.bus = bus
+        self.callback = callback
+        self.pairs = pairs
+        self.threshold_bps = threshold_bps
+        # Rate each pair had when this subscriber was last notified of it
+        self.reference: dict[tuple[str, str], float] = {}
+        self.deliveries = 0
+
+    def unsubscribe(self):
+        self.bus.unsubscribe(self)
+
+    def _changes(self, rates: dict[tuple[str, str], float], removed, version: int) -> list[RateChange]:
+        changes = []
+        for pair, rate in rates.items():
+            old = self.reference.get(pair)
+            if old == rate:
+                continue
+            if old is None:
+                changes.append(RateChange(pair, None, rate, None, version))
+            else:
+                change_bps = (rate / old - 1) * 1e4
+                if abs(change_bps) < self.threshold_bps:
+                    continue
+                changes.append(RateChange(pair, old, rate, round(change_bps, 2), version))
+            self.reference[pair] = rate
+        for pair in removed:
+            old = self.reference.pop(pair, None)
+            if old is not None:
+                changes.append(RateChange(pair, old, None, None, version))
+        return changes
+
+
+class RateEventBus:
+    """
+    Callbacks run synchronously on the thread that published the snapshot
+    (the rate writer), after it is visible, so they should be quick: mark
+    something stale, or hand the batch to their own queue or event loop.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._all: list[Subscription] = []
+        self._by_pair: dict[tuple[str, str], list[Subscription]] = {}
+        self.events_delivered = 0
+
+    def subscribe(self, callback: Callable[[list[RateChange]], None], pairs=None, threshold_bps: float = 0.0,
+                  current: dict[tuple[str, str], float] | None = None) -> Subscription:
+        """
+        Calls `callback(changes)` whenever watched pairs (all pairs if `pairs`
+        is None) move at least `threshold_bps`. `current` seeds the reference
+        rates so only moves after subscribing are reported.
+        """
+        subscription = Subscription(self, callback, set(pairs) if pairs is not None else None, threshold_bps)
+        if current:
+            subscription.reference = {pair: rate for pair, rate in current.items()
+                                      if subscription.pairs is None or pair in subscription.pairs}
+        with self._lock:
+            if subscription.pairs is None:
+                self._all.append(subscription)
+            else:
+                for pair in subscription.pairs:
+                    self._by_pair.setdefault(pair, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription.pairs is None:
+                if subscription in self._all:
+                    self._all.remove(subscription)
+                return
+            for pair in subscription.pairs:
+                watchers = self._by_pair.get(pair, [])
+                if subscription in watchers:
+                    watchers.remove(subscription)
+                if not watchers:
+                    self._by_pair.pop(pair, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._all) + len({id(s) for watchers in self._by_pair.values() for s in watchers})
+
+    def publish(self, version: int, rates: dict[tuple[str, str], float], removed=()):
+        """Notifies every subscriber whose watched pairs crossed its threshold in this snapshot."""
+        with self._lock:
+            if not self._all and not self._by_pair:
+                return
+            # Per subscriber, only the part of the batch it watches
+            batches: dict[int, tuple[Subscription, dict, list]] = {id(s): (s, rates, list(removed)) for s in self._all}
+            for pair, rate in rates.items():
+                for subscription in self._by_pair.get(pair, ()):
+                    batches.setdefault(id(subscription), (subscription, {}, []))[1][pair] = rate
+            for pair in removed:
+                for subscription in self._by_pair.get(pair, ()):
+                    batches.setdefault(id(subscription), (subscription, {}, []))[2].append(pair)
+        for subscription, watched, gone in batches.values():
+            changes = subscription._changes(watched, gone, version)
+            if not changes:
+                continue
+            subscription.deliveries += 1
+            self.events_delivered += len(changes)
+            try:
+                subscription.callback(changes)
+            except Exception as e:
+                print(f"[KG LOG] Rate subscriber {getattr(subscription.callback, '__name__', subscription.callback)} failed: {e}")
@@ -0,0 +1,435 @@
+"""
+Background ingestion of streaming rate feeds into FinancialRAG.
+
+A RateFeedIngestor subscribes to one or more feed sources and writes every
+batch of quotes into the knowledge graph as it arrives, so the rate snapshot
+is always current and tools only have to read it. Sources yield
+{(from, to): rate} batches (or (rates, confidence) pairs when several feeds
+were aggregated); when quotes arrive faster than the graph absorbs them,
+pending batches are merged and only the newest rate per pair is written.
+"""
+import asyncio
+import json
+import math
+import time
+
+import requests
+
+from financerag import FinancialRAG
+from rate_aggregation import aggregate_quotes
+from triangulation import cross_rate_table
+
+# The simulated market: how much of each currency one USD buys. Every pair
+# (and its inverse) is triangulated from these, so adding a currency is one entry.
+MOCK_BASE = "USD"
+MOCK_BASE_QUOTES = {
+    "ETH": 0.2,
+    "MATIC": 90.0,
+    "INR": 0.0002,
+}
+MOCK_RATES = cross_rate_table(MOCK_BASE, MOCK_BASE_QUOTES)
+
+
+def parse_quotes(payload: dict) -> dict[tuple[str, str], float]:
+    """
+    Reads {"INR-ETH": 1000.0, ...} quotes, optionally nested under "rates",
+    into {(from, to): rate}. Keys that are not FROM-TO pairs are ignored.
+    """
+    if isinstance(payload.get("rates"), dict):
+        payload = payload["rates"]
+    quotes = {}
+    for pair, rate in payload.items():
+        from_currency, separator, to_currency = pair.partition("-")
+        if separator:
+            quotes[(from_currency.upper(), to_currency.upper())] = float(rate)
+    return quotes
+
+
+class RateFeedSource:
+    """
+    A feed of quote batches; stream() runs until cancelled (or, for finite
+    feeds, until exhausted). `pollable` sources answer fetch() with a fresh,
+    independent request, so it can run while stream() is being consumed.
+    """
+    name = "base"
+    pollable = False
+    _iterator = None
+
+    async def stream(self):
+        """Yields {(from, to): rate} batches."""
+        raise NotImplementedError
+        yield
+
+    async def fetch(self) -> dict[tuple[str, str], float]:
+        """
+        Returns one batch on demand, for aggregation rounds. Push-based sources
+        hand over their next message; polling sources override this with a
+        single request.
+        """
+        if self._iterator is None:
+            self._iterator = aiter(self.stream())
+        try:
+            return await anext(self._iterator)
+        except BaseException:
+            # A timed-out or failed stream is reopened on the next round
+            self._iterator = None
+            raise
+
+
+class StaticFeedSource(RateFeedSource):
+    """Re-publishes a fixed quote table every `interval` seconds; the stand-in for a live market in demos."""
+    name = "static"
+    pollable = True
+
+    def __init__(self, rates: dict[tuple[str, str], float] = MOCK_RATES, interval: float = 5.0):
+        self.rates = dict(rates)
+        self.interval = interval
+
+    async def fetch(self) -> dict[tuple[str, str], float]:
+        return dict(self.rates)
+
+    async def stream(self):
+        while True:
+            yield await self.fetch()
+            await asyncio.sleep(self.interval)
+
+
+class HTTPPollingSource(RateFeedSource):
+    """Polls a JSON endpoint returning {"FROM-TO": rate, ...} every `interval` seconds."""
+    name = "http"
+    pollable = True
+
+    def __init__(self, url: str, interval: float = 2.0, timeout: float = 5.0):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+
+    async def fetch(self) -> dict[tuple[str, str], float]:
+        response = await asyncio.to_thread(requests.get, self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return parse_quotes(response.json())
+
+    async def stream(self):
+        while True:
+            yield await self.fetch()
+            await asyncio.sleep(self.interval)
+
+
+class WebSocketSource(RateFeedSource):
+    """
+    Subscribes to a WebSocket that pushes JSON quote messages, optionally
+    sending `subscribe` once connected. Requires the `websockets` package.
+    """
+    name = "websocket"
+
+    def __init__(self, url: str, subscribe: dict | None = None):
+        self.url = url
+        self.subscribe = subscribe
+
+    async def stream(self):
+        import websockets
+
+        async with websockets.connect(self.url) as socket:
+            if self.subscribe is not None:
+                await socket.send(json.dumps(self.subscribe))
+            async for message in socket:
+                quotes = parse_quotes(json.loads(message))
+                if quotes:
+                    yield quotes
+
+
+class ReplayFeedSource(RateFeedSource):
+    """
+    Replays a JSON-lines recording, one {"ts": ..., "rates": {"FROM-TO": rate}}
+    object per line, keeping the recorded spacing divided by `speed`
+    (speed=0 replays as fast as possible). Starts over when `loop` is set.
+    """
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    async def stream(self):
+        while True:
+            previous = None
+            with open(self.path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    timestamp = record.get("ts")
+                    if timestamp is not None:
+                        if previous is not None and self.speed > 0:
+                            await asyncio.sleep(max(0.0, (timestamp - previous) / self.speed))
+                        previous = timestamp
+                    quotes = parse_quotes(record)
+                    if quotes:
+                        yield quotes
+            if not self.loop:
+                return
+
+
+class AggregatedFeedSource(RateFeedSource):
+    """
+    Queries every child source concurrently each round, each under its own
+    `timeout`, and yields one consolidated (rates, confidence) batch built by
+    aggregate_quotes. A round takes as long as the slowest source that
+    answers in time; sources that fail or time out only lower confidence.
+    Pairs the sources disagree on entirely keep the quote of the source with
+    the highest weight (the earliest listed by default), at confidence 0,
+    and are logged as conflicts.
+    """
+    name = "aggregate"
+
+    def __init__(self, sources: list[RateFeedSource], interval: float = 5.0, timeout: float = 2.0,
+                 max_deviation: float = 0.02, method: str = "median", min_sources: int = 1,
+                 weights: list[float] | None = None):
+        self.sources = list(sources)
+        self.weights = weights
+        self.interval = interval
+        self.timeout = timeout
+        self.max_deviation = max_deviation
+        self.method = method
+        self.min_sources = min_sources
+        self.name = "aggregate(" + ", ".join(source.name for source in self.sources) + ")"
+        # A round pulls from every child, so a refresh may only run one when none of them is streamed
+        self.pollable = all(source.pollable for source in self.sources)
+
+    async def _fetch_one(self, source: RateFeedSource) -> dict[tuple[str, str], float] | None:
+        try:
+            return await asyncio.wait_for(source.fetch(), self.timeout)
+        except Exception as e:
+            print(f"[FEED LOG] {source.name} feed skipped this round: {e!r}")
+            return None
+
+    async def fetch(self) -> tuple[dict[tuple[str, str], float], dict[tuple[str, str], float]]:
+        batches = await asyncio.gather(*(self._fetch_one(source) for source in self.sources))
+        if not any(batches):
+            raise ConnectionError("no rate feed answered")
+        conflicts = {}
+        combined = aggregate_quotes(batches, self.max_deviation, self.method, self.min_sources, self.weights,
+                                    conflicts)
+        if conflicts:
+            print(f"[FEED LOG] Sources disagree on {len(conflicts)} pairs, kept the most trusted quote: "
+                  + ", ".join(f"{a}->{b} {quotes}" for (a, b), quotes in list(conflicts.items())[:5]))
+        return ({pair: rate for pair, (rate, _) in combined.items()},
+                {pair: confidence for pair, (_, confidence) in combined.items()})
+
+    async def stream(self):
+        while True:
+            yield await self.fetch()
+            await asyncio.sleep(self.interval)
+
+
+def feed_source(kind: str, url: str | None = None, interval: float = 5.0) -> RateFeedSource:
+    """Builds a source from configuration: "static", "http", "websocket" or "replay" (url is then a file path)."""
+    if kind == "static":
+        return StaticFeedSource(interval=interval)
+    if url is None:
+        raise ValueError(f"The {kind!r} rate feed needs a URL.")
+    if kind == "http":
+        return HTTPPollingSource(url, interval=interval)
+    if kind == "websocket":
+        return WebSocketSource(url)
+    if kind == "replay":
+        return ReplayFeedSource(url)
+    raise ValueError(f"Unknown rate feed {kind!r}.")
+
+
+def _merge(rates: dict, confidence: dict, batch):
+    """Folds a source batch (rates, or (rates, confidence)) into pending rates; newer quotes win."""
+    quotes, scores = batch if isinstance(batch, tuple) else (batch, {})
+    rates.update(quotes)
+    for pair in quotes:
+        if pair in scores:
+            confidence[pair] = scores[pair]
+        else:
+            confidence.pop(pair, None)
+
+
+def build_feed(kinds: str, urls: str | None = None, interval: float = 5.0, timeout: float = 2.0) -> RateFeedSource:
+    """
+    Builds the feed from comma-separated `kinds` and matching `urls`. Several
+    sources are aggregated into one consolidated feed.
+    """
+    kinds = [kind.strip() for kind in kinds.split(",")]
+    urls = [url.strip() or None for url in urls.split(",")] if urls else []
+    urls += [None] * (len(kinds) - len(urls))
+    sources = [feed_source(kind, url, interval) for kind, url in zip(kinds, urls)]
+    if len(sources) == 1:
+        return sources[0]
+    return AggregatedFeedSource(sources, interval=interval, timeout=timeout)
+
+
+class RateFeedIngestor:
+    """
+    Runs one consumer task per source and a single writer task that applies
+    merged batches to `rag`. `apply`, if given, is an async runner such as
+    KnowledgeGraphExecutor.run that the writes go through; otherwise they run
+    inline on the event loop. Each write re-plans the rag's hot corridors.
+
+    ensure_fresh() complements the stream for callers about to quote: rates
+    up to `max_age` seconds old are used as they are, for `stale_grace`
+    seconds more they are still used while a refresh runs in the background,
+    and anything older waits for that refresh. Concurrent callers share one.
+    A refresh polls the pollable sources; push and replay sources are never
+    re-read (that would open a second connection or restart the recording),
+    so for them it waits for the next batch their consumer writes.
+    """
+    def __init__(self, rag: FinancialRAG, sources: list[RateFeedSource], apply=None, ttl: float | None = None,
+                 retry_delay: float = 1.0, max_retry_delay: float = 30.0, max_age: float = 10.0,
+                 stale_grace: float = 30.0, refresh_timeout: float = 5.0):
+        self.rag = rag
+        self.sources = list(sources)
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_age = max_age
+        self.stale_grace = stale_grace
+        self.refresh_timeout = refresh_timeout
+        self._apply = apply
+        self._refresh_task: asyncio.Task | None = None
+        self.served_fresh = 0
+        self.served_stale = 0
+        self.refreshes = 0
+        self.refreshes_coalesced = 0
+        self._pending: dict[tuple[str, str], float] = {}
+        self._pending_confidence: dict[tuple[str, str], float] = {}
+        self._wakeup: asyncio.Event | None = None
+        # Set (and replaced) after every write, for refreshes waiting on streamed sources
+        self._written: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.last_update_at: float | None = None
+        self.batches_received = 0
+        self.rates_applied = 0
+        self.source_errors = {source.name: 0 for source in self.sources}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        """Starts consuming every source; must be called from the running event loop."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._written = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._writer(), name="rate-feed-writer")]
+        self._tasks += [asyncio.create_task(self._consume(source), name=f"rate-feed-{source.name}")
+                        for source in self.sources]
+        print(f"[FEED LOG] Streaming rates from {', '.join(source.name for source in self.sources)}")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _consume(self, source: RateFeedSource):
+        """Reads one source, reconnecting with exponential backoff whenever it fails."""
+        delay = self.retry_delay
+        while True:
+            try:
+                async for batch in source.stream():
+                    delay = self.retry_delay
+                    self.batches_received += 1
+                    _merge(self._pending, self._pending_confidence, batch)
+                    self._wakeup.set()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.source_errors[source.name] += 1
+                print(f"[FEED LOG] {source.name} feed failed: {e}; retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, {}
+            confidence, self._pending_confidence = self._pending_confidence, {}
+            if batch:
+                await self._write(batch, confidence)
+
+    async def _write(self, batch: dict[tuple[str, str], float], confidence: dict[tuple[str, str], float]):
+        try:
+            if self._apply is None:
+                self._ingest(batch, confidence)
+            else:
+                await self._apply(self._ingest, batch, confidence)
+        except Exception as e:
+            print(f"[FEED LOG] Could not apply {len(batch)} rates: {e}")
+            return
+        if self._written is not None:
+            written, self._written = self._written, asyncio.Event()
+            written.set()
+
+    def _ingest(self, batch: dict[tuple[str, str], float], confidence: dict[tuple[str, str], float]):
+        self.rag.update_rates(batch, ttl=self.ttl, confidence=confidence)
+        self.rates_applied += len(batch)
+        self.last_update_at = time.time()
+        self.rag.warm_routes()
+
+    async def ensure_fresh(self):
+        """Makes sure the rates about to be quoted are fresh enough (see the class docstring)."""
+        age = math.inf if self.last_update_at is None else time.time() - self.last_update_at
+        if age <= self.max_age:
+            self.served_fresh += 1
+            return
+        refresh = self._refresh_task
+        if refresh is None or refresh.done():
+            refresh = self._refresh_task = asyncio.create_task(self._refresh(), name="rate-feed-refresh")
+        else:
+            self.refreshes_coalesced += 1
+        if age <= self.max_age + self.stale_grace:
+            self.served_stale += 1
+            return
+        # Shielded so one caller giving up does not cancel the refresh the others await
+        await asyncio.shield(refresh)
+
+    async def _refresh(self):
+        """
+        Pulls one batch from every pollable source concurrently and writes
+        what arrived. If any source is streamed instead, also waits (within
+        refresh_timeout) for the next batch the writer applies from the stream.
+        """
+        polled = [source for source in self.sources if source.pollable]
+        streamed = self._written is not None and len(polled) < len(self.sources)
+        waits = [asyncio.wait_for(source.fetch(), self.refresh_timeout) for source in polled]
+        if streamed:
+            waits.append(asyncio.wait_for(self._written.wait(), self.refresh_timeout))
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        if streamed and isinstance(results.pop(), Exception):
+            print(f"[FEED LOG] No streamed rates arrived within {self.refresh_timeout:.0f}s of a refresh")
+        rates, confidence = {}, {}
+        for source, result in zip(polled, results):
+            if isinstance(result, Exception):
+                self.source_errors[source.name] += 1
+                print(f"[FEED LOG] {source.name} refresh failed: {result!r}")
+            else:
+                _merge(rates, confidence, result)
+        if rates:
+            self.refreshes += 1
+            await self._write(rates, confidence)
+
+    def status(self) -> dict:
+        """Feed health for monitoring: throughput, errors and how old the newest applied batch is."""
+        last = self.last_update_at
+        return {
+            "running": self.running,
+            "sources": [source.name for source in self.sources],
+            "batches_received": self.batches_received,
+            "rates_applied": self.rates_applied,
+            "last_update_age_ms": None if last is None else round((time.time() - last) * 1000, 1),
+            "source_errors": dict(self.source_errors),
+            "served_fresh": self.served_fresh,
+            "served_stale": self.served_stale,
+            "refreshes": self.refreshes,
+            "refreshes_coalesced": self.refreshes_coalesced,
+        }
@@ -0,0 +1,82 @@
+"""
+Fixed-size, per-pair time series of observed rates.
+
+Each currency pair gets a NumPy ring buffer of (timestamp, rate) samples, so
+memory per pair is fixed and analytics run as vectorized operations over at
+most `capacity` samples.
+"""
+import numpy as np
+
+
+class _Ring:
+    __slots__ = ("times", "rates", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.rates = np.empty(capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: float, rate: float):
+        self.times[self.head] = timestamp
+        self.rates[self.head] = rate
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def ordered(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (times, rates) oldest first."""
+        if self.count < len(self.times):
+            return self.times[:self.count], self.rates[:self.count]
+        order = np.r_[self.head:len(self.times), 0:self.head]
+        return self.times[order], self.rates[order]
+
+
+class RateHistory:
+    """Keeps the last `capacity` observations of every pair."""
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._rings: dict[tuple[str, str], _Ring] = {}
+
+    def record(self, key: tuple[str, str], rate: float, timestamp: float):
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = _Ring(self.capacity)
+        ring.append(timestamp, rate)
+
+    def series(self, key: tuple[str, str], since: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (times, rates) for a pair, oldest first, optionally only samples at or after `since`."""
+        ring = self._rings.get(key)
+        if ring is None:
+            return np.empty(0), np.empty(0)
+        times, rates = ring.ordered()
+        if since is not None:
+            start = np.searchsorted(times, since, side="left")
+            times, rates = times[start:], rates[start:]
+        return times, rates
+
+    def rate_at(self, key: tuple[str, str], timestamp: float) -> float | None:
+        """Returns the rate in force at `timestamp` (the last sample at or before it)."""
+        times, rates = self.series(key)
+        index = np.searchsorted(times, timestamp, side="right") - 1
+        if index < 0:
+            return None
+        return float(rates[index])
+
+    def stats(self, key: tuple[str, str], since: float | None = None) -> dict | None:
+        """
+        Rolling mean, min/max and volatility (standard deviation of log returns)
+        over the samples at or after `since`. Returns None for an unknown pair.
+        """
+        times, rates = self.series(key, since)
+        if len(rates) == 0:
+            return None
+        log_returns = np.diff(np.log(rates)) if len(rates) > 1 else np.zeros(1)
+        return {
+            "samples": int(len(rates)),
+            "mean": float(rates.mean()),
+            "min": float(rates.min()),
+            "max": float(rates.max()),
+            "volatility": float(log_returns.std()),
+            "first_at": float(times[0]),
+            "last_at": float(times[-1]),
+        }
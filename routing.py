@@ -0,0 +1,489 @@
+"""
+Multi-hop routing over the rate graph.
+
+Currencies are nodes and every known rate is a directed edge weighted
+-log(rate * (1 - fee)), so the cheapest route between two currencies is the
+shortest path and its effective rate is exp(-distance). RoutingEngine keeps
+the all-pairs distance and predecessor matrices for the whole graph:
+
+- a full rebuild is a vectorized Floyd-Warshall, O(N^3) in NumPy;
+- a cheaper or new edge relaxes every pair through it in one O(N^2) step;
+- a dearer or removed edge recomputes only the sources whose shortest-path
+  tree used it.
+
+Rate changes are queued as they are published and folded in on the next
+query, so the rate writer never waits for routing: the queue has its own
+lock, held only to add to it or swap it out, never while tables are rebuilt.
+"""
+import math
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Mapping
+
+import numpy as np
+
+# Distances closer than this are treated as equal, so rounding noise on
+# zero-cost cycles (consistent cross rates) never churns the tables.
+_EPSILON = 1e-12
+
+
+@dataclass(frozen=True)
+class Route:
+    hops: tuple[str, ...]
+    rate: float
+    effective_rate: float
+
+    @property
+    def via(self) -> tuple[str, ...]:
+        """The intermediate currencies, in order."""
+        return self.hops[1:-1]
+
+    def as_dict(self) -> dict:
+        return {"hops": list(self.hops), "via": list(self.via), "rate": self.rate, "effective_rate": self.effective_rate}
+
+
+@dataclass(frozen=True)
+class BatchQuote:
+    """
+    RoutingEngine.quote_batch() results, one entry per request: NaN amounts
+    and a None route where the currencies are not connected. `fees` is in
+    the target currency: what the route would return at its quoted rates
+    minus `amount_out`. `hops` holds each route as indices into
+    `currencies`, padded with -1 (all -1 without a route); `routes` turns
+    them into name tuples on first use. `rate_version` is the snapshot
+    version of the rates the routes were computed from.
+    """
+    amount_out: np.ndarray
+    effective_rate: np.ndarray
+    fees: np.ndarray
+    hops: np.ndarray
+    currencies: np.ndarray
+    rate_version: int | None = None
+
+    def __len__(self) -> int:
+        return len(self.amount_out)
+
+    def __getitem__(self, index: slice) -> "BatchQuote":
+        """The quotes for a slice of the requests."""
+        return BatchQuote(self.amount_out[index], self.effective_rate[index], self.fees[index], self.hops[index],
+                          self.currencies, self.rate_version)
+
+    @cached_property
+    def routes(self) -> list[tuple[str, ...] | None]:
+        routes: list[tuple[str, ...] | None] = [None] * len(self)
+        lengths = (self.hops >= 0).sum(axis=1)
+        # Name tuples a route length at a time
+        for length in np.unique(lengths[lengths > 0]).tolist():
+            group = np.nonzero(lengths == length)[0]
+            for k, hops in zip(group.tolist(), self.currencies[self.hops[group, :length]].tolist()):
+                routes[k] = tuple(hops)
+        return routes
+
+    def as_dicts(self) -> list[dict]:
+        return [{"route": list(hops), "amount_out": float(out), "effective_rate": float(rate), "fees": float(fee)}
+                if hops is not None else None
+                for hops, out, rate, fee in zip(self.routes, self.amount_out.tolist(),
+                                                self.effective_rate.tolist(), self.fees.tolist())]
+
+
+class RoutingEngine:
+    """
+    All-pairs cheapest routes over the current rates. Edges between two
+    `fiat` currencies are left out: no rail settles fiat to fiat directly,
+    value always moves over a chain. Once more than `rebuild_ratio` of the
+    nodes have pending changes, a full rebuild is cheaper than updating.
+    """
+    def __init__(self, fiat=(), rebuild_ratio: float = 0.25):
+        self.fiat = set(fiat)
+        self.rebuild_ratio = rebuild_ratio
+        # _lock guards the tables; _pending_lock only the queue of rate changes
+        # (taken after _lock when both are needed)
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._rates: dict[tuple[str, str], float] = {}
+        self._fees: dict[tuple[str, str], float] = {}
+        self._pending: dict[tuple[str, str], float | None] = {}
+        self._pending_version: int | None = None
+        # Edges kept out of routing (e.g. suspected of closing an arbitrage cycle)
+        self._quarantined: set[tuple[str, str]] = set()
+        self._stale = True
+        self._names: list[str] = []
+        self._index: dict[str, int] = {}
+        # _names as an array (sorted, for vectorized lookups) and, built on the first batch quote after
+        # the tables change, every route's hop count and summed log(1 - fee): see _route_table()
+        self._name_array = np.zeros(0, dtype=str)
+        self._routes: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._weights = np.zeros((0, 0))
+        self._dist = np.zeros((0, 0))
+        self._pred = np.zeros((0, 0), dtype=np.int64)
+        self.has_negative_cycle = False
+        # Bumped whenever fees, quarantines or the whole graph change, so cached routes can tell
+        self.generation = 0
+        # Snapshot version of the newest rate changes folded into the tables
+        self.rate_version: int | None = None
+        self.rebuilds = 0
+        self.incremental_updates = 0
+
+    # --- Inputs -------------------------------------------------------------
+    def load(self, rates: Mapping[tuple[str, str], float], version: int | None = None):
+        """Replaces the whole graph (the rates of snapshot `version`); the tables are rebuilt on the next query."""
+        with self._lock, self._pending_lock:
+            self._rates = dict(rates)
+            self._pending.clear()
+            self._pending_version = None
+            self.rate_version = version
+            self._stale = True
+            self.generation += 1
+
+    def update(self, pair: tuple[str, str], rate: float | None):
+        """Queues a new rate for one edge (None removes it)."""
+        with self._pending_lock:
+            self._pending[pair] = rate
+
+    def on_rate_changes(self, changes):
+        """RateEventBus callback: queues every changed edge, without waiting for a query in progress."""
+        with self._pending_lock:
+            for change in changes:
+                self._pending[change.pair] = change.new_rate
+                self._pending_version = max(change.version, self._pending_version or change.version)
+
+    def set_fee(self, pair: tuple[str, str], fee: float):
+        """Sets the proportional fee (e.g. 0.001 = 10 bps) charged on one edge."""
+        with self._lock:
+            self._fees[pair] = fee
+            self._routes = None
+            self.generation += 1
+            if pair in self._rates:
+                self._requeue(pair)
+
+    def quarantine(self, pair: tuple[str, str]):
+        """Keeps an edge out of every route until release()."""
+        with self._lock:
+            self._quarantined.add(pair)
+            self.generation += 1
+            if pair in self._rates:
+                self._requeue(pair)
+            if self.has_negative_cycle:
+                # Distances through a negative cycle are meaningless; start over
+                self._stale = True
+
+    def release(self, pair: tuple[str, str]):
+        with self._lock:
+            self._quarantined.discard(pair)
+            self.generation += 1
+            if pair in self._rates:
+                self._requeue(pair)
+
+    def is_quarantined(self, pair: tuple[str, str]) -> bool:
+        return pair in self._quarantined
+
+    def _requeue(self, pair: tuple[str, str]):
+        """Queues an edge's current rate so its weight is recomputed; the caller holds _lock."""
+        with self._pending_lock:
+            # A newer rate already queued by the writer wins
+            self._pending.setdefault(pair, self._rates[pair])
+
+    def fee(self, pair: tuple[str, str]) -> float:
+        return self._fees.get(pair, 0.0)
+
+    def _weight(self, pair: tuple[str, str], rate: float | None) -> float:
+        if rate is None or rate <= 0 or pair in self._quarantined or (pair[0] in self.fiat and pair[1] in self.fiat):
+            return math.inf
+        return -math.log(rate * (1 - self._fees.get(pair, 0.0)))
+
+    # --- Maintenance ----------------------------------------------------------
+    def _refresh(self):
+        """Folds pending changes into the tables; the caller holds the lock."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            if self._pending_version is not None:
+                self.rate_version, self._pending_version = self._pending_version, None
+        for pair, rate in pending.items():
+            if rate is None:
+                self._rates.pop(pair, None)
+            else:
+                self._rates[pair] = rate
+        new_node = any(c not in self._index for pair, rate in pending.items() if rate is not None for c in pair)
+        if self._stale or new_node or len(pending) > self.rebuild_ratio * max(len(self._names), 1):
+            self._rebuild()
+            return
+        for pair in pending:
+            if pair[0] in self._index and pair[1] in self._index:
+                self._update_edge(pair)
+
+    def _rebuild(self):
+        self._names = sorted({currency for pair in self._rates for currency in pair})
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._name_array = np.array(self._names, dtype=str)
+        self._routes = None
+        n = len(self._names)
+        weights = np.full((n, n), np.inf)
+        for pair, rate in self._rates.items():
+            weights[self._index[pair[0]], self._index[pair[1]]] = self._weight(pair, rate)
+        np.fill_diagonal(weights, np.inf)
+        dist = weights.copy()
+        np.fill_diagonal(dist, 0.0)
+        pred = np.where(np.isfinite(weights), np.arange(n)[:, np.newaxis], -1)
+        for k in range(n):
+            through = dist[:, k, np.newaxis] + dist[np.newaxis, k, :]
+            better = through < dist - _EPSILON
+            if better.any():
+                dist = np.where(better, through, dist)
+                pred = np.where(better, pred[k][np.newaxis, :], pred)
+        self._weights, self._dist, self._pred = weights, dist, pred
+        self._stale = False
+        self.rebuilds += 1
+        self._check_cycles()
+
+    def _update_edge(self, pair: tuple[str, str]):
+        u, v = self._index[pair[0]], self._index[pair[1]]
+        old = self._weights[u, v]
+        new = self._weight(pair, self._rates.get(pair))
+        if new == old:
+            return
+        self._weights[u, v] = new
+        self._routes = None
+        self.incremental_updates += 1
+        if new < old:
+            # Every pair may now be cheaper through u -> v
+            through = self._dist[:, u, np.newaxis] + new + self._dist[np.newaxis, v, :]
+            better = through < self._dist - _EPSILON
+            if better.any():
+                last_hop = self._pred[v].copy()
+                last_hop[v] = u
+                self._dist = np.where(better, through, self._dist)
+                self._pred = np.where(better, last_hop[np.newaxis, :], self._pred)
+        else:
+            # Only sources whose shortest-path tree used u -> v can get dearer
+            affected = np.nonzero(self._pred[:, v] == u)[0]
+            if len(affected) > self.rebuild_ratio * len(self._names):
+                self._rebuild()
+                return
+            if len(affected):
+                self._recompute_rows(affected)
+        self._check_cycles()
+
+    def _recompute_rows(self, rows: np.ndarray):
+        """
+        Recomputes the distances from `rows` by relaxing
+        dist[i, j] = min_k weights[i, k] + dist[k, j] from scratch, with the
+        other rows held fixed, until nothing improves.
+        """
+        n = len(self._names)
+        dist, pred = self._dist, self._pred
+        dist[rows] = self._weights[rows]
+        dist[rows, rows] = 0.0
+        pred[rows] = np.where(np.isfinite(self._weights[rows]), rows[:, np.newaxis], -1)
+        for _ in range(n):
+            # candidates[r, k, j]: from rows[r] take the edge to k, then k's best route to j
+            candidates = self._weights[rows][:, :, np.newaxis] + dist[np.newaxis, :, :]
+            first_hop = candidates.argmin(axis=1)
+            best = np.take_along_axis(candidates, first_hop[:, np.newaxis, :], axis=1)[:, 0, :]
+            better = best < dist[rows] - _EPSILON
+            if not better.any():
+                break
+            last_hop = np.where(first_hop == np.arange(n)[np.newaxis, :], rows[:, np.newaxis],
+                                pred[first_hop, np.arange(n)[np.newaxis, :]])
+            dist[rows] = np.where(better, best, dist[rows])
+            pred[rows] = np.where(better, last_hop, pred[rows])
+
+    def _check_cycles(self):
+        self.has_negative_cycle = bool(len(self._dist) and (np.diag(self._dist) < -1e-9).any())
+
+    # --- Queries --------------------------------------------------------------
+    def state(self) -> tuple[int, int | None]:
+        """
+        (generation, rate_version) after folding in pending changes: what
+        routes answered now are computed from. Cached routes are only valid
+        while it stays the same.
+        """
+        with self._lock:
+            if self._pending or self._stale:
+                self._refresh()
+            return self.generation, self.rate_version
+
+    def route(self, from_currency: str, to_currency: str) -> Route | None:
+        """The cheapest route between two currencies, or None if they are not connected."""
+        with self._lock:
+            if self._pending or self._stale:
+                self._refresh()
+            i, j = self._index.get(from_currency), self._index.get(to_currency)
+            if i is None or j is None or i == j or not np.isfinite(self._dist[i, j]):
+                return None
+            path = [j]
+            while path[-1] != i and len(path) <= len(self._names):
+                path.append(int(self._pred[i, path[-1]]))
+            if path[-1] != i:
+                return None  # only reachable through a negative cycle
+            hops = tuple(self._names[k] for k in reversed(path))
+            rate = math.prod(self._rates[(a, b)] for a, b in zip(hops, hops[1:]))
+            return Route(hops, rate, math.exp(-float(self._dist[i, j])))
+
+    def _shortest_from(self, weights: np.ndarray, source: int) -> tuple[np.ndarray, np.ndarray]:
+        """Bellman-Ford from one source over a dense weight matrix (rates above 1 make negative edges)."""
+        n = len(weights)
+        dist = np.full(n, np.inf)
+        dist[source] = 0.0
+        pred = np.full(n, -1, dtype=np.int64)
+        for _ in range(n):
+            candidates = dist[:, np.newaxis] + weights
+            via = candidates.argmin(axis=0)
+            best = candidates[via, np.arange(n)]
+            better = best < dist - _EPSILON
+            if not better.any():
+                break
+            dist = np.where(better, best, dist)
+            pred = np.where(better, via, pred)
+        return dist, pred
+
+    def disjoint_routes(self, from_currency: str, to_currency: str, k: int = 3) -> list[Route]:
+        """
+        Up to `k` routes between two currencies that share no intermediate
+        currency, best first: each is the cheapest route avoiding everything
+        the earlier ones pass through, so losing one chain never takes out
+        the next route as well.
+        """
+        with self._lock:
+            if self._pending or self._stale:
+                self._refresh()
+            i, j = self._index.get(from_currency), self._index.get(to_currency)
+            if i is None or j is None or i == j:
+                return []
+            weights = self._weights.copy()
+            routes = []
+            for _ in range(k):
+                dist, pred = self._shortest_from(weights, i)
+                if not np.isfinite(dist[j]):
+                    break
+                path = [j]
+                while path[-1] != i and len(path) <= len(self._names):
+                    path.append(int(pred[path[-1]]))
+                if path[-1] != i:
+                    break
+                path.reverse()
+                hops = tuple(self._names[node] for node in path)
+                rate = math.prod(self._rates[(a, b)] for a, b in zip(hops, hops[1:]))
+                routes.append(Route(hops, rate, math.exp(-float(dist[j]))))
+                intermediates = path[1:-1]
+                if intermediates:
+                    weights[intermediates, :] = np.inf
+                    weights[:, intermediates] = np.inf
+                else:
+                    weights[i, j] = np.inf
+            return routes
+
+    def quote_batch(self, requests) -> BatchQuote:
+        """
+        Quotes many (from, to, amount) conversions at once over the cheapest
+        routes; see quote_arrays, which takes the same requests as arrays.
+        """
+        requests = list(requests)
+        if not requests:
+            return self.quote_arrays((), (), ())
+        sources, targets, amounts = zip(*requests)
+        return self.quote_arrays(sources, targets, amounts)
+
+    def _lookup(self, currencies: np.ndarray) -> np.ndarray:
+        """Table index per currency code (-1 if unknown), by binary search over the sorted names."""
+        names = self._name_array
+        if not len(names) or not len(currencies):
+            return np.full(len(currencies), -1, dtype=np.int64)
+        index = np.minimum(np.searchsorted(names, currencies), len(names) - 1)
+        return np.where(names[index] == currencies, index, -1)
+
+    def _route_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (pred, hops, fee_logs) for every pair: pred with each source as its
+        own predecessor, the number of hops on the route (-1 when there is
+        none, or it only closes through a negative cycle) and the route's
+        summed log(1 - fee). Computed by pointer jumping, so in log(longest
+        route) passes over the tables; the caller holds _lock.
+        """
+        if self._routes is None:
+            n = len(self._names)
+            rows, cols = np.arange(n)[:, np.newaxis], np.arange(n)[np.newaxis, :]
+            pred = np.where(self._pred >= 0, self._pred, rows)
+            pred[np.arange(n), np.arange(n)] = np.arange(n)
+            edge_fee_logs = np.zeros((n, n))
+            for (a, b), fee in self._fees.items():
+                if a in self._index and b in self._index:
+                    edge_fee_logs[self._index[a], self._index[b]] = math.log1p(-fee)
+            # From every node, jump 1, 2, 4, ... hops back towards the source
+            ancestor, hops, fee_logs = pred, (pred != cols).astype(np.int64), edge_fee_logs[pred, cols]
+            for _ in range(max(n, 1).bit_length() + 1):
+                if (ancestor == rows).all():
+                    break
+                hops = hops + hops[rows, ancestor]
+                fee_logs = fee_logs + fee_logs[rows, ancestor]
+                ancestor = ancestor[rows, ancestor]
+            hops[~np.isfinite(self._dist) | (ancestor != rows)] = -1
+            self._routes = pred, hops, fee_logs
+        return self._routes
+
+    @property
+    def currencies(self) -> np.ndarray:
+        """The currency codes batch quotes index into, sorted."""
+        with self._lock:
+            if self._pending or self._stale:
+                self._refresh()
+            return self._name_array
+
+    def quote_arrays(self, sources, targets, amounts, currencies: np.ndarray | None = None) -> BatchQuote:
+        """
+        Quotes parallel arrays of sources, targets and amounts with gathers
+        from the distance and route tables, returning the routes as index
+        arrays. Sources and targets are currency codes or, given
+        `currencies` (e.g. this engine's or an earlier BatchQuote's), indices
+        into it, which skips looking up every code. Quotes are at the
+        marginal rates; amount-dependent slippage is SplitRouter's job.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        count = len(amounts)
+        with self._lock:
+            if self._pending or self._stale:
+                self._refresh()
+            if currencies is None:
+                i, j = self._lookup(np.asarray(sources, dtype=str)), self._lookup(np.asarray(targets, dtype=str))
+            else:
+                # Indices into `currencies`, which may predate the last rebuild
+                remap = np.arange(len(currencies)) if currencies is self._name_array else self._lookup(currencies)
+                remap = np.append(remap, -1)
+                i, j = remap[np.asarray(sources, dtype=np.int64)], remap[np.asarray(targets, dtype=np.int64)]
+            routed = np.nonzero((i >= 0) & (j >= 0) & (i != j))[0]
+            i, j = i[routed], j[routed]
+            pred, hop_counts, fee_logs = self._route_table()
+            lengths = hop_counts[i, j]
+            routed, i, j, lengths = routed[lengths > 0], i[lengths > 0], j[lengths > 0], lengths[lengths > 0]
+            dist, fee_logs = self._dist[i, j], fee_logs[i, j]
+            # Walk back from the targets, filling each route from its last hop
+            # (flat indices: a source is its own predecessor, so finished routes stay put)
+            width = int(lengths.max(initial=-1)) + 1
+            hops = np.full(count * width, -1, dtype=np.int64)
+            first = routed * width
+            position, current, row = first + lengths, j, i * len(self._names)
+            pred = pred.ravel()
+            for _ in range(width):
+                hops[position] = current
+                current = pred[row + current]
+                position -= 1
+                np.maximum(position, first, out=position)
+            hops = hops.reshape(count, width)
+            names, version = self._name_array, self.rate_version
+        effective = np.full(count, np.nan)
+        gross = np.full(count, np.nan)
+        effective[routed] = np.exp(-dist)
+        gross[routed] = np.exp(-dist - fee_logs)
+        return BatchQuote(amounts * effective, effective, amounts * (gross - effective), hops, names, version)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "currencies": len(self._names),
+                "edges": int(np.isfinite(self._weights).sum()),
+                "pending_changes": len(self._pending),
+                "rebuilds": self.rebuilds,
+                "incremental_updates": self.incremental_updates,
+                "negative_cycle": self.has_negative_cycle,
+                "quarantined": sorted(f"{a}-{b}" for a, b in self._quarantined),
+            }
@@ -0,0 +1,238 @@
+"""
+A fixed-size rate table in a memory-mapped file that one writer process updates
+and any number of worker processes read in place.
+
+Layout: a header of five uint64 words [sequence, version, count, capacity,
+epoch] followed by `capacity` (from, to, rate, expires_at, version) records.
+Slots are append-only, so a pair keeps its slot for the table's lifetime, and
+each record carries the version that last wrote it, so readers copy only what
+changed since the version they hold. Every writer that attaches starts a new
+epoch: its versions need not continue the last writer's (e.g. it restored an
+older snapshot), so readers compare (epoch, version), and re-read the whole
+table when the epoch moved. The writer makes `sequence` odd
+while it changes records and even again afterwards (a seqlock); readers retry
+whenever the sequence moved under them instead of ever taking a lock, backing
+off while it stays odd and giving up after `read_retries` attempts. A writer
+killed mid-publish leaves the sequence odd, so the next writer to attach
+evens it out again; readers can take over writing once the writer's lock is
+released (try_become_writer).
+"""
+import fcntl
+import math
+import mmap
+import os
+import time
+
+import numpy as np
+
+_HEADER_WORDS = 5
+_HEADER_BYTES = _HEADER_WORDS * 8
+_RECORD = np.dtype([("from", "S16"), ("to", "S16"), ("rate", "<f8"), ("expires_at", "<f8"), ("version", "<u8")])
+
+
+class SharedRateTable:
+    """
+    The first process to open `path` takes an exclusive lock on `path.lock` and
+    becomes the writer; every other process attaches read-only.
+    """
+    def __init__(self, path: str, capacity: int = 4096, read_retries: int = 200):
+        self.path = path
+        self.capacity = capacity
+        self.read_retries = read_retries
+        self._lock_file = open(f"{path}.lock", "a")
+        self.is_writer = self._try_lock()
+        self._mm = None
+        self._header = None
+        self._records = None
+        self._slots: dict[tuple[str, str], int] = {}
+        if self.is_writer:
+            self._create(capacity)
+
+    def _try_lock(self) -> bool:
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def try_become_writer(self) -> bool:
+        """Takes over as the writer if the writer process has exited (its lock is free). Returns is_writer."""
+        if self.is_writer or not self._try_lock():
+            return self.is_writer
+        # Remap the table writable
+        self._mm, self._header, self._records = None, None, None
+        self.is_writer = True
+        self._create(self.capacity)
+        return True
+
+    def _create(self, capacity: int):
+        """Creates the table file, or adopts an existing one of the right size."""
+        size = _HEADER_BYTES + capacity * _RECORD.itemsize
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != size:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.truncate(size)
+                f.write(np.array([0, 0, 0, capacity, 0], dtype="<u8").tobytes())
+            os.replace(tmp_path, self.path)
+        self._attach()
+        # A writer that died mid-publish left the sequence odd; nobody else is writing now
+        header = self._header
+        if header[0] % 2:
+            header[0] += 1
+        header[0] += 1
+        header[4] += 1
+        header[0] += 1
+        self._reindex()
+
+    def _attach(self) -> bool:
+        if self._mm is not None:
+            return True
+        try:
+            with open(self.path, "r+b" if self.is_writer else "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if self.is_writer else mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return False
+        self._header = np.ndarray(_HEADER_WORDS, dtype="<u8", buffer=self._mm)
+        capacity = int(self._header[3])
+        self._records = np.ndarray(capacity, dtype=_RECORD, buffer=self._mm, offset=_HEADER_BYTES)
+        return True
+
+    def _reindex(self):
+        """Learns the slots of pairs the writer has added since the last call."""
+        count = int(self._header[2])
+        for slot in range(len(self._slots), count):
+            record = self._records[slot]
+            self._slots[(record["from"].decode("ascii"), record["to"].decode("ascii"))] = slot
+
+    def publish(self, version: int, rates, removed=(), expires_at=None):
+        """
+        Writes changed {(from, to): rate} entries with their expiry from
+        `expires_at` (never, if missing), tombstones `removed` pairs (NaN
+        rate, the slot is kept for reuse) and sets the new version. Writer only.
+        """
+        expires_at = expires_at or {}
+        if not self.is_writer:
+            raise PermissionError("Only the writer process may publish to the shared rate table.")
+        header, records = self._header, self._records
+        header[0] += 1
+        try:
+            for (from_currency, to_currency), rate in rates.items():
+                expiry = expires_at.get((from_currency, to_currency), np.inf)
+                slot = self._slots.get((from_currency, to_currency))
+                if slot is None:
+                    slot = len(self._slots)
+                    if slot >= len(records):
+                        raise ValueError(f"Shared rate table is full ({len(records)} pairs).")
+                    records[slot] = (from_currency.encode("ascii"), to_currency.encode("ascii"), rate, expiry, version)
+                    self._slots[(from_currency, to_currency)] = slot
+                    header[2] = slot + 1
+                else:
+                    records["rate"][slot] = rate
+                    records["expires_at"][slot] = expiry
+                    records["version"][slot] = version
+            for key in removed:
+                slot = self._slots.get(key)
+                if slot is not None:
+                    records["rate"][slot] = np.nan
+                    records["version"][slot] = version
+            header[1] = version
+        finally:
+            header[0] += 1
+
+    def version(self) -> int | None:
+        """Returns the last published version, or None if the writer has not created the table yet."""
+        if not self._attach():
+            return None
+        return int(self._header[1])
+
+    def state(self) -> tuple[int, int] | None:
+        """(epoch, version) of the last publish, or None if the writer has not created the table yet."""
+        if not self._attach():
+            return None
+        header = self._header
+        return self._consistent(lambda: (int(header[4]), int(header[1])))
+
+    def _slot(self, from_currency: str, to_currency: str) -> int | None:
+        slot = self._slots.get((from_currency, to_currency))
+        if slot is None:
+            self._reindex()
+            slot = self._slots.get((from_currency, to_currency))
+        return slot
+
+    def get(self, from_currency: str, to_currency: str) -> float | None:
+        """Reads one rate in place from the shared mapping."""
+        entry = self.lookup(from_currency, to_currency)
+        return None if entry is None else entry[1]
+
+    def lookup(self, from_currency: str, to_currency: str) -> tuple[int, float | None, float] | None:
+        """
+        Reads one pair in place: (table version, rate, expires_at), with a
+        None rate for pairs never published or removed since. None if the
+        writer has not created the table yet.
+        """
+        if not self._attach():
+            return None
+        slot = self._slot(from_currency, to_currency)
+        header, records = self._header, self._records
+        if slot is None:
+            return self._consistent(lambda: int(header[1])), None, math.inf
+        version, rate, expiry = self._consistent(
+            lambda: (int(header[1]), float(records["rate"][slot]), float(records["expires_at"][slot])))
+        return version, None if math.isnan(rate) else rate, expiry
+
+    def read_all(self) -> tuple[int, dict[tuple[str, str], float], dict[tuple[str, str], float]] | None:
+        """Returns a consistent (version, rates, expires_at) copy of the whole table."""
+        changes = self.read_since(None)
+        if changes is None:
+            return None
+        (_, version), rates, expires_at, _ = changes
+        return version, rates, expires_at
+
+    def read_since(self, state: tuple[int, int] | None):
+        """
+        Returns ((epoch, version), rates, expires_at, removed): the pairs
+        published or removed after `state` (an earlier state()), copied
+        consistently. If `state` is None or from another epoch, that is the
+        whole table and `removed` is None: pairs not in `rates` are gone.
+        None if the writer has not created the table yet.
+        """
+        if not self._attach():
+            return None
+        header, records = self._header, self._records
+
+        def read():
+            epoch, version, count = int(header[4]), int(header[1]), int(header[2])
+            if state is None or state[0] != epoch:
+                return (epoch, version), records[:count].copy(), True
+            # Only the changed records are copied out of the mapping
+            changed = np.nonzero(records["version"][:count] > state[1])[0]
+            return (epoch, version), records[changed], False
+
+        current, block, full = self._consistent(read)
+        rates, expires_at, removed = {}, {}, []
+        for f, t, rate, expiry, _ in block.tolist():
+            key = (f.decode("ascii"), t.decode("ascii"))
+            if math.isnan(rate):
+                removed.append(key)
+            else:
+                rates[key] = rate
+                expires_at[key] = expiry
+        return current, rates, expires_at, None if full else removed
+
+    def _consistent(self, read):
+        """
+        Returns read() from a moment no publish was in progress. Backs off
+        (up to 1 ms between attempts) while the writer holds the sequence odd,
+        and raises TimeoutError after `read_retries` attempts.
+        """
+        delay = 1e-6
+        for _ in range(self.read_retries):
+            sequence = int(self._header[0])
+            if sequence % 2 == 0:
+                value = read()
+                if int(self._header[0]) == sequence:
+                    return value
+            time.sleep(delay)
+            delay = min(delay * 2, 1e-3)
+        raise TimeoutError(f"Shared rate table {self.path} stayed mid-publish for {self.read_retries} reads; "
+                           f"its writer may have died.")
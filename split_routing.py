@@ -0,0 +1,105 @@
+"""
+Amount-aware routing: splitting one transfer across several routes.
+
+Each edge has a liquidity curve: with `depth` units of the source currency
+behind it, converting x yields rate * x * depth / (depth + x) (constant-
+product slippage), after a `fixed_fee` in source units has been taken off
+the top. Small amounts see the quoted rate; large ones move the price, so
+spreading a big transfer over several routes can return more.
+
+Without fixed fees each route's output is concave in its input, so the best
+split of a budget is found exactly (to 1/steps of the amount) by giving each
+slice of the budget to the route with the best marginal output. A route's
+fixed fees just come off the budget once it is used, so every subset of
+candidate routes is tried with its fees deducted and the best one kept.
+"""
+import itertools
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class LiquidityCurve:
+    depth: float = math.inf
+    fixed_fee: float = 0.0
+
+
+@dataclass(frozen=True)
+class RouteQuote:
+    hops: tuple[str, ...]
+    amount_in: float
+    expected_output: float
+
+    @property
+    def via(self) -> tuple[str, ...]:
+        return self.hops[1:-1]
+
+
+class SplitRouter:
+    def __init__(self, steps: int = 200, max_routes: int = 4):
+        self.steps = steps
+        self.max_routes = max_routes
+        self.curves: dict[tuple[str, str], LiquidityCurve] = {}
+
+    def set_liquidity(self, pair: tuple[str, str], depth: float, fixed_fee: float = 0.0):
+        self.curves[pair] = LiquidityCurve(depth, fixed_fee)
+
+    def _curves(self, hops) -> list[LiquidityCurve]:
+        return [self.curves.get(pair, LiquidityCurve()) for pair in zip(hops, hops[1:])]
+
+    def route_output(self, hops, rates, amounts: np.ndarray, with_fees: bool = True) -> np.ndarray:
+        """Output of a route for each input in `amounts`; `rates` holds one (fee-adjusted) rate per hop."""
+        out = np.asarray(amounts, dtype=np.float64)
+        for rate, curve in zip(rates, self._curves(hops)):
+            if with_fees:
+                out = np.maximum(out - curve.fixed_fee, 0.0)
+            if math.isfinite(curve.depth):
+                out = out * curve.depth / (curve.depth + out)
+            out = out * rate
+        return out
+
+    def output(self, hops, rates, amount: float) -> float:
+        """route_output() for a single amount, in plain floats (cheaper than NumPy for one value)."""
+        for rate, curve in zip(rates, self._curves(hops)):
+            amount = max(amount - curve.fixed_fee, 0.0)
+            if math.isfinite(curve.depth):
+                amount = amount * curve.depth / (curve.depth + amount)
+            amount *= rate
+        return amount
+
+    def fixed_cost(self, hops, rates) -> float:
+        """A route's fixed fees in source units, each converted back at the spot rates before it."""
+        cost, spot = 0.0, 1.0
+        for rate, curve in zip(rates, self._curves(hops)):
+            cost += curve.fixed_fee / spot
+            spot *= rate
+        return cost
+
+    def split(self, amount: float, routes: list[tuple[tuple[str, ...], list[float]]]) -> list[RouteQuote]:
+        """
+        The best split of `amount` over `routes` ((hops, per-hop rates) each),
+        as one RouteQuote per route that gets a share, largest first.
+        """
+        routes = routes[:self.max_routes]
+        fixed = [self.fixed_cost(hops, rates) for hops, rates in routes]
+        best_total, best = 0.0, []
+        for size in range(1, len(routes) + 1):
+            for subset in itertools.combinations(range(len(routes)), size):
+                budget = amount - sum(fixed[k] for k in subset)
+                if budget <= 0:
+                    continue
+                grid = budget * np.arange(self.steps + 1) / self.steps
+                outputs = np.stack([self.route_output(*routes[k], grid, with_fees=False) for k in subset])
+                # Take the `steps` best marginal slices overall; concave curves make that a prefix per route
+                marginal = np.diff(outputs, axis=1).ravel()
+                chosen = np.argpartition(-marginal, self.steps - 1)[:self.steps]
+                slices = np.bincount(chosen // self.steps, minlength=size)
+                total = float(outputs[np.arange(size), slices].sum())
+                if total > best_total:
+                    best_total = total
+                    best = [(k, budget * n / self.steps + fixed[k]) for k, n in zip(subset, slices) if n]
+        quotes = [RouteQuote(routes[k][0], float(share), float(self.route_output(*routes[k], [share])[0]))
+                  for k, share in best]
+        return sorted(quotes, key=lambda quote: -quote.amount_in)
@@ -0,0 +1,86 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from hyperon import MeTTa
+
+from financerag import FinancialRAG
+from kg_backends import MeTTaBackend, NativeBackend
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(params=["metta", "metta-atoms", "native"])
+def backend(request):
+    return _make_backend(request.param)
+
+
+def _make_backend(name: str):
+    if name == "native":
+        return NativeBackend()
+    # Rate atoms in the space are only safe on small graphs, which these are
+    return MeTTaBackend(MeTTa(), rate_atoms=name == "metta-atoms")
+
+
+def test_rates_are_added_replaced_and_removed(backend):
+    backend.set_rate(("INR", "ETH"), 1000.0)
+    backend.set_rate(("ETH", "USD"), 0.5)
+    backend.set_rate(("INR", "ETH"), 1001.0)
+    assert backend.existing_rates() == {("INR", "ETH"): 1001.0, ("ETH", "USD"): 0.5}
+    backend.remove_rate(("INR", "ETH"))
+    backend.remove_rate(("NO", "PAIR"))
+    assert backend.existing_rates() == {("ETH", "USD"): 0.5}
+
+
+def test_add_path_replaces_the_cost_of_an_existing_route(backend):
+    backend.add_path("INR", "USD", "ETH", 0.002)
+    backend.add_path("INR", "USD", "BTC", 0.003)
+    backend.add_path("INR", "USD", "ETH", 0.001)
+    assert sorted(backend.paths("INR", "USD")) == [("BTC", 0.003), ("ETH", 0.001)]
+    assert backend.paths("USD", "INR") == []
+    assert sorted(backend.path_facts()) == [("INR", "USD", "BTC", 0.003), ("INR", "USD", "ETH", 0.001)]
+
+
+def test_dump_and_load_facts_round_trip_paths_but_not_rates(backend):
+    backend.add_path("INR", "USD", "ETH", 0.001)
+    backend.add_path("INR", "EUR", "BTC", 0.002)
+    backend.set_rate(("INR", "ETH"), 1000.0)
+    text = backend.dump_facts()
+    assert "rate" not in text
+
+    restored = _make_backend(backend.name)
+    restored.load_facts(text)
+    assert sorted(restored.path_facts()) == sorted(backend.path_facts())
+    assert restored.existing_rates() == {}
+
+
+def test_compaction_evicts_expired_and_over_capacity_rates(backend):
+    rag = FinancialRAG(backend=backend, rate_ttl=60, max_rates=2)
+    rag.update_rates({("INR", "ETH"): 1000.0, ("ETH", "USD"): 0.5})
+    rag.update_rates({("INR", "BTC"): 0.00001}, ttl=120)
+    rag.update_rates({("OLD", "PAIR"): 1.0}, ttl=0)
+    assert rag.compact() == 2
+    assert set(backend.existing_rates()) == set(rag.latest_snapshot().rates)
+    assert rag.get_rates([("OLD", "PAIR"), ("INR", "BTC")]) == {("OLD", "PAIR"): None, ("INR", "BTC"): 0.00001}
+
+
+def test_rate_churn_on_a_large_metta_graph_does_not_abort():
+    # hyperon 0.2.10 aborts the whole process (not a Python exception) when
+    # atoms are replaced or removed in a space of a few thousand atoms, so the
+    # churn runs in a child process and a crash shows up as its exit code.
+    script = textwrap.dedent("""
+        from hyperon import MeTTa
+        from financerag import FinancialRAG
+
+        rag = FinancialRAG(MeTTa(), rate_ttl=60, max_rates=1500)
+        pairs = [("INR", f"C{i}") for i in range(3000)]
+        for tick in range(3):
+            rag.update_rates({pair: 1.0 + tick for pair in pairs})
+            rag.update_rates({pair: 2.0 for pair in pairs[:500]}, ttl=0)
+            rag.compact()
+        assert len(rag.backend.existing_rates()) == 1500
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr[-2000:]
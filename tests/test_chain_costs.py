@@ -0,0 +1,31 @@
+import time
+
+from chain_costs import ChainCostModel
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from shared_rates import SharedRateTable
+
+CHAINS = {"ETH": {"rpc": "http://localhost:8545", "gas_price_gwei": 10, "block_time_seconds": 12}}
+
+
+def test_a_reader_worker_prices_its_paths_on_the_writers_rates(tmp_path):
+    path = str(tmp_path / "rates.shm")
+    writer = FinancialRAG(backend=NativeBackend(), shared_table=SharedRateTable(path))
+    reader = FinancialRAG(backend=NativeBackend(), shared_table=SharedRateTable(path))
+    reader.add_path("INR", "USD", "ETH", 0.001)
+    writer.update_rates({("INR", "ETH"): 0.00005})
+
+    costs = ChainCostModel(reader, CHAINS, gas_per_transfer=200_000)
+    assert costs.update_costs() == 1
+    assert reader.backend.paths("INR", "USD") == [("ETH", costs.path_cost("ETH", 0.00005))]
+
+
+def test_only_a_recently_polled_gas_price_is_offered_for_sending():
+    costs = ChainCostModel(FinancialRAG(backend=NativeBackend()), CHAINS)
+    # Only the configured estimate so far: the sender asks the chain itself
+    assert costs.gas_price("ETH") is None
+    costs.chains["ETH"].gas_price_gwei, costs.chains["ETH"].gas_price_at = 31.5, time.time()
+    assert costs.gas_price("ETH") == 31.5
+    costs.chains["ETH"].gas_price_at -= 3600
+    assert costs.gas_price("ETH") is None
+    assert costs.gas_price("DOGE") is None
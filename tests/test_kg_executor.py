@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+import threading
+
+import numpy as np
+import pytest
+
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from kg_executor import KnowledgeGraphExecutor
+
+RATES = {("INR", "ETH"): 0.0005, ("ETH", "USD"): 2000.0, ("INR", "MATIC"): 0.02, ("MATIC", "USD"): 0.5}
+
+_session = contextvars.ContextVar("session", default=None)
+
+
+@pytest.fixture
+def executor():
+    rag = FinancialRAG(backend=NativeBackend())
+    rag.update_rates(RATES)
+    executor = KnowledgeGraphExecutor(rag)
+    yield executor
+    executor.shutdown()
+
+
+def test_concurrent_calls_run_as_one_job_on_the_worker(executor):
+    def work(n):
+        _session.set(n)
+        return n, threading.current_thread().name
+
+    async def call(n):
+        result = await executor.run(work, n)
+        return result, _session.get()
+
+    async def scenario():
+        return await asyncio.gather(*(call(n) for n in range(5)))
+
+    results = asyncio.run(scenario())
+    assert [(n, session) for (n, _), session in results] == [(n, n) for n in range(5)]
+    assert all(thread.startswith("kg-worker") for (_, thread), _ in results)
+    assert (executor.jobs, executor.calls) == (1, 5)
+
+
+def test_a_failing_call_does_not_fail_its_batch(executor):
+    def fail():
+        raise ValueError("no such corridor")
+
+    async def scenario():
+        return await asyncio.gather(executor.run(fail), executor.run(lambda: "ok"), return_exceptions=True)
+
+    failed, succeeded = asyncio.run(scenario())
+    assert isinstance(failed, ValueError) and succeeded == "ok"
+
+
+def test_concurrent_quote_batches_are_priced_together(executor):
+    first = [("INR", "USD", 1000.0), ("USD", "INR", 5.0)]
+    second = [("INR", "ETH", 10.0)]
+
+    async def scenario():
+        return await asyncio.gather(executor.quote_batch(first), executor.quote_batch(second))
+
+    quoted = asyncio.run(scenario())
+    assert executor.jobs == 1
+    for requests, batch in zip((first, second), quoted):
+        expected = executor.rag.quote_batch(requests)
+        assert batch.routes == expected.routes
+        np.testing.assert_allclose(batch.amount_out, expected.amount_out)
@@ -0,0 +1,30 @@
+import pytest
+
+from rate_aggregation import aggregate_quotes
+
+PAIR = ("INR", "ETH")
+
+
+def test_two_sources_far_apart_keep_the_more_trusted_quote():
+    batches = [{PAIR: 1000.0, ("ETH", "USD"): 0.5}, {PAIR: 1100.0, ("ETH", "USD"): 0.5}]
+    conflicts = {}
+    combined = aggregate_quotes(batches, max_deviation=0.02, weights=[1.0, 2.0], conflicts=conflicts)
+    assert combined[PAIR] == (1100.0, 0.0)
+    assert combined[("ETH", "USD")] == (0.5, 1.0)
+    assert conflicts == {PAIR: [1000.0, 1100.0]}
+
+    # Equal trust: the earlier source wins
+    assert aggregate_quotes(batches)[PAIR] == (1000.0, 0.0)
+
+
+def test_a_failed_source_does_not_shift_the_weights():
+    batches = [None, {PAIR: 1000.0}, {PAIR: 1100.0}]
+    assert aggregate_quotes(batches, weights=[5.0, 1.0, 2.0])[PAIR] == (1100.0, 0.0)
+    with pytest.raises(ValueError):
+        aggregate_quotes(batches, weights=[1.0])
+
+
+def test_outliers_are_still_dropped_when_others_agree():
+    batches = [{PAIR: 1000.0}, {PAIR: 1001.0}, {PAIR: 1500.0}]
+    rate, confidence = aggregate_quotes(batches, method="trimmed_mean")[PAIR]
+    assert rate == pytest.approx(1000.5) and 0 < confidence < 1
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import time
+
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from rate_feed import AggregatedFeedSource, RateFeedIngestor, ReplayFeedSource, StaticFeedSource
+
+
+class CountingReplay(ReplayFeedSource):
+    """A replay source that counts how often its recording is opened."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+
+    async def stream(self):
+        self.opened += 1
+        async for quotes in super().stream():
+            yield quotes
+
+
+def _recording(tmp_path, ticks: int):
+    path = tmp_path / "rates.jsonl"
+    path.write_text("\n".join(json.dumps({"ts": tick * 0.02, "rates": {"INR-ETH": 1000.0 + tick}})
+                              for tick in range(ticks)))
+    return str(path)
+
+
+def test_refresh_does_not_reread_a_streaming_replay(tmp_path):
+    async def scenario():
+        source = CountingReplay(_recording(tmp_path, 50), loop=False)
+        rag = FinancialRAG(backend=NativeBackend())
+        feed = RateFeedIngestor(rag, [source], max_age=0, stale_grace=0, refresh_timeout=1.0)
+        feed.start()
+        while rag.get_exchange_rate("INR", "ETH") is None or rag.get_exchange_rate("INR", "ETH") < 1010:
+            await asyncio.sleep(0.01)
+        before = rag.get_exchange_rate("INR", "ETH")
+        feed.last_update_at = time.time() - 60
+        await feed.ensure_fresh()
+        after = rag.get_exchange_rate("INR", "ETH")
+        await feed.stop()
+        return source.opened, before, after, feed
+
+    opened, before, after, feed = asyncio.run(scenario())
+    # The refresh waited for the stream's next tick instead of replaying the recording from the start
+    assert opened == 1
+    assert after > before
+    assert feed.refreshes == 0
+    assert feed.source_errors == {"replay": 0}
+
+
+def test_refresh_polls_pollable_sources():
+    async def scenario():
+        rag = FinancialRAG(backend=NativeBackend())
+        feed = RateFeedIngestor(rag, [StaticFeedSource({("INR", "ETH"): 1000.0})])
+        await feed.ensure_fresh()
+        return rag.get_exchange_rate("INR", "ETH"), feed.refreshes
+
+    assert asyncio.run(scenario()) == (1000.0, 1)
+
+
+def test_aggregates_are_only_pollable_without_streamed_children(tmp_path):
+    replay = ReplayFeedSource(_recording(tmp_path, 1))
+    assert AggregatedFeedSource([StaticFeedSource(), StaticFeedSource()]).pollable
+    assert not AggregatedFeedSource([StaticFeedSource(), replay]).pollable
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from shared_rates import SharedRateTable
+
+VIA_ETH = {("INR", "ETH"): 0.0005, ("ETH", "USD"): 2000.0, ("INR", "MATIC"): 0.02, ("MATIC", "USD"): 0.5}
+
+
+def _rag() -> FinancialRAG:
+    rag = FinancialRAG(backend=NativeBackend())
+    rag.update_rates(VIA_ETH)
+    return rag
+
+
+def test_cached_routes_follow_the_routers_rates_under_a_pin():
+    rag = _rag()
+    rag.pin()
+    assert rag.quote_route("INR", "USD")["route"]["via"] == ["ETH"]
+    # MATIC becomes cheaper while the session stays pinned to the old version
+    rag.update_rate("MATIC", "USD", 60.0)
+    assert rag.quote_route("INR", "USD")["route"] == rag.find_route("INR", "USD").as_dict()
+    assert rag.quote_route("INR", "USD")["route"]["via"] == ["MATIC"]
+    assert [route.via for route in rag.failover_routes("INR", "USD")] == [("MATIC",), ("ETH",)]
+
+
+def test_unchanged_rates_are_served_from_the_route_cache():
+    rag = _rag()
+    rag.quote_route("INR", "USD")
+    hits = rag._route_cache.stats()["hits"]
+    rag.quote_route("INR", "USD")
+    assert rag._route_cache.stats()["hits"] == hits + 1
+
+
+def test_batch_quotes_match_single_routes_and_carry_the_rate_version():
+    rag = _rag()
+    rag.router.set_fee(("ETH", "USD"), 0.01)
+    requests = [("INR", "USD", 1000.0), ("USD", "INR", 5.0), ("INR", "ETH", 10.0), ("INR", "GBP", 1.0)]
+    batch = rag.quote_batch(requests)
+    assert batch.rate_version == rag.latest_snapshot().version
+    for (from_currency, to_currency, amount), hops, out, fee in zip(requests, batch.routes, batch.amount_out,
+                                                                     batch.fees):
+        route = rag.find_route(from_currency, to_currency)
+        if route is None:
+            assert hops is None and np.isnan(out)
+            continue
+        assert hops == route.hops
+        assert out == pytest.approx(amount * route.effective_rate)
+        assert fee == pytest.approx(amount * route.rate - out)
+
+
+def test_batch_quotes_take_indices_into_an_older_currency_list():
+    rag = _rag()
+    currencies = rag.router.currencies
+    rag.update_rate("AED", "USD", 0.27)  # a new currency renumbers the rest
+    index = {code: k for k, code in enumerate(currencies.tolist())}
+    batch = rag.router.quote_arrays([index["INR"], index["USD"]], [index["USD"], index["MATIC"]], [1000.0, 1.0],
+                                    currencies)
+    assert batch.routes == [rag.find_route("INR", "USD").hops, None]
+    assert "AED" in batch.currencies
+
+
+def test_a_reader_quotes_on_the_shared_tables_latest_rates(tmp_path):
+    path = str(tmp_path / "rates.shm")
+    writer = FinancialRAG(backend=NativeBackend(), shared_table=SharedRateTable(path))
+    reader = FinancialRAG(backend=NativeBackend(), shared_table=SharedRateTable(path))
+    writer.update_rates(VIA_ETH)
+    writer.update_rate("MATIC", "USD", 60.0)
+
+    batch = reader.quote_batch([("INR", "USD", 1000.0)])
+    assert batch.routes == [("INR", "MATIC", "USD")]
+    assert batch.rate_version == writer.latest_snapshot().version
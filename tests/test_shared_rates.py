@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from shared_rates import SharedRateTable
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    return str(tmp_path / "rates.shm")
+
+
+def _rag(path: str) -> FinancialRAG:
+    return FinancialRAG(backend=NativeBackend(), shared_table=SharedRateTable(path), rate_ttl=60)
+
+
+def test_readers_sync_without_writing_their_backend(table_path):
+    writer, reader = _rag(table_path), _rag(table_path)
+    assert writer.is_rate_writer and not reader.is_rate_writer
+    writer.update_rates({("INR", "ETH"): 1000.0, ("ETH", "USD"): 0.5})
+
+    # Any thread may sync a reader, so it must only swap snapshots
+    synced = []
+    thread = threading.Thread(target=lambda: synced.append(reader.snapshot()))
+    thread.start()
+    thread.join()
+    assert synced[0].rates == {("INR", "ETH"): 1000.0, ("ETH", "USD"): 0.5}
+    assert reader.backend.existing_rates() == {}
+
+
+def test_a_reader_taking_over_writes_the_rates_into_its_backend(table_path):
+    writer, reader = _rag(table_path), _rag(table_path)
+    writer.update_rates({("INR", "ETH"): 1000.0})
+    reader.snapshot()
+    writer._shared._lock_file.close()  # the writer process exits
+
+    assert reader.take_over_rate_writer()
+    assert reader.backend.existing_rates() == {("INR", "ETH"): 1000.0}
+
+
+def test_readers_copy_only_the_pairs_changed_since_their_version(table_path):
+    writer, reader = _rag(table_path), _rag(table_path)
+    writer.update_rates({("INR", "ETH"): 1000.0, ("ETH", "USD"): 0.5, ("INR", "USD"): 0.012})
+    reader.snapshot()
+    held = reader._shared_state
+
+    writer.update_rate("ETH", "USD", 0.55)
+    writer.update_rate("INR", "USD", 0.011, ttl=-1)
+    writer.compact()
+    state, rates, _, removed = reader._shared.read_since(held)
+    assert state == (held[0], writer.latest_snapshot().version)
+    assert rates == {("ETH", "USD"): 0.55} and removed == [("INR", "USD")]
+    assert reader.snapshot().rates == {("INR", "ETH"): 1000.0, ("ETH", "USD"): 0.55}
+
+
+def test_a_new_writer_reusing_a_version_is_picked_up(table_path):
+    writer, reader = _rag(table_path), _rag(table_path)
+    writer.update_rates({("INR", "ETH"): 1000.0})
+    assert reader.snapshot().version == 1
+    writer._shared._lock_file.close()  # the writer process exits
+
+    # Its replacement starts over from version 0
+    replacement = _rag(table_path)
+    assert replacement.is_rate_writer
+    replacement.update_rates({("INR", "ETH"): 900.0})
+    assert replacement.latest_snapshot().version == 1
+    assert reader.snapshot().rates == {("INR", "ETH"): 900.0}
+
+
+def test_reader_lookups_read_the_shared_table_in_place(table_path):
+    writer, reader = _rag(table_path), _rag(table_path)
+    writer.update_rates({("INR", "ETH"): 1000.0})
+    reader.pin()
+    writer.update_rate("INR", "ETH", 1100.0)
+
+    # A pinned session keeps its snapshot; otherwise pairs come straight from the mapping
+    assert reader.get_exchange_rate("INR", "ETH") == 1000.0
+    reader.unpin()
+    assert reader.get_exchange_rate("INR", "ETH") == 1100.0
+    assert reader.latest_snapshot().version == 1  # nothing was copied into a snapshot
+    assert reader.lookup_rate("INR", "ETH")["rate_version"] == writer.latest_snapshot().version
+    assert reader.lookup_rate("USD", "ETH")["status"] == "missing"
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from transfer_plan import TransferExecutor, TransferPools, TransferRequest, parse_transfer_request
+
+WALLET = "0x" + "ab" * 20
+UPI_PROMPT = ("I want to transfer 5,000 INR from my Indian account to a US merchant. The recipient's details are: "
+              "Receiver Name: Neelansh, Account: 45612215663, IFSC: Ib8886, Bank: . "
+              "Please find the cheapest way to do this and handle the entire transaction.")
+
+
+@pytest.mark.parametrize("text, expected", [
+    (f"Send 5000 INR to merchant {WALLET} in USD", TransferRequest(5000.0, WALLET)),
+    ("Send 5000 INR to merchant bob@okaxis in the US", TransferRequest(5000.0, "bob@okaxis")),
+    ("pay ₹250.50 to shop@okaxis in dollars", TransferRequest(250.5, "shop@okaxis")),
+    ("Pay 100 INR in USD to shop@okaxis.", TransferRequest(100.0, "shop@okaxis")),
+    ("Transfer Rs. 1,200 to account 123456789 in USD", TransferRequest(1200.0, "123456789")),
+    ("Send 700 INR from alice@oksbi to bob@okaxis in USD", TransferRequest(700.0, "bob@okaxis", sender="alice@oksbi")),
+    (UPI_PROMPT, TransferRequest(5000.0, "45612215663")),
+])
+def test_well_formed_transfers(text, expected):
+    assert parse_transfer_request(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # Negated, conditional or deferred
+    "Don't send 5000 INR to account 123456789 in the US",
+    "Do not transfer 5000 INR to account 123456789 in USD",
+    "Never send 5000 INR to account 123456789 in USD",
+    "Send 5000 INR to account 123456789 in the US but only after I confirm",
+    "Send 5000 INR to account 123456789 in USD tomorrow",
+    "Send 5000 INR to account 123456789 in USD later",
+    "Send 5000 INR to account 123456789 in USD before noon",
+    "If the rate is good, send 5000 INR to account 123456789 in USD",
+    f"Should I send 5000 INR to {WALLET} in USD?",
+    # No payable recipient, or more than one
+    "Pay Rs. 250.50 to merchant shop in USD",
+    "send 5000 INR to us",
+    "Send 5000 INR to bob@gmail.com in USD",
+    "Send 5000 INR to bob@okaxis.in in USD",
+    f"send 5000 INR to {WALLET} and bob@okaxis in USD",
+    # Several amounts or another currency
+    f"send 5000 INR to {WALLET} and 300 INR to bob@upi in USD",
+    "transfer 5000 INR to account 123456789 in EUR",
+    "What are market sentiments today?",
+])
+def test_requests_left_to_the_model(text):
+    assert parse_transfer_request(text) is None
+
+
+def test_every_leg_is_quoted_on_the_pinned_rates():
+    rag = FinancialRAG(backend=NativeBackend())
+    rag.add_path("INR", "USD", "ETH", 0.01)
+    rag.update_rates({("INR", "ETH"): 0.000004, ("ETH", "USD"): 3000.0, ("INR", "USD"): 0.012})
+
+    def fetch_and_update_realtime_rates():
+        return json.dumps({"status": "success", "rate_version": rag.pin().version})
+
+    def find_best_conversion_path(from_currency, to_currency, amount=None):
+        return json.dumps({"status": "success", **rag.quote_route(from_currency, to_currency, amount)})
+
+    def convert_and_transfer(from_currency, to_currency, from_address, to_address, amount):
+        snapshot = rag.snapshot()
+        rate = 1.0 if from_currency == to_currency else snapshot.get(from_currency, to_currency)
+        # The feed keeps publishing while the legs run
+        rag.update_rates({("ETH", "USD"): 3000.0 + snapshot.version})
+        return json.dumps({"status": "success", "amount_out": amount * rate, "rate_version": snapshot.version})
+
+    tools = {"fetch_and_update_realtime_rates": fetch_and_update_realtime_rates,
+             "find_best_conversion_path": find_best_conversion_path, "convert_and_transfer": convert_and_transfer}
+    executor = TransferExecutor(rag, tools, TransferPools("inb", "inc", "usc", "usb"))
+    result = asyncio.run(executor.execute(TransferRequest(5000.0, WALLET)))
+
+    assert result["status"] == "success"
+    assert len(result["legs"]) == 3
+    assert len({leg["rate_version"] for leg in result["legs"]}) == 1
+    assert result["amount_out"] == pytest.approx(5000.0 * 0.000004 * 3000.0)
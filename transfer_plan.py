@@ -0,0 +1,236 @@
+"""
+Compiled execution of standard transfers.
+
+Most requests the agents get are plain "send N INR to this merchant"
+transfers, and for those the model only walks a fixed plan: fetch the
+rates, find the best path, then three convert_and_transfer legs (INR into
+the Indian bank pool, crypto from the Indian to the US crypto pool, USD out
+to the merchant), refunding the user if a leg fails. parse_transfer_request()
+recognizes such requests and TransferExecutor runs that plan directly with
+the same tools and pool addresses, so the common case takes as long as the
+payment legs rather than a round trip to the model per step. Anything the
+parser is unsure about returns None and goes to the model as before.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import re
+from dataclasses import dataclass
+from typing import Callable, Mapping
+
+from financerag import FinancialRAG
+
+_UNSET = object()
+
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)"
+_INR_AMOUNT = re.compile(
+    rf"(?:(?:₹|\brs\.?|\binr)\s*{_AMOUNT}|\b{_AMOUNT}\s*(?:inr|rupees?|rs)\b)", re.IGNORECASE)
+_ANY_AMOUNT = re.compile(r"(?<![\w.])\d[\d,]*(?:\.\d+)?(?![\w.])")
+_VERB = re.compile(r"\b(send|transfer|pay|remit)\b", re.IGNORECASE)
+# "US" only in capitals, so the pronoun does not count
+_US_TARGET = re.compile(r"\b(?:US|USA|(?i:usd|dollars?))\b|\$")
+_OTHER_CURRENCY = re.compile(r"\b(eur|gbp|jpy|aud|cad|sgd|aed|euros?|pounds?|yen)\b", re.IGNORECASE)
+# Questions, negations, conditions, confirmations and schedules need the model's judgement
+_NEEDS_MODEL = re.compile(
+    r"\?|\b(predict\w*|forecast\w*|sentiment|signals?|analy[sz]\w*|should|whether|if|unless|when|until|"
+    r"don['’]?t|do\s+not|never|not|cannot|can['’]t|confirm\w*|approv\w*|wait|after|before|later|tomorrow|"
+    r"tonight|schedul\w*|every|recurring|split|refund|cancel)\b", re.IGNORECASE)
+# A UPI handle has no dots, so an email address (bob@gmail.com) is never cut down to one
+_UPI_ID = r"[\w.\-]+@[A-Za-z][\w\-]*(?![\w.\-@]*[\w@])"
+_SENDER = re.compile(rf"\bfrom\s+(?:account\s+|upi\s+)?({_UPI_ID}|0x[0-9a-fA-F]{{40}}|\d{{6,18}})\b", re.IGNORECASE)
+# Only identifiers a payout can go to: account numbers, wallet addresses and UPI ids, never bare names
+_RECIPIENTS = [
+    re.compile(r"\baccount(?:\s+number)?\s*[:#]?\s*(\d{6,18})\b", re.IGNORECASE),
+    re.compile(r"\b(0x[0-9a-fA-F]{40})\b"),
+    re.compile(rf"(?<![\w.\-])({_UPI_ID})\b"),
+]
+
+
+@dataclass(frozen=True)
+class TransferRequest:
+    amount: float
+    recipient: str
+    sender: str = "user"
+    from_currency: str = "INR"
+    to_currency: str = "USD"
+
+
+@dataclass(frozen=True)
+class TransferPools:
+    indian_bank: str
+    indian_crypto: str
+    usa_crypto: str
+    usa_bank: str
+
+
+def parse_transfer_request(text: str) -> TransferRequest | None:
+    """
+    The transfer in `text` if it is a well-formed INR -> USD request: one
+    INR amount, a transfer verb and one recipient (account number, wallet
+    address or UPI id). None for anything else.
+    """
+    if not _VERB.search(text) or _NEEDS_MODEL.search(text) or _OTHER_CURRENCY.search(text):
+        return None
+    amounts = {float((a or b).replace(",", "")) for a, b in _INR_AMOUNT.findall(text)}
+    if len(amounts) != 1 or len(_ANY_AMOUNT.findall(_strip_identifiers(text))) != 1:
+        return None
+    amount = amounts.pop()
+    if amount <= 0 or not _US_TARGET.search(text):
+        return None
+    sender = _SENDER.search(text)
+    recipients = set()
+    for pattern in _RECIPIENTS:
+        recipients.update(match for match in pattern.findall(text) if not sender or match != sender.group(1))
+    if len(recipients) != 1:
+        return None
+    return TransferRequest(amount, recipients.pop(), sender.group(1) if sender else "user")
+
+
+def _strip_identifiers(text: str) -> str:
+    """`text` without account numbers, addresses and codes, so only amounts are left to count."""
+    text = re.sub(r"\b0x[0-9a-fA-F]+\b|[\w.\-]+@[\w.\-]+", " ", text)
+    text = re.sub(r"\b(?:account(?:\s+number)?|ifsc|a/c)\s*[:#]?\s*\w+", " ", text, flags=re.IGNORECASE)
+    return text
+
+
+async def _run_in_thread(name: str, tool, **args):
+    """Runs a tool in a worker thread and copies back the context variables it sets, as KnowledgeGraphExecutor.run does."""
+    context = contextvars.copy_context()
+    result = await asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, tool, **args))
+    for var, value in context.items():
+        if var.get(_UNSET) is not value:
+            var.set(value)
+    return result
+
+
+class TransferExecutor:
+    """
+    Runs the fixed transfer plan over the agent's `tools` (name -> tool
+    returning JSON, as offered to the model). `run`, if given, is an async
+    runner `run(name, tool, **args)` to call tools through; by default they
+    run in a worker thread. Either way the rate snapshot the rates tool pins
+    must reach the caller's context, so every leg is quoted on it.
+    """
+    def __init__(self, rag: FinancialRAG, tools: Mapping[str, Callable[..., str]], pools: TransferPools, run=None):
+        self.rag = rag
+        self.tools = tools
+        self.pools = pools
+        self._run = run or _run_in_thread
+        # The console agent's path tool always routes via ETH and takes no amount
+        self._quotes_amounts = "amount" in inspect.signature(tools["find_best_conversion_path"]).parameters
+        self.compiled = 0
+        self.fallbacks = 0
+
+    async def _call(self, name: str, **args) -> dict:
+        result = await self._run(name, self.tools[name], **args)
+        try:
+            return json.loads(result)
+        except (TypeError, ValueError):
+            return {"status": "error", "message": str(result)}
+
+    def _chains(self, quote: dict, amount: float) -> list[tuple[str, float]] | None:
+        """(chain, INR amount) per crypto leg, or None if the route does not fit the three-leg plan."""
+        if "split" in quote:
+            legs = [(split["via"], split["amount_in"]) for split in quote["split"]["splits"]]
+        elif "route" in quote:
+            legs = [(quote["route"]["via"], amount)]
+        else:
+            legs = [([quote["best_path_via"]], amount)]
+        if any(len(via) != 1 for via, _ in legs):
+            return None
+        return [(via[0], share) for via, share in legs]
+
+    async def execute(self, request: TransferRequest) -> dict | None:
+        """
+        Runs the plan for `request` and returns its result with a `summary`.
+        Returns None, before any money moves, when the best route does not
+        fit the plan (e.g. more than one intermediate currency), so the
+        caller can hand the request to the model instead.
+        """
+        rates = await self._call("fetch_and_update_realtime_rates")
+        if rates.get("status") != "success":
+            return self._result("error", request, [], f"Could not read rates: {rates.get('message')}")
+        # Whatever the runner did with it, the rest of the plan is quoted on one rate version
+        snapshot = self.rag.pinned_snapshot() or self.rag.pin()
+        amount = {"amount": request.amount} if self._quotes_amounts else {}
+        quote = await self._call("find_best_conversion_path", from_currency=request.from_currency,
+                                 to_currency=request.to_currency, **amount)
+        if quote.get("status") != "success":
+            return self._result("error", request, [], quote.get("message", "No conversion path found."))
+        chains = self._chains(quote, request.amount)
+        if chains is None:
+            self.fallbacks += 1
+            return None
+        self.compiled += 1
+        legs = []
+
+        # a) The user pays INR into the Indian bank pool
+        payment = await self._call("convert_and_transfer", from_currency=request.from_currency,
+                                   to_currency=chains[0][0], from_address=request.sender,
+                                   to_address=self.pools.indian_bank, amount=request.amount)
+        legs.append(payment)
+        if payment.get("status") != "success":
+            return self._result("error", request, legs, f"User payment failed: {payment.get('message')}")
+
+        # b) and c) per chain: pool-to-pool crypto transfer, then the USD payout
+        paid_out, unpaid, failures = 0.0, 0.0, []
+        for chain, share in chains:
+            tried = set()
+            while chain is not None:
+                tried.add(chain)
+                rate = snapshot.get(request.from_currency, chain)
+                if not rate:
+                    transfer = {"status": "error", "message": f"No rate for {request.from_currency}->{chain}."}
+                    break
+                transfer = await self._call("convert_and_transfer", from_currency=chain, to_currency=chain,
+                                            from_address=self.pools.indian_crypto, to_address=self.pools.usa_crypto,
+                                            amount=share * rate)
+                legs.append(transfer)
+                if transfer.get("status") == "success":
+                    break
+                # The chain is down: retry on the precomputed failover route, if it is a single chain
+                route = transfer.get("failover", {}).get(f"{request.from_currency}-{request.to_currency}")
+                chain = route["via"][0] if route and len(route["via"]) == 1 and route["via"][0] not in tried else None
+            if transfer.get("status") != "success":
+                unpaid += share
+                failures.append(transfer.get("message"))
+                continue
+            payout = await self._call("convert_and_transfer", from_currency=chain, to_currency=request.to_currency,
+                                      from_address=self.pools.usa_crypto, to_address=request.recipient,
+                                      amount=transfer["amount_out"])
+            legs.append(payout)
+            if payout.get("status") != "success":
+                unpaid += share
+                failures.append(payout.get("message"))
+                continue
+            paid_out += payout["amount_out"]
+
+        if not unpaid:
+            return self._result("success", request, legs, None, paid_out)
+        # Refund whatever did not reach the merchant from the Indian bank pool
+        refund = await self._call("convert_and_transfer", from_currency=request.from_currency,
+                                  to_currency=request.from_currency, from_address=self.pools.indian_bank,
+                                  to_address=request.sender, amount=unpaid)
+        legs.append(refund)
+        if refund.get("status") != "success":
+            failures.append(f"refund of {unpaid:.2f} {request.from_currency} failed: {refund.get('message')}")
+            return self._result("error", request, legs, "; ".join(str(f) for f in failures), paid_out)
+        return self._result("refunded", request, legs, "; ".join(str(f) for f in failures), paid_out, unpaid)
+
+    @staticmethod
+    def _result(status: str, request: TransferRequest, legs: list[dict], error: str | None,
+                amount_out: float = 0.0, refunded: float = 0.0) -> dict:
+        if status == "success":
+            summary = (f"Transferred {request.amount:.2f} {request.from_currency} to {request.recipient}: "
+                       f"{amount_out:.2f} {request.to_currency} paid out in {len(legs)} steps.")
+        elif status == "refunded":
+            summary = (f"Transfer to {request.recipient} failed ({error}); "
+                       f"{refunded:.2f} {request.from_currency} refunded to {request.sender}"
+                       + (f", {amount_out:.2f} {request.to_currency} was paid out." if amount_out else "."))
+        else:
+            summary = f"Transfer to {request.recipient} failed: {error}"
+        print(f"[TOOL LOG] Compiled transfer: {summary}")
+        return {"status": status, "amount_in": request.amount, "amount_out": amount_out, "refunded": refunded,
+                "legs": legs, "summary": summary}
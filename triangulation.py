@@ -0,0 +1,98 @@
+"""
+Cross rates from base quotes.
+
+In a consistent market every rate follows from one number per currency: how
+much of it one unit of a common base buys. cross_rates() builds the full
+N x N matrix, inverses included, from those N quotes in one NumPy operation.
+fit_base_quotes() recovers them from an arbitrary table of quoted pairs by
+least squares in log space, so quotes that disagree with the rest of the
+table stand out against the triangulated value.
+
+Rates follow the FinancialRAG convention: rate[(from, to)] is how many units
+of `to` one unit of `from` buys.
+"""
+from typing import Mapping
+
+import numpy as np
+
+
+def cross_rates(base: str, base_quotes: Mapping[str, float]) -> tuple[list[str], np.ndarray]:
+    """
+    `base_quotes[c]` is how many units of c one unit of `base` buys. Returns
+    the currencies (base first) and the matrix whose [i, j] entry is the rate
+    from currency i to currency j.
+    """
+    currencies = [base] + [currency for currency in base_quotes if currency != base]
+    per_base = np.array([1.0] + [float(base_quotes[currency]) for currency in currencies[1:]])
+    return currencies, per_base[np.newaxis, :] / per_base[:, np.newaxis]
+
+
+def cross_rate_table(base: str, base_quotes: Mapping[str, float]) -> dict[tuple[str, str], float]:
+    """cross_rates() as {(from, to): rate} for every ordered pair of distinct currencies."""
+    currencies, matrix = cross_rates(base, base_quotes)
+    rows, columns = np.nonzero(~np.eye(len(currencies), dtype=bool))
+    return {(currencies[i], currencies[j]): float(matrix[i, j]) for i, j in zip(rows.tolist(), columns.tolist())}
+
+
+def _connected(pairs, base: str) -> set[str]:
+    """Currencies linked to `base` by a chain of quotes in either direction."""
+    neighbours: dict[str, set[str]] = {}
+    for from_currency, to_currency in pairs:
+        neighbours.setdefault(from_currency, set()).add(to_currency)
+        neighbours.setdefault(to_currency, set()).add(from_currency)
+    reached, frontier = {base}, [base]
+    while frontier:
+        for currency in neighbours.get(frontier.pop(), ()):
+            if currency not in reached:
+                reached.add(currency)
+                frontier.append(currency)
+    return reached
+
+
+def fit_base_quotes(quotes: Mapping[tuple[str, str], float], base: str) -> dict[str, float]:
+    """
+    The base quotes that best explain a table of quoted pairs, fitting
+    log(rate[i, j]) = log(q[j]) - log(q[i]) by least squares. Currencies
+    with no chain of quotes to `base` are left out.
+    """
+    quotes = {pair: rate for pair, rate in quotes.items() if rate > 0 and pair[0] != pair[1]}
+    reachable = _connected(quotes, base)
+    others = sorted(reachable - {base})
+    if not others:
+        return {}
+    column = {currency: k for k, currency in enumerate(others)}
+    pairs = [pair for pair in quotes if pair[0] in reachable]
+    design = np.zeros((len(pairs), len(others)))
+    for row, (from_currency, to_currency) in enumerate(pairs):
+        if to_currency in column:
+            design[row, column[to_currency]] += 1
+        if from_currency in column:
+            design[row, column[from_currency]] -= 1
+    targets = np.log([quotes[pair] for pair in pairs])
+    solution = np.linalg.lstsq(design, targets, rcond=None)[0]
+    return dict(zip(others, np.exp(solution).tolist()))
+
+
+def inconsistent_quotes(quotes: Mapping[tuple[str, str], float], base: str,
+                        tolerance: float = 0.01) -> list[dict]:
+    """
+    Quoted pairs whose rate differs from the cross rate triangulated from the
+    whole table by more than `tolerance` (relative), worst first. Only pairs
+    connected to `base` are checked.
+    """
+    base_quotes = fit_base_quotes(quotes, base)
+    if not base_quotes:
+        return []
+    currencies, matrix = cross_rates(base, base_quotes)
+    index = {currency: i for i, currency in enumerate(currencies)}
+    pairs = [pair for pair, rate in quotes.items()
+             if pair[0] in index and pair[1] in index and pair[0] != pair[1] and rate > 0]
+    if not pairs:
+        return []
+    quoted = np.array([quotes[pair] for pair in pairs])
+    triangulated = matrix[[index[f] for f, _ in pairs], [index[t] for _, t in pairs]]
+    deviation = np.abs(quoted / triangulated - 1)
+    flagged = np.nonzero(deviation > tolerance)[0]
+    return [{"pair": f"{pairs[k][0]}-{pairs[k][1]}", "quoted": float(quoted[k]),
+             "triangulated": float(triangulated[k]), "deviation_bps": round(float(deviation[k]) * 1e4, 1)}
+            for k in flagged[np.argsort(-deviation[flagged])].tolist()]
@@ -26,18 +26,79 @@ from uagents.setup import fund_agent_if_low
 
 # --- Knowledge Graph & RAG Imports ---
 from hyperon import MeTTa
-from knowledge import initialize_financial_knowledge_graph
+from arbitrage import ArbitrageDetector
+from chain_costs import ChainCostModel
+from knowledge import FIAT_CURRENCIES, apply_hot_corridors, apply_liquidity_curves, initialize_financial_knowledge_graph
 from financerag import FinancialRAG
+from kg_backends import NativeBackend
+from kg_executor import KnowledgeGraphExecutor
+from rate_feed import RateFeedIngestor, build_feed
+from shared_rates import SharedRateTable
+from transfer_plan import TransferExecutor, TransferPools, parse_transfer_request
 
 # --- Placeholder Imports for Custom Modules ---
 from payment_gateway import pay_inr
-from payment_sender import send_native
+from payment_sender import CHAIN_CONFIG, TRANSFER_GAS_LIMIT, send_native
 
 # --- Initialization ---
 dotenv.load_dotenv()
-metta = MeTTa()
-initialize_financial_knowledge_graph(metta)
-financial_rag = FinancialRAG(metta)
+# KG_BACKEND=native keeps rates and paths in plain dicts instead of a MeTTa space
+KG_BACKEND = os.getenv("KG_BACKEND", "metta")
+metta = MeTTa() if KG_BACKEND == "metta" else None
+# With several API workers, point SHARED_RATE_TABLE at a file (e.g. under /dev/shm):
+# the first worker becomes the rate writer and the rest read its table in place.
+# Readers check every RATE_WRITER_CHECK_INTERVAL seconds whether the writer has exited and take over.
+SHARED_RATE_TABLE = os.getenv("SHARED_RATE_TABLE")
+RATE_WRITER_CHECK_INTERVAL = float(os.getenv("RATE_WRITER_CHECK_INTERVAL", "5"))
+# Rate facts expire after RATE_TTL_SECONDS; compaction caps the graph at KG_MAX_RATES rate facts
+RATE_TTL_SECONDS = float(os.getenv("RATE_TTL_SECONDS", "300"))
+KG_MAX_RATES = int(os.getenv("KG_MAX_RATES", "10000"))
+KG_COMPACTION_INTERVAL = float(os.getenv("KG_COMPACTION_INTERVAL", "30"))
+financial_rag = FinancialRAG(
+    metta,
+    shared_table=SharedRateTable(SHARED_RATE_TABLE) if SHARED_RATE_TABLE else None,
+    rate_ttl=RATE_TTL_SECONDS,
+    max_rates=KG_MAX_RATES,
+    backend=NativeBackend() if KG_BACKEND == "native" else None,
+    fiat_currencies=FIAT_CURRENCIES,
+)
+# Warm start from the last on-disk snapshot; only build the graph from scratch without one
+KG_SNAPSHOT_PATH = os.getenv("KG_SNAPSHOT_PATH", "kg_snapshot.bin")
+KG_SNAPSHOT_INTERVAL = float(os.getenv("KG_SNAPSHOT_INTERVAL", "60"))
+if not financial_rag.load_snapshot(KG_SNAPSHOT_PATH):
+    initialize_financial_knowledge_graph(financial_rag)
+apply_liquidity_curves(financial_rag)
+apply_hot_corridors(financial_rag)
+# Async handlers reach the knowledge graph through one dedicated worker thread
+kg_executor = KnowledgeGraphExecutor(financial_rag)
+# Tools that mostly work on the knowledge graph; the rest (payments, agent
+# discovery) block on network I/O and run on the default thread pool instead.
+KG_TOOLS = {"fetch_and_update_realtime_rates", "find_best_conversion_path"}
+# Rates stream in continuously from RATE_FEED (static, http, websocket or replay;
+# RATE_FEED_URL is the endpoint or recording). Comma-separated lists name several
+# feeds, which are queried concurrently and aggregated. Only the rate writer ingests.
+RATE_FEED = os.getenv("RATE_FEED", "static")
+RATE_FEED_URL = os.getenv("RATE_FEED_URL")
+RATE_FEED_INTERVAL = float(os.getenv("RATE_FEED_INTERVAL", "5"))
+RATE_FEED_TIMEOUT = float(os.getenv("RATE_FEED_TIMEOUT", "2"))
+# Quotes use rates up to RATE_MAX_AGE seconds old, serve them for RATE_STALE_GRACE
+# more while one shared refresh runs, and wait for it beyond that
+RATE_MAX_AGE = float(os.getenv("RATE_MAX_AGE", "10"))
+RATE_STALE_GRACE = float(os.getenv("RATE_STALE_GRACE", "30"))
+rate_feed = RateFeedIngestor(financial_rag, [build_feed(RATE_FEED, RATE_FEED_URL, RATE_FEED_INTERVAL, RATE_FEED_TIMEOUT)],
+                             apply=kg_executor.run, max_age=RATE_MAX_AGE, stale_grace=RATE_STALE_GRACE)
+# Rate batches are checked for arbitrage cycles in the background; a cycle gaining more
+# than ARBITRAGE_TOLERANCE_BPS per hop gets its suspect edge quarantined from routing
+ARBITRAGE_TOLERANCE_BPS = float(os.getenv("ARBITRAGE_TOLERANCE_BPS", "1"))
+arbitrage_detector = ArbitrageDetector(financial_rag, tolerance_bps=ARBITRAGE_TOLERANCE_BPS)
+# Path costs follow each chain's gas price (polled once a block) and settlement time:
+# cost = gas fee / PATH_COST_REFERENCE_AMOUNT (in the source currency) + SETTLEMENT_TIME_VALUE
+# (cost of waiting, as a fraction of the amount per hour) * hours to settle
+PATH_COST_REFERENCE_AMOUNT = float(os.getenv("PATH_COST_REFERENCE_AMOUNT", "10000"))
+SETTLEMENT_TIME_VALUE = float(os.getenv("SETTLEMENT_TIME_VALUE", "0.001"))
+chain_costs = ChainCostModel(financial_rag, CHAIN_CONFIG, gas_per_transfer=TRANSFER_GAS_LIMIT,
+                             time_value_per_hour=SETTLEMENT_TIME_VALUE, reference_amount=PATH_COST_REFERENCE_AMOUNT,
+                             apply=kg_executor.run)
 
 # --- API and Pool Configuration ---
 API_KEY = os.getenv("ASI_ONE_API_KEY")
@@ -128,36 +189,26 @@ def multiply(a: float, b: float) -> float:
 
 def fetch_and_update_realtime_rates() -> str:
     """
-    Fetches the latest currency conversion rates from a simulated external API
-    and updates the agent's knowledge graph with this new information.
+    Returns the latest currency conversion rates. The background rate feed
+    keeps the agent's knowledge graph current, so this only reads it.
+    """
+    print("\n[TOOL LOG] Reading latest rates from the rate feed...")
+    # Pin the latest rates so every leg of this session is quoted on them
+    snapshot = financial_rag.pin()
+    rate_age_ms = round((time.time() - snapshot.created_at) * 1000, 1)
+    return json.dumps({"status": "success", "message": "Knowledge graph holds the latest market rates.",
+                       "rate_version": snapshot.version, "rate_age_ms": rate_age_ms})
+
+def find_best_conversion_path(from_currency: str, to_currency: str, amount: float | None = None) -> str:
+    """
+    Finds the most cost-effective intermediate currency for a conversion using
+    the knowledge graph. Given an amount, large transfers are split across routes.
     """
-    print("\n[TOOL LOG] Fetching real-time rates from external API...")
-    eth_inr=0.001
-    eth_usd=0.2
-    inr_matic=0.0000001
-    usd_matic=90
-    
-    mock_api_response = {
-        "INR-ETH": 1 / eth_inr, 
-        "ETH-INR":eth_inr,
-        "ETH-USD": 0.1/eth_usd,
-        "USD-ETH": eth_usd,
-        "INR-MATIC": inr_matic, 
-        "MATIC-INR": 1/inr_matic,
-        "USD-MATIC": usd_matic,
-        "MATIC-USD": 0.1/usd_matic,
-    }
-    for pair, rate in mock_api_response.items():
-        from_curr, to_curr = pair.split('-')
-        financial_rag.update_rate(from_curr, to_curr, rate)
-    return json.dumps({"status": "success", "message": "Knowledge graph updated with latest market rates."})
-
-def find_best_conversion_path(from_currency: str, to_currency: str) -> str:
-    """Finds the most cost-effective intermediate currency for a conversion using the knowledge graph."""
     print(f"\n[TOOL LOG] Finding best path from {from_currency} to {to_currency}...")
-    path = financial_rag.find_best_path(from_currency.upper(), to_currency.upper())
-    if path:
-        return json.dumps({"status": "success", "best_path_via": path})
+    # Split, multi-hop route or declared path, from the route cache while rates are unchanged
+    quote = financial_rag.quote_route(from_currency, to_currency, amount)
+    if quote:
+        return json.dumps({"status": "success", **quote})
     return json.dumps({"status": "error", "message": "No valid conversion path found in the knowledge graph."})
 
 def convert_and_transfer(from_currency: str, to_currency: str, from_address: str, to_address: str, amount: float) -> str:
@@ -167,8 +218,12 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
     """
     print(f"\n[TOOL LOG] Executing step: {amount:.4f} {from_currency} from '{from_address}' to '{to_address}'...")
     
-    rate = financial_rag.get_exchange_rate(from_currency.upper(), to_currency.upper())
+    snapshot = financial_rag.snapshot()
+    quote = snapshot.lookup(from_currency.upper(), to_currency.upper())
+    rate = quote.get("rate") if quote["status"] == "fresh" else None
     if rate is None and from_currency.upper() != to_currency.upper():
+         if quote["status"] == "stale":
+             return json.dumps({"status": "error", "message": f"The rate for {from_currency}->{to_currency} is stale. Call fetch_and_update_realtime_rates to refresh it."})
          return json.dumps({"status": "error", "message": f"No rate found for {from_currency}->{to_currency} in knowledge graph."})
     
     output_amount = amount * rate if rate else amount
@@ -185,18 +240,28 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
             if payment_status.get("status") == "success":
                 return json.dumps({
                     "status": "success", "message": "User INR payment successful.",
-                    "amount_in": amount, "amount_out": output_amount, "details": payment_status
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version, "details": payment_status
                 })
         
         # Case 2: System moves crypto from Indian pool to US pool
         elif from_currency.upper() == to_currency.upper() and from_address == INDIAN_CRYPTO_POOL:
             print("send native callled")
-            tx_hash = send_native(from_currency, to_address, amount)
+            try:
+                tx_hash = send_native(from_currency, to_address, amount,
+                                      gas_price_gwei=chain_costs.gas_price(from_currency.upper()))
+            except Exception as e:
+                # The chain is unusable: hand back the precomputed routes around it instead of replanning
+                print(f"[TOOL LOG] Transfer on {from_currency} failed: {e}")
+                return json.dumps({
+                    "status": "error", "message": f"Transfer on {from_currency} failed: {e}",
+                    "failover": financial_rag.failover_avoiding(from_currency.upper())
+                })
+            chain_costs.track(from_currency.upper(), tx_hash)
             print(f"[ACTION] Simulating transfer of {amount:.6f} {from_currency} from {INDIAN_CRYPTO_POOL} to {USA_CRYPTO_POOL}. TxHash: {tx_hash}")
             if tx_hash:
                  return json.dumps({
                     "status": "success", "message": f"Cross-border transfer successful. Hash: {tx_hash}",
-                    "amount_in": amount, "amount_out": output_amount
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version
                 })
         
         # Case 3: System "sells" crypto from US pool and pays out USD to merchant
@@ -212,11 +277,11 @@ def convert_and_transfer(from_currency: str, to_currency: str, from_address: str
             if payment_status.get("status") == "success":
                 return json.dumps({
                     "status": "success", "message": "User INR payment successful.",
-                    "amount_in": amount, "amount_out": output_amount, "details": payment_status
+                    "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version, "details": payment_status
                 })
             return json.dumps({
                 "status": "success", "message": "Final USD payout to merchant successful.",
-                "amount_in": amount, "amount_out": output_amount
+                "amount_in": amount, "amount_out": output_amount, "rate_version": snapshot.version
             })
             
         return json.dumps({"status": "error", "message": "Transaction logic for this step is not defined."})
@@ -276,7 +341,7 @@ def discover_expert_agent(task_description: str) -> str:
 tools_schema = [
     {"type": "function", "function": {"name": "multiply", "description": "Multiplies two numbers.", "parameters": {"type": "object", "properties": {"a": {"type": "number"}, "b": {"type": "number"}}, "required": ["a", "b"]}}},
     {"type": "function", "function": {"name": "fetch_and_update_realtime_rates", "description": "Use this tool first to get the latest market conversion rates before making any decisions.", "parameters": {"type": "object", "properties": {}, "required": []}}},
-    {"type": "function", "function": {"name": "find_best_conversion_path", "description": "After getting rates, use this to find the cheapest crypto path between two fiat currencies.", "parameters": {"type": "object", "properties": {"from_currency": {"type": "string", "description": "The source currency code (e.g., 'INR')."}, "to_currency": {"type": "string", "description": "The final target currency code (e.g., 'USD')."}}, "required": ["from_currency", "to_currency"]}}},
+    {"type": "function", "function": {"name": "find_best_conversion_path", "description": "After getting rates, use this to find the cheapest crypto path between two fiat currencies.", "parameters": {"type": "object", "properties": {"from_currency": {"type": "string", "description": "The source currency code (e.g., 'INR')."}, "to_currency": {"type": "string", "description": "The final target currency code (e.g., 'USD')."}, "amount": {"type": "number", "description": "Optional amount in the source currency; large amounts may be split across several routes."}}, "required": ["from_currency", "to_currency"]}}},
     {"type": "function", "function": {"name": "convert_and_transfer", "description": "Executes a single conversion and transfer step. Use this for each leg of the journey.", "parameters": {"type": "object", "properties": {"from_currency": {"type": "string", "description": "The source currency for this step (e.g., 'INR', 'ETH')."}, "to_currency": {"type": "string", "description": "The target currency for this step (e.g., 'ETH', 'USD')."}, "from_address": {"type": "string", "description": "Sender's account identifier for this step."}, "to_address": {"type": "string", "description": "Receiver's account identifier for this step."}, "amount": {"type": "number", "description": "The amount in the source currency."}}, "required": ["from_currency", "to_currency", "from_address", "to_address", "amount"]}}},
     {"type": "function", "function": {"name": "discover_expert_agent", "description": "Finds and queries an expert agent for complex, non-financial tasks like market analysis or predictions.", "parameters": {"type": "object", "properties": {"task_description": {"type": "string", "description": "A clear and concise description of the task for the expert agent."}}, "required": ["task_description"]}}},
     {"type": "function", "function": {"name": "fetch_and_update_realtime_rates", "description": "Gets latest market rates.", "parameters": {"type": "object", "properties": {}}}}
@@ -409,6 +474,22 @@ tools_schema = [
 
 
 
+async def run_tool(name: str, tool, **args) -> str:
+    # Keep tool work off the event loop so other agents and HTTP requests stay responsive;
+    # KG tool calls from concurrent sessions are batched into one job on the KG worker
+    if name in KG_TOOLS:
+        return await kg_executor.run(tool, **args)
+    return await asyncio.to_thread(tool, **args)
+
+# Well-formed transfer requests run the fixed plan directly instead of through the model
+transfer_executor = TransferExecutor(
+    financial_rag,
+    {"fetch_and_update_realtime_rates": fetch_and_update_realtime_rates,
+     "find_best_conversion_path": find_best_conversion_path, "convert_and_transfer": convert_and_transfer},
+    TransferPools(INDIAN_BANK_POOL, INDIAN_CRYPTO_POOL, USA_CRYPTO_POOL, USA_BANK_POOL),
+    run=run_tool,
+)
+
 # # --- Core Agentic Logic (Refactored for Reusability) ---
 async def run_agentic_process(user_query: str, ctx: Context = None) -> str:
     """
@@ -421,6 +502,17 @@ async def run_agentic_process(user_query: str, ctx: Context = None) -> str:
         {"role": "user", "content": user_query}
     ]
     available_tools = {"fetch_and_update_realtime_rates": fetch_and_update_realtime_rates, "find_best_conversion_path": find_best_conversion_path, "convert_and_transfer": convert_and_transfer, "multiply": multiply, "discover_expert_agent": discover_expert_agent}
+    # Each session starts unpinned; fetch_and_update_realtime_rates pins the rate version it quotes on
+    financial_rag.unpin()
+
+    # A plain transfer needs no model round trips; the model only gets what the parser can't place
+    transfer = parse_transfer_request(user_query)
+    if transfer is not None:
+        if financial_rag.is_rate_writer:
+            await rate_feed.ensure_fresh()
+        result = await transfer_executor.execute(transfer)
+        if result is not None:
+            return result["summary"]
     
     for turn in range(10): # Max 10 turns
         if ctx: ctx.logger.info(f"--- Agent Turn {turn + 1} ---")
@@ -441,7 +533,11 @@ async def run_agentic_process(user_query: str, ctx: Context = None) -> str:
             for call in response_message.get("tool_calls", []):
                 func_name = call["function"]["name"]
                 args = json.loads(call["function"].get("arguments", "{}"))
-                result = available_tools.get(func_name, lambda: "Unknown tool")(**args)
+                tool = available_tools.get(func_name, lambda: "Unknown tool")
+                # Concurrent sessions share one refresh instead of each hitting the feed
+                if func_name == "fetch_and_update_realtime_rates" and financial_rag.is_rate_writer:
+                    await rate_feed.ensure_fresh()
+                result = await run_tool(func_name, tool, **args)
                 tool_outputs.append({"tool_call_id": call["id"], "role": "tool", "name": func_name, "content": str(result)})
             messages.extend(tool_outputs)
 
@@ -601,6 +697,23 @@ async def on_financial_request(ctx: Context, sender: str, msg: FinancialRequest)
 primary_agent.include(agent_protocol)
 financial_agent.include(agent_protocol)
 
+@financial_agent.on_interval(period=KG_SNAPSHOT_INTERVAL)
+async def persist_knowledge_graph(ctx: Context):
+    """Periodically snapshots the knowledge graph so a restart can warm-start from it."""
+    if financial_rag.is_rate_writer:
+        await kg_executor.run(financial_rag.save_snapshot, KG_SNAPSHOT_PATH)
+
+@financial_agent.on_interval(period=KG_COMPACTION_INTERVAL)
+async def compact_knowledge_graph(ctx: Context):
+    """Evicts expired and over-capacity rate facts from the knowledge graph."""
+    await kg_executor.run(financial_rag.compact)
+
+@financial_agent.on_interval(period=RATE_WRITER_CHECK_INTERVAL)
+async def take_over_rate_writer(ctx: Context):
+    """In a reader worker, starts ingesting rates if the writer worker has exited."""
+    if await kg_executor.run(financial_rag.take_over_rate_writer):
+        rate_feed.start()
+
 
 # --- FastAPI Application Setup ---
 bureau = Bureau(endpoint="http://127.0.0.1:8001", port=8001)
@@ -613,19 +726,34 @@ async def lifespan(app: FastAPI):
     # Schedule the bureau's asynchronous run method as a background task
     bureau_task = asyncio.create_task(bureau.run_async())
     print("--- Agent Bureau running in background ---")
+    arbitrage_detector.start()
+    # Path facts are per process (the shared table carries rates only), so every worker keeps its own costs current
+    chain_costs.start()
+    if financial_rag.is_rate_writer:
+        rate_feed.start()
     yield
+    await rate_feed.stop()
+    await chain_costs.stop()
+    arbitrage_detector.stop()
     print("--- Shutting down agent bureau ---")
     bureau_task.cancel()
     try:
         await bureau_task
     except asyncio.CancelledError:
         print("--- Agent Bureau stopped successfully ---")
+    if financial_rag.is_rate_writer:
+        await kg_executor.run(financial_rag.save_snapshot, KG_SNAPSHOT_PATH)
+    kg_executor.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
 class APIRequest(BaseModel):
     query: str
 
+class QuoteBatchRequest(BaseModel):
+    # [from, to, amount] per quote
+    quotes: list[tuple[str, str, float]]
+
 @app.post("/api/send-request")
 async def send_request(request: APIRequest):
     """API endpoint to submit a new task to the financial agent."""
@@ -637,6 +765,39 @@ async def send_request(request: APIRequest):
     )
     return {"status": "request_sent", "request_id": request_id}
 
+@app.get("/api/kg-stats")
+async def get_kg_stats():
+    """API endpoint exposing knowledge-graph size and eviction counters."""
+    return await kg_executor.run(financial_rag.stats)
+
+@app.get("/api/rate-feed")
+async def get_rate_feed_status():
+    """API endpoint exposing rate feed health and freshness."""
+    return rate_feed.status()
+
+@app.get("/api/rate-consistency")
+async def get_rate_consistency(base: str = "USD", tolerance: float = 0.01):
+    """API endpoint listing quoted rates that disagree with their triangulated cross rates."""
+    return await kg_executor.run(financial_rag.inconsistent_rates, base.upper(), tolerance)
+
+@app.get("/api/arbitrage")
+async def get_arbitrage():
+    """API endpoint listing detected arbitrage cycles and the edges quarantined from routing."""
+    return arbitrage_detector.status()
+
+@app.get("/api/chain-costs")
+async def get_chain_costs():
+    """API endpoint exposing per-chain gas prices, gas use and settlement times behind path costs."""
+    return chain_costs.status()
+
+@app.post("/api/quote-batch")
+async def quote_batch(request: QuoteBatchRequest):
+    """API endpoint pricing many conversions at once: output amount, route and fees per quote."""
+    quotes = [(from_currency.upper(), to_currency.upper(), amount) for from_currency, to_currency, amount in request.quotes]
+    # Concurrent requests are priced together in one batch on the KG worker
+    batch = await kg_executor.quote_batch(quotes)
+    return {"rate_version": batch.rate_version, "quotes": batch.as_dicts()}
+
 @app.get("/api/get-response/{request_id}")
 async def get_response(request_id: str):
     """API endpoint to poll for the result of a task."""